@@ -4,12 +4,17 @@ from datetime import datetime, timedelta, timezone
 import jwt
 from fastapi import Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, event, inspect
+from sqlalchemy.orm import Session, object_session
 
 from app.models.users import User as UserModel
-from app.config import SECRET_KEY, ALGORITHM
-from app.db_depends import get_async_db
+from app.config import SECRET_KEY, ALGORITHM, settings
+from app.database import on_commit
+from app.db_depends import get_async_db, get_async_db_read
+from app.schemas import UserSchema
 from app.services.enum import UserRoles
+from app.utils.cache import TTLCache
+from app.utils.executor import BoundedExecutor
 
 # Создаём контекст для хеширования с использованием bcrypt
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -19,6 +24,11 @@ REFRESH_TOKEN_EXPIRE_DAYS = 7         # New
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/token")
 
+# bcrypt занимает десятки миллисекунд CPU, поэтому выполняется в ограниченном пуле потоков, а не в event loop
+password_executor = BoundedExecutor(workers=settings.password_hash_workers,
+                                    max_queue=settings.password_hash_max_queue,
+                                    thread_name_prefix="password-hash")
+
 def hash_password(password: str) -> str:
     """
     Преобразует пароль в хеш с использованием bcrypt.
@@ -33,6 +43,20 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+async def hash_password_async(password: str) -> str:
+    """
+    hash_password в пуле потоков password_executor, не блокируя event loop.
+    """
+    return await password_executor.run(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """
+    verify_password в пуле потоков password_executor, не блокируя event loop.
+    """
+    return await password_executor.run(verify_password, plain_password, hashed_password)
+
+
 def create_access_token(data: dict):
     """
     Создаёт access-токен.
@@ -59,10 +83,49 @@ def create_refresh_token(data: dict):
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme),
-                           db: AsyncSession = Depends(get_async_db)):
+# Кеш активных пользователей для get_current_user: ключ - claim id токена (или sub, если id нет)
+user_cache = TTLCache(maxsize=settings.auth_user_cache_size, ttl=settings.auth_user_cache_ttl, name='auth_users')
+
+
+def invalidate_user(user_id: int | None = None, email: str | None = None) -> None:
+    """
+    Удаляет пользователя из кеша; без аргументов очищает весь кеш.
+    """
+    if user_id is None and email is None:
+        user_cache.clear()
+        return
+    user_cache.invalidate(user_id)
+    user_cache.invalidate(email)
+
+
+# Сброс при flush не закрывает гонку: до коммита параллельный get_current_user ещё читает старую
+# строку (активную, со старой ролью) и снова кладёт её в кеш на весь TTL. Поэтому пользователь
+# сбрасывается и при flush (этот же запрос не увидит старую запись), и после коммита.
+
+@event.listens_for(UserModel, "after_update")
+def _invalidate_updated_user(mapper, connection, target):
+    # Деактивация или смена роли через ORM
+    state = inspect(target)
+    if state.attrs.is_active.history.has_changes() or state.attrs.role.history.has_changes():
+        user_id, email = target.id, target.email
+        invalidate_user(user_id, email)
+        on_commit(object_session(target), lambda: invalidate_user(user_id, email))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _invalidate_bulk_updated_users(orm_execute_state):
+    # Массовые UPDATE/DELETE по users не сообщают, какие строки изменились, поэтому сбрасываем весь кеш
+    if ((orm_execute_state.is_update or orm_execute_state.is_delete)
+            and orm_execute_state.bind_mapper is not None
+            and orm_execute_state.bind_mapper.class_ is UserModel):
+        invalidate_user()
+        on_commit(orm_execute_state.session, invalidate_user)
+
+
+def decode_access_token(token: str) -> dict:
     """
-    Проверяет JWT и возвращает пользователя из базы.
+    Проверяет подпись, срок действия и тип JWT и возвращает его claims.
+    Принимаются только access-токены: refresh-токен годится лишь для /users/refresh-token.
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -72,7 +135,8 @@ async def get_current_user(token: str = Depends(oauth2_scheme),
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
-        if email is None:
+        token_type: str | None = payload.get("token_type")
+        if email is None or token_type != "access":
             raise credentials_exception
     except jwt.ExpiredSignatureError:
         raise HTTPException(
@@ -82,19 +146,88 @@ async def get_current_user(token: str = Depends(oauth2_scheme),
         )
     except jwt.PyJWTError:
         raise credentials_exception
+    return payload
 
-    result = await db.scalars(
-        select(UserModel).where(UserModel.email == email, UserModel.is_active.is_(True)))
-    user = result.first()
-    if user is None:
-        raise credentials_exception
+
+async def _authenticate(token: str, db: AsyncSession):
+    """
+    Проверяет JWT и возвращает снимок пользователя из базы (UserSchema).
+    Сессия чтения ищет по реплике; если пользователь там не найден (например, только что
+    зарегистрировался и реплика отстаёт), запрос повторяется на основной базе.
+    Найденные активные пользователи кешируются в user_cache. Кеш общий для всех запросов,
+    поэтому в нём лежат неизменяемые снимки, а не ORM-объекты, привязанные к чужой сессии.
+    """
+    payload = decode_access_token(token)
+    email: str = payload["sub"]
+    cache_key = payload.get("id") or email
+    user = user_cache.get(cache_key)
+    if user is not None and user.email == email:
+        return user
+
+    stmt = (select(UserModel.id, UserModel.email, UserModel.is_active, UserModel.role)
+            .where(UserModel.email == email, UserModel.is_active.is_(True)))
+    row = (await db.execute(stmt)).first()
+    if row is None and db.info.get("replica") is not None and not db.info.get("use_primary"):
+        db.info["use_primary"] = True
+        row = (await db.execute(stmt)).first()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = UserSchema.model_validate(row)
+    user_cache.set(cache_key, user)
     return user
 
 
-async def get_current_seller(current_user: UserModel = Depends(get_current_user)):
+async def get_current_user(token: str = Depends(oauth2_scheme),
+                           db: AsyncSession = Depends(get_async_db_read)):
+    """
+    Текущий пользователь для обработчиков чтения: поиск идёт по реплике.
+    """
+    return await _authenticate(token, db)
+
+
+async def get_current_user_primary(token: str = Depends(oauth2_scheme),
+                                   db: AsyncSession = Depends(get_async_db, scope="function")):
+    """
+    Текущий пользователь для обработчиков записи: поиск идёт по основной базе,
+    в той же сессии, что и сама запись, - отстающая реплика не должна пропустить
+    деактивированного пользователя или пользователя со снятой ролью.
+    """
+    return await _authenticate(token, db)
+
+
+async def get_current_user_for_role_check(token: str = Depends(oauth2_scheme),
+                                          db: AsyncSession = Depends(get_async_db, scope="function")):
+    """
+    Пользователь для проверок роли. При settings.auth_trust_token_claims собирается
+    из claims подписанного токена без обращения к базе и кешу, иначе - как
+    get_current_user_primary, по основной базе.
+    """
+    if not settings.auth_trust_token_claims:
+        return await _authenticate(token, db)
+
+    payload = decode_access_token(token)
+    if payload.get("id") is None or payload.get("role") is None:
+        return await _authenticate(token, db)
+    return UserSchema.model_construct(id=payload["id"], email=payload["sub"], is_active=True, role=payload["role"])
+
+
+async def get_current_seller(current_user: UserModel = Depends(get_current_user_for_role_check)):
     """
     Проверяет, что пользователь имеет роль 'seller'.
     """
-    if current_user.role != UserRoles.seller:
+    if current_user.role != UserRoles.SELLER:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only sellers can perform this action")
     return current_user
+
+
+async def get_current_admin(current_user: UserModel = Depends(get_current_user_for_role_check)):
+    """
+    Проверяет, что пользователь имеет роль 'admin'.
+    """
+    if current_user.role != UserRoles.ADMIN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only admins can perform this action")
+    return current_user
@@ -0,0 +1,295 @@
+"""
+Проверка планов запросов репозиториев.
+
+Команда выполняет типовые вызовы репозиториев (фильтры и сортировки списка товаров, курсоры,
+ленты отзывов и т.д.) на заполненной базе, перехватывает отправленный SQL вместе с параметрами
+и запускает для каждого запроса EXPLAIN ANALYZE. Все изменения откатываются. Запрос не проходит, если:
+
+- в плане есть Seq Scan;
+- у страницы по курсору условие на первый ключ сортировки не стало условием индекса (Index Cond):
+  индекс тогда читается с начала, а курсор проверяется фильтром - дальние страницы дороже первой;
+- под LIMIT узел чтения таблицы перебрал в READ_RATIO раз больше строк, чем запрос вернул
+  (и больше MIN_READ_ROWS): так выглядят полный проход индекса с Filter (например, частичный индекс,
+  условие которого планировщик не смог доказать) и сортировка всей выборки ради одной страницы.
+
+На маленькой базе планировщик выбирает Seq Scan даже при наличии подходящего индекса, поэтому
+по умолчанию он отключается (enable_seqscan = off): оставшийся Seq Scan значит, что индекса
+под запрос нет вовсе. Отключение не скрывает полный проход индекса - его ловят две другие проверки;
+проверка курсоров работает на базе любого размера, проверка числа строк - на базе с объёмами
+больше MIN_READ_ROWS. На базе с реальными объёмами можно проверить планы как есть: --planner-default.
+
+    python -m app.commands.check_query_plans
+"""
+import argparse
+import asyncio
+import json
+import re
+import sys
+
+from fastapi import HTTPException
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import async_engine
+from app.models import ProductModel, Reviews, User
+from app.repositories.categories import CategoryRepository
+from app.repositories.products import ProductRepository
+from app.repositories.reviews import ReviewRepository
+from app.schemas import SortParams, SortFieldEnum, SortOrderEnum, TotalCountEnum, ReviewsCreate
+from app.services.products import get_list_filters, get_sort_keys, get_order_sorting_list
+from app.services.reviews import get_review_sort_keys
+from app.utils.pagination import Cursor
+from app.utils.products import build_prefix_tsquery
+
+# Допустимое отношение прочитанных узлом строк к возвращённым запросом с LIMIT
+# и число строк, до которого перебор не считается проблемой
+READ_RATIO = 10
+MIN_READ_ROWS = 1000
+
+# Узлы, читающие строки таблицы или индекса
+SCAN_NODES = {'Seq Scan', 'Index Scan', 'Index Only Scan', 'Bitmap Heap Scan'}
+
+
+def product_list_scenarios(ids: dict) -> list:
+    repo = ProductRepository()
+    filter_sets = {
+        'no filters': {},
+        'category_id': {'category_id': ids['category_id']},
+        'price range': {'min_price': 1, 'max_price': 1000},
+        'in_stock': {'in_stock': True},
+        'seller_id': {'seller_id': ids['seller_id']},
+        'category_id + price range': {'category_id': ids['category_id'], 'min_price': 1, 'max_price': 1000},
+    }
+    scenarios = []
+    for filter_name, values in filter_sets.items():
+        filters = get_list_filters(values.get('category_id'), values.get('min_price'), values.get('max_price'),
+                                   values.get('in_stock'), values.get('seller_id'))
+        for field in SortFieldEnum:
+            for order in SortOrderEnum:
+                sort_params = SortParams(field=field, order=order)
+                sort_keys = get_sort_keys(sort_params)
+                label = f'products [{filter_name}] sort={field.value} {order.value}'
+                scenarios.append((f'{label} page',
+                                  lambda db, f=filters, s=sort_params: repo.get_all_active_products(
+                                      db, 1, 20, f, get_order_sorting_list(s), TotalCountEnum.exact)))
+                scenarios.append((f'{label} cursor',
+                                  lambda db, f=filters, k=sort_keys: first_product_cursor_page(repo, db, f, k),
+                                  sort_keys[0][0].key))
+    scenarios.append(('products by category',
+                      lambda db: repo.get_products_by_category_id(db, ids['category_id'], 1, 20,
+                                                                  get_list_filters(None, None, None, None, None),
+                                                                  [ProductModel.id.asc()], TotalCountEnum.exact)))
+    scenarios.append(('products by category with subcategories',
+                      lambda db: repo.get_products_by_category_id(db, ids['category_id'], 1, 20,
+                                                                  get_list_filters(None, None, None, None, None),
+                                                                  [ProductModel.id.asc()], TotalCountEnum.exact,
+                                                                  [ids['category_id']])))
+    scenarios.append(('category facets with subcategories',
+                      lambda db: repo.get_category_facets(db, ids['category_id'],
+                                                          get_list_filters(None, 1, 1000, None, None),
+                                                          {ids['category_id']: ids['category_id']})))
+    scenarios.append(('category facets',
+                      lambda db: repo.get_category_facets(db, ids['category_id'],
+                                                          get_list_filters(None, 1, 1000, None, None))))
+    scenarios.append(('product by id', lambda db: repo.get_product_id(db, ids['product_id'])))
+    scenarios.append(('product by id, fields=name,price',
+                      lambda db: repo.get_product_id(db, ids['product_id'], (ProductModel.id, ProductModel.name,
+                                                                             ProductModel.price))))
+    scenarios.append(('product validators', lambda db: repo.get_product_updated_at(db, ids['product_id'])))
+    scenarios.append(('bulk: active categories', lambda db: repo.get_active_category_ids(db, {ids['category_id']})))
+    scenarios.append(('bulk: products by ids', lambda db: repo.get_products_by_ids(db, {ids['product_id']})))
+    for filter_name, values in filter_sets.items():
+        filters = get_list_filters(values.get('category_id'), values.get('min_price'), values.get('max_price'),
+                                   values.get('in_stock'), values.get('seller_id'))
+        scenarios.append((f'product list validators [{filter_name}]',
+                          lambda db, f=filters: repo.get_list_validators(db, f)))
+        scenarios.append((f'export [{filter_name}]',
+                          lambda db, f=filters: first_export_batch(repo, db, f)))
+    for filter_name, values in filter_sets.items():
+        filters = get_list_filters(values.get('category_id'), values.get('min_price'), values.get('max_price'),
+                                   values.get('in_stock'), values.get('seller_id'))
+        scenarios.append((f'search [{filter_name}]',
+                          lambda db, f=filters: repo.search_products(db, ids['search_query'], 20, f, None,
+                                                                     TotalCountEnum.exact)))
+    return scenarios
+
+
+async def first_product_cursor_page(repo: ProductRepository, db: AsyncSession, filters: list, sort_keys: list):
+    # Курсор строим по первой строке выборки, чтобы в плане было условие keyset-пагинации
+    stmt = select(*(column for column, _ in sort_keys)).where(*filters).limit(1)
+    row = (await db.execute(stmt)).first()
+    if row is not None:
+        await repo.get_active_products_by_cursor(db, 20, filters, sort_keys, Cursor(values=list(row)),
+                                                 TotalCountEnum.none)
+
+
+async def first_export_batch(repo: ProductRepository, db: AsyncSession, filters: list):
+    async for _ in repo.stream_products(db, filters, [ProductModel.id, ProductModel.name]):
+        break
+
+
+def review_scenarios(ids: dict) -> list:
+    repo = ReviewRepository()
+    scenarios = []
+    filter_sets = {
+        'no filters': [],
+        'grade': [Reviews.grade == 5],
+        'user_id': [Reviews.user_id == ids['user_id']],
+    }
+    for filter_name, filters in filter_sets.items():
+        for order in SortOrderEnum:
+            sort_keys = get_review_sort_keys(order)
+            cursor = Cursor(values=[ids['review_date'], ids['review_id']])
+            scenarios.append((f'reviews [{filter_name}] {order.value}',
+                              lambda db, f=filters, k=sort_keys: repo.get_reviews_page(db, f, k, 20)))
+            scenarios.append((f'reviews [{filter_name}] {order.value} cursor',
+                              lambda db, f=filters, k=sort_keys, c=cursor: repo.get_reviews_page(db, f, k, 20, c),
+                              sort_keys[0][0].key))
+            scenarios.append((f'product reviews [{filter_name}] {order.value}',
+                              lambda db, f=filters, k=sort_keys: repo.get_product_reviews_page(
+                                  db, ids['product_id'], f, k, 20)))
+    scenarios.append(('create review', lambda db: create_review(repo, db, ids)))
+    return scenarios
+
+
+async def create_review(repo: ReviewRepository, db: AsyncSession, ids: dict):
+    user = await db.get(User, ids['user_id'])
+    await repo.create_review(db, ReviewsCreate(comment='plan check', grade=5, product_id=ids['product_id']), user)
+
+
+def category_scenarios(ids: dict) -> list:
+    repo = CategoryRepository()
+    return [('categories', lambda db: repo.get_all_active_categories(db)),
+            ('category tree', lambda db: repo.get_category_tree(db)),
+            ('categories version', lambda db: repo.get_categories_version(db))]
+
+
+async def load_ids(db: AsyncSession) -> dict:
+    product = (await db.execute(select(ProductModel).where(ProductModel.is_active.is_(True)).limit(1))).scalar()
+    review = (await db.execute(select(Reviews).where(Reviews.is_active.is_(True)).limit(1))).scalar()
+    if product is None or review is None:
+        sys.exit('The database must contain at least one active product and one active review')
+    return {
+        'product_id': product.id,
+        'search_query': build_prefix_tsquery(product.name) or 'a:*',
+        'category_id': product.category_id,
+        'seller_id': product.seller_id,
+        'user_id': review.user_id,
+        'review_id': review.id,
+        'review_date': review.comment_date,
+    }
+
+
+def plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def rows_read(node: dict) -> int:
+    """
+    Сколько строк перебрал узел чтения за все циклы, включая отброшенные фильтром.
+    """
+    per_loop = (node.get('Actual Rows', 0) + node.get('Rows Removed by Filter', 0)
+                + node.get('Rows Removed by Index Recheck', 0))
+    return per_loop * node.get('Actual Loops', 1)
+
+
+def plan_problems(nodes: list, seek_column: str | None) -> list[str]:
+    problems = []
+    seq_scans = [node['Relation Name'] for node in nodes if node['Node Type'] == 'Seq Scan']
+    if seq_scans:
+        problems.append(f'Seq Scan on {", ".join(seq_scans)}')
+
+    if seek_column is not None:
+        # Колонка с необязательным префиксом таблицы: products.price, но не category_id для id
+        column = re.compile(rf'(?<!\w)(?:\w+\.)?{seek_column}\b')
+        if not any(column.search(node['Index Cond']) for node in nodes if 'Index Cond' in node):
+            problems.append(f'cursor condition on {seek_column} is not an Index Cond')
+
+    limits = [node for node in nodes if node['Node Type'] == 'Limit']
+    if limits:
+        returned = max(limits[0].get('Actual Rows', 0), 1)
+        for node in nodes:
+            read = rows_read(node)
+            if node['Node Type'] in SCAN_NODES and read > max(returned * READ_RATIO, MIN_READ_ROWS):
+                problems.append(f'{node["Node Type"]} on {node.get("Relation Name")} read {read} rows '
+                                f'for {returned} returned')
+    return problems
+
+
+async def check(planner_default: bool, verbose: bool) -> int:
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    failures = 0
+    async with async_engine.connect() as connection:
+        session = AsyncSession(bind=connection, expire_on_commit=False)
+        ids = await load_ids(session)
+
+        statements = []
+        for name, scenario, *seek in product_list_scenarios(ids) + review_scenarios(ids) + category_scenarios(ids):
+            captured.clear()
+            event.listen(async_engine.sync_engine, 'before_cursor_execute', capture)
+            savepoint = await session.begin_nested()
+            try:
+                await scenario(session)
+            except HTTPException:
+                pass
+            finally:
+                event.remove(async_engine.sync_engine, 'before_cursor_execute', capture)
+                await savepoint.rollback()
+            # EXPLAIN самих оценок количества (total_mode=estimated) проверять не нужно
+            # Курсорное условие ищется только в запросе страницы: в нём есть LIMIT
+            statements.extend((name, sql, params, seek[0] if seek and 'LIMIT' in sql.upper() else None)
+                              for sql, params in captured
+                              if not sql.lstrip().upper().startswith(('EXPLAIN', 'SAVEPOINT', 'RELEASE', 'ROLLBACK')))
+
+        if not planner_default:
+            await connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+
+        seen = set()
+        for name, sql, params, seek_column in statements:
+            key = (sql, repr(params))
+            if key in seen:
+                continue
+            seen.add(key)
+            savepoint = await connection.begin_nested()
+            try:
+                result = await connection.exec_driver_sql(f'EXPLAIN (ANALYZE, FORMAT JSON) {sql}', params)
+                plan = result.scalar()
+            finally:
+                # ANALYZE выполняет запрос: изменения (создание отзыва) не должны влиять на следующие
+                await savepoint.rollback()
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            nodes = list(plan_nodes(plan[0]['Plan']))
+            problems = plan_problems(nodes, seek_column)
+            indexes = sorted({node['Index Name'] for node in nodes if 'Index Name' in node})
+            if problems:
+                failures += 1
+                print(f'FAIL {name}: {"; ".join(problems)}')
+                print(f'     {" ".join(sql.split())}')
+            elif verbose:
+                print(f'ok   {name}: {", ".join(indexes) or "no table access"}')
+
+        await connection.rollback()
+
+    print(f'{len(seen)} statements checked, {failures} failed')
+    return failures
+
+
+async def main(planner_default: bool, verbose: bool) -> int:
+    try:
+        return await check(planner_default, verbose)
+    finally:
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--planner-default", action="store_true", help="Не отключать Seq Scan в планировщике")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Печатать индексы и для успешных запросов")
+    args = parser.parse_args()
+    sys.exit(1 if asyncio.run(main(args.planner_default, args.verbose)) else 0)
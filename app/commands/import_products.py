@@ -0,0 +1,57 @@
+"""
+Импорт каталога продавца из CSV-файла: то же, что POST /products/import, но без загрузки файла через HTTP.
+
+Колонки CSV: sku, name, price, stock, category_id и необязательные description, image_url.
+Товары с уже известным продавцу артикулом обновляются. Импорт выполняется одной транзакцией:
+при ошибке в базе ничего не меняется. Печатает скорость импорта и отклонённые строки.
+
+    python -m app.commands.import_products feed.csv --seller-id 42
+"""
+import argparse
+import asyncio
+import sys
+
+from fastapi import HTTPException
+
+from app.database import async_engine, async_session_maker
+from app.models import User
+from app.services.enum import UserRoles
+from app.services.product_import import import_products_csv
+
+
+async def run(path: str, seller_id: int, show_rejects: int) -> int:
+    async with async_session_maker() as db:
+        seller = await db.get(User, seller_id)
+        if seller is None or seller.role != UserRoles.SELLER:
+            print(f'User {seller_id} is not a seller', file=sys.stderr)
+            return 1
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as file:
+                report, _ = await import_products_csv(db, file, seller_id)
+        except HTTPException as e:
+            print(e.detail, file=sys.stderr)
+            return 1
+        await db.commit()
+
+    print(f"{report['rows']} rows in {report['seconds']:.2f}s ({report['rows_per_second']:.0f} rows/s): "
+          f"{report['inserted']} inserted, {report['updated']} updated, {report['unchanged']} unchanged, "
+          f"{report['duplicates']} duplicate SKUs, {report['rejected']} rejected")
+    for reject in report['rejects'][:show_rejects]:
+        print(f"  line {reject['line']}: {reject['detail']}")
+    return 0
+
+
+async def main(path: str, seller_id: int, show_rejects: int) -> int:
+    try:
+        return await run(path, seller_id, show_rejects)
+    finally:
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="CSV-файл в UTF-8")
+    parser.add_argument("--seller-id", type=int, required=True, help="ID продавца, которому принадлежат товары")
+    parser.add_argument("--show-rejects", type=int, default=20, help="Сколько отклонённых строк напечатать")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.path, args.seller_id, args.show_rejects)))
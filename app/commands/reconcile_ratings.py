@@ -0,0 +1,51 @@
+"""
+Пересчёт агрегатов рейтинга товаров (rating_sum, rating_count, rating) по активным отзывам.
+
+Агрегаты поддерживаются инкрементально при создании и удалении отзывов; команда нужна после
+ручных правок таблицы reviews или массовых операций в обход API. Товары обрабатываются
+диапазонами id, каждый диапазон - отдельная короткая транзакция.
+
+    python -m app.commands.reconcile_ratings --batch-size 10000
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import select, func
+
+from app.database import async_engine, async_session_maker
+from app.models import ProductModel
+from app.repositories.reviews import ReviewRepository
+
+
+async def reconcile(batch_size: int) -> None:
+    repo = ReviewRepository()
+    started = time.perf_counter()
+    fixed = 0
+
+    async with async_session_maker() as session:
+        max_id = await session.scalar(select(func.max(ProductModel.id))) or 0
+
+    for first_id in range(1, max_id + 1, batch_size):
+        last_id = first_id + batch_size - 1
+        async with async_session_maker() as session:
+            batch_fixed = await repo.rebuild_product_ratings(session, first_id, last_id)
+            await session.commit()
+        fixed += batch_fixed
+        print(f"products {first_id}-{min(last_id, max_id)}: fixed {batch_fixed}")
+
+    print(f"Done in {time.perf_counter() - started:.1f}s, fixed {fixed} products")
+
+
+async def main(batch_size: int) -> None:
+    try:
+        await reconcile(batch_size)
+    finally:
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=10000, help="Сколько id товаров пересчитывать за транзакцию")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size))
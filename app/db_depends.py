@@ -2,7 +2,7 @@ from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.database import async_session_maker
+from app.database import async_session_maker, async_read_session_maker, replicas
 from contextlib import asynccontextmanager
 import logging
 
@@ -12,6 +12,15 @@ async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
     """
     Предоставляет асинхронную сессию SQLAlchemy для работы с базой данных.
     Автоматически управляет транзакциями и закрытием сессии.
+
+    Сессия - единица работы (unit of work) запроса: репозитории только отправляют
+    изменения в базу (flush, INSERT/UPDATE ... RETURNING) и никогда не коммитят сами,
+    а коммит выполняется ровно один раз здесь, после успешной обработки запроса.
+
+    Обработчики записи подключают зависимость как Depends(get_async_db, scope="function"):
+    тогда коммит выполняется до отправки ответа, и клиент не получает 2xx для
+    транзакции, которая потом откатится. Без scope FastAPI закрывает yield-зависимость
+    уже после отправки ответа.
     """
 
     async with async_session_maker() as session:
@@ -30,6 +39,27 @@ async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
             logger.debug("Database session closed")
 
 
+async def get_async_db_read() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Предоставляет сессию для обработчиков чтения: SELECT выполняются на реплике,
+    а после первой записи в рамках запроса - на основной базе.
+    Если реплики не настроены или недоступны, сессия работает с основной базой.
+    """
+
+    async with async_read_session_maker() as session:
+        session.info["replica"] = await replicas.choose()
+        try:
+            logger.debug("Read session created")
+            yield session
+            await session.commit()
+        except Exception as e:
+            logger.error(f"Error during database operation: {e}")
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+            logger.debug("Read session closed")
+
 
 @asynccontextmanager
 async def get_session_manager_commit():
@@ -37,5 +67,15 @@ async def get_session_manager_commit():
         yield session
 
 
+@asynccontextmanager
+async def get_read_session_manager():
+    """
+    Сессия чтения вне зависимостей FastAPI - например, внутри генератора потокового ответа,
+    который продолжает читать базу после выхода из обработчика.
+    """
+    async for session in get_async_db_read():
+        yield session
+
+
 
 
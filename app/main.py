@@ -1,23 +1,106 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
+from app.auth import password_executor
+from app.config import settings
+from app.database import async_engine, replicas, warm_up_pool
+from app.metrics import event_loop_lag_seconds
+from app.profiling import is_admin_request, profiler
+from app.response_cache import response_cache
 from app.routers import categories
+from app.routers import metrics
+from app.routers import profiling
 from app.routers import products
 from app.routers import users
 from app.routers import reviews
+from app.services.autocomplete import refresh_product_name_index, refresh_product_name_index_periodically
+from app.utils.metrics import MetricsMiddleware, monitor_event_loop_lag
+from app.utils.profiling import ProfilingMiddleware
+from app.utils.query_stats import QueryStatsMiddleware
+from app.utils.response_cache import ResponseCacheMiddleware
 import uvicorn
 
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Прогревает пул соединений, загружает индекс подсказок и запускает замер задержки event loop при старте,
+    закрывает пулы основной базы и реплик и хранилище кеша ответов и дописывает профили при остановке.
+    """
+    if settings.db_pool_warmup:
+        await warm_up_pool()
+    try:
+        await refresh_product_name_index()
+    except Exception as e:
+        logger.warning(f"Autocomplete index was not loaded at startup: {e}")
+    refresher = None
+    if settings.autocomplete_refresh_interval:
+        refresher = asyncio.create_task(
+            refresh_product_name_index_periodically(settings.autocomplete_refresh_interval))
+    lag_monitor = None
+    if settings.metrics_enabled:
+        lag_monitor = asyncio.create_task(
+            monitor_event_loop_lag(event_loop_lag_seconds, settings.metrics_loop_lag_interval))
+    yield
+    if refresher is not None:
+        refresher.cancel()
+    if lag_monitor is not None:
+        lag_monitor.cancel()
+    password_executor.shutdown()
+    profiler.close()
+    await response_cache.close()
+    await async_engine.dispose()
+    for engine in replicas.engines:
+        await engine.dispose()
+
 
 # Создаём приложение FastAPI
 app = FastAPI(
     title="FastAPI Интернет-магазин",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
+# Кеш ответов публичных чтений товаров: карточка, общий список и список категории
+if settings.response_cache_enabled:
+    app.add_middleware(ResponseCacheMiddleware,
+                       cache=response_cache,
+                       paths=[r"/products/", r"/products/\d+", r"/products/category/\d+"])
+
+# Запросы к базе каждого HTTP-запроса: Server-Timing и строка лога. Middleware выполняются в обратном
+# порядке добавления; этот добавлен после кеша ответов и стоит снаружи него: ответы из кеша тоже
+# попадают в лог (с нулём запросов)
+if settings.db_query_stats_enabled:
+    app.add_middleware(QueryStatsMiddleware)
+
+# Метрики HTTP-запросов по шаблонам маршрутов; снаружи кеша ответов и статистики запросов - время
+# включает их. Внутри профилирования, если оно включено
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+
+# Профилирование выбранных запросов; добавлено последним и поэтому самое внешнее, чтобы время
+# остальных middleware тоже попадало в профиль
+if settings.profiling_enabled:
+    app.add_middleware(ProfilingMiddleware,
+                       profiler=profiler,
+                       sample_rate=settings.profiling_sample_rate,
+                       header=settings.profiling_header,
+                       authorize=is_admin_request)
+
 # Подключаем маршруты
 app.include_router(categories.router)
 app.include_router(products.router)
 app.include_router(users.router)
 app.include_router(reviews.router)
+if settings.metrics_enabled:
+    app.include_router(metrics.router)
+if settings.profiling_enabled:
+    app.include_router(profiling.router)
 
 
 # Корневой эндпоинт для проверки
@@ -0,0 +1,56 @@
+import secrets
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from app.config import settings
+from app.response_cache import response_cache
+from app.utils.cache import ttl_cache_stats
+from app.utils.metrics import Counter, Gauge, registry
+from app.utils.single_flight import single_flight_stats
+
+# Задержка event loop (см. monitor_event_loop_lag), замеряется фоновой задачей приложения
+event_loop_lag_seconds = registry.histogram('event_loop_lag_seconds', 'Event loop wake-up delay',
+                                            buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+
+
+def _cache_metrics() -> list[Counter | Gauge]:
+    hits = Counter('cache_hits_total', 'Cache hits', ('cache',))
+    misses = Counter('cache_misses_total', 'Cache misses', ('cache',))
+    hit_ratio = Gauge('cache_hit_ratio', 'Cache hits to lookups since start', ('cache',))
+    caches = {'response': {'hits': response_cache.hits, 'misses': response_cache.misses}, **ttl_cache_stats()}
+    for name, stats in caches.items():
+        lookups = stats['hits'] + stats['misses']
+        hits.set((name,), stats['hits'])
+        misses.set((name,), stats['misses'])
+        hit_ratio.set((name,), stats['hits'] / lookups if lookups else 0.0)
+
+    calls = Counter('single_flight_calls_total', 'Reads executed by single-flight groups', ('group',))
+    coalesced = Counter('single_flight_coalesced_total', 'Reads that joined an in-flight identical read',
+                        ('group',))
+    coalesced_ratio = Gauge('single_flight_coalesced_ratio', 'Coalesced reads to all reads since start',
+                            ('group',))
+    for name, stats in single_flight_stats().items():
+        calls.set((name,), stats['calls'])
+        coalesced.set((name,), stats['coalesced'])
+        coalesced_ratio.set((name,), stats['coalesced_ratio'])
+    return [hits, misses, hit_ratio, calls, coalesced, coalesced_ratio]
+
+
+registry.add_collector(_cache_metrics)
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+async def verify_metrics_token(credentials: HTTPAuthorizationCredentials | None = Depends(_bearer)) -> None:
+    """
+    Проверяет токен сборщика метрик (Authorization: Bearer <METRICS_TOKEN>). Пока токен не задан
+    в настройках, метрики не отдаются никому: в них шаблоны маршрутов, размеры пулов и статистика кешей.
+    """
+    if (not settings.metrics_token or credentials is None
+            or not secrets.compare_digest(credentials.credentials.encode(), settings.metrics_token.encode())):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
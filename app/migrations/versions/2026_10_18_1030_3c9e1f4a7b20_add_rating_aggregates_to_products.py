@@ -0,0 +1,47 @@
+"""add rating_sum and rating_count to products
+
+Revision ID: 3c9e1f4a7b20
+Revises: f8bf6cdb92ed
+Create Date: 2026-10-18 10:30:12.418305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9e1f4a7b20'
+down_revision: Union[str, Sequence[str], None] = 'f8bf6cdb92ed'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('products', sa.Column('rating_sum', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.add_column('products', sa.Column('rating_count', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    # Заполняем агрегаты по уже существующим активным отзывам
+    op.execute("""
+        UPDATE products AS p
+        SET rating_sum = agg.rating_sum,
+            rating_count = agg.rating_count,
+            rating = agg.rating
+        FROM (
+            SELECT product_id,
+                   sum(grade) AS rating_sum,
+                   count(*) AS rating_count,
+                   avg(grade)::float AS rating
+            FROM reviews
+            WHERE is_active
+            GROUP BY product_id
+        ) AS agg
+        WHERE p.id = agg.product_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('products', 'rating_count')
+    op.drop_column('products', 'rating_sum')
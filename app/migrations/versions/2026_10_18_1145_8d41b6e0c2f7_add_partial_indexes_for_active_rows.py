@@ -0,0 +1,48 @@
+"""add partial indexes for active products and reviews
+
+Revision ID: 8d41b6e0c2f7
+Revises: 3c9e1f4a7b20
+Create Date: 2026-10-18 11:45:37.902114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d41b6e0c2f7'
+down_revision: Union[str, Sequence[str], None] = '3c9e1f4a7b20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_products_active_category_id', 'products', ['category_id', 'id']),
+    ('ix_products_active_category_price', 'products', ['category_id', 'price', 'id']),
+    ('ix_products_active_seller_id', 'products', ['seller_id', 'id']),
+    ('ix_products_active_price', 'products', ['price', 'id']),
+    ('ix_products_active_name', 'products', ['name', 'id']),
+    ('ix_products_active_created_at', 'products', ['created_at', 'id']),
+    ('ix_products_active_updated_at', 'products', ['updated_at', 'id']),
+    ('ix_reviews_active_product_date', 'reviews', ['product_id', 'comment_date', 'id']),
+    ('ix_reviews_active_product_user', 'reviews', ['product_id', 'user_id']),
+    ('ix_reviews_active_user_date', 'reviews', ['user_id', 'comment_date', 'id']),
+    ('ix_reviews_active_date', 'reviews', ['comment_date', 'id']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CREATE INDEX CONCURRENTLY не блокирует запись в таблицы, но не может выполняться в транзакции
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_where=sa.text('is_active'),
+                            postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,43 @@
+"""add products search_vector with gin index
+
+Revision ID: b5e2a9d14c63
+Revises: 8d41b6e0c2f7
+Create Date: 2026-10-18 13:20:05.611274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e2a9d14c63'
+down_revision: Union[str, Sequence[str], None] = '8d41b6e0c2f7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Сохраняемый вычисляемый столбец: таблица products перезаписывается целиком
+    op.add_column('products', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed("setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+                    "setweight(to_tsvector('russian', coalesce(description, '')), 'B')", persisted=True),
+        nullable=False,
+    ))
+    with op.get_context().autocommit_block():
+        op.create_index('ix_products_active_search_vector', 'products', ['search_vector'],
+                        postgresql_using='gin', postgresql_where=sa.text('is_active'),
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_products_active_search_vector', table_name='products',
+                      postgresql_concurrently=True, if_exists=True)
+    op.drop_column('products', 'search_vector')
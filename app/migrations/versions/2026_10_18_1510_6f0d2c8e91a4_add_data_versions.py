@@ -0,0 +1,34 @@
+"""add data_versions with categories counter
+
+Revision ID: 6f0d2c8e91a4
+Revises: b5e2a9d14c63
+Create Date: 2026-10-18 15:10:41.207583
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6f0d2c8e91a4'
+down_revision: Union[str, Sequence[str], None] = 'b5e2a9d14c63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('data_versions',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.execute("INSERT INTO data_versions (name) VALUES ('categories')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('data_versions')
@@ -0,0 +1,36 @@
+"""add products sku with unique (seller_id, sku) index
+
+Revision ID: 9a7c4e2b5d13
+Revises: 6f0d2c8e91a4
+Create Date: 2026-10-18 17:20:12.408391
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a7c4e2b5d13'
+down_revision: Union[str, Sequence[str], None] = '6f0d2c8e91a4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Столбец без значения по умолчанию добавляется без перезаписи таблицы
+    op.add_column('products', sa.Column('sku', sa.String(length=64), nullable=True))
+    # Индекс - цель ON CONFLICT (seller_id, sku) импорта; товары без артикула (NULL) не конфликтуют
+    with op.get_context().autocommit_block():
+        op.create_index('uq_products_seller_sku', 'products', ['seller_id', 'sku'], unique=True,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('uq_products_seller_sku', table_name='products',
+                      postgresql_concurrently=True, if_exists=True)
+    op.drop_column('products', 'sku')
@@ -3,5 +3,6 @@ from app.models.users import User
 from app.models.products import ProductModel
 from app.models.reviews import Reviews
 from app.models.categories import CategoryModel
+from app.models.data_versions import DataVersion
 
-__all__ = ['Base', 'User', 'ProductModel', 'Reviews', 'CategoryModel']
+__all__ = ['Base', 'User', 'ProductModel', 'Reviews', 'CategoryModel', 'DataVersion']
@@ -0,0 +1,20 @@
+from datetime import datetime
+
+from sqlalchemy import String, BigInteger, DateTime, func, text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.database import Base
+
+
+class DataVersion(Base):
+    """
+    Счётчик версий наборов данных без собственного updated_at (например, справочника категорий).
+    Увеличивается в той же транзакции, что и изменение данных, поэтому новая версия видна
+    всем воркерам одновременно с самими изменениями.
+    """
+    __tablename__ = 'data_versions'
+
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    version: Mapped[int] = mapped_column(BigInteger, default=0, server_default=text('0'), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(),
+                                                 onupdate=func.now(), nullable=False)
@@ -1,12 +1,32 @@
-from sqlalchemy import String, Numeric, ForeignKey, DateTime, func
+from sqlalchemy import String, Numeric, ForeignKey, DateTime, Index, Computed, func
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from decimal import Decimal
 from app.database import Base
 from sqlalchemy import text
 from datetime import datetime
 
+# Конфигурация полнотекстового поиска: русская морфология, латинские слова - английская
+SEARCH_CONFIG = 'russian'
+
+
 class ProductModel(Base):
     __tablename__ = 'products'
+    # Частичные индексы под фильтры и сортировки списка товаров: запросы всегда читают только
+    # активные товары, а id в конце каждого индекса - ключ-тайбрейкер keyset-пагинации
+    __table_args__ = (
+        Index('ix_products_active_category_id', 'category_id', 'id', postgresql_where=text('is_active')),
+        Index('ix_products_active_category_price', 'category_id', 'price', 'id', postgresql_where=text('is_active')),
+        Index('ix_products_active_seller_id', 'seller_id', 'id', postgresql_where=text('is_active')),
+        Index('ix_products_active_price', 'price', 'id', postgresql_where=text('is_active')),
+        Index('ix_products_active_name', 'name', 'id', postgresql_where=text('is_active')),
+        Index('ix_products_active_created_at', 'created_at', 'id', postgresql_where=text('is_active')),
+        Index('ix_products_active_updated_at', 'updated_at', 'id', postgresql_where=text('is_active')),
+        Index('ix_products_active_search_vector', 'search_vector', postgresql_using='gin',
+              postgresql_where=text('is_active')),
+        # Артикул уникален в пределах продавца: по нему импорт обновляет уже загруженные товары
+        Index('uq_products_seller_sku', 'seller_id', 'sku', unique=True),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(100), nullable=False)
@@ -14,11 +34,25 @@ class ProductModel(Base):
     price: Mapped[Decimal] = mapped_column(Numeric(10, 2), nullable=False)
     image_url: Mapped[str | None] = mapped_column(String(200), nullable=True)
     stock: Mapped[int] = mapped_column(nullable=False)
+    # Артикул продавца (SKU) из его каталога; у товаров, созданных через API, может отсутствовать
+    sku: Mapped[str | None] = mapped_column(String(64), nullable=True)
     is_active: Mapped[bool] = mapped_column(default=True, nullable=False)
     rating: Mapped[float] = mapped_column(default=0.0, server_default=text('0'), nullable=False)
+    # Агрегаты активных отзывов: обновляются тем же запросом, что создаёт или удаляет отзыв,
+    # rating = rating_sum / rating_count хранится готовым для фильтров и сортировки
+    rating_sum: Mapped[int] = mapped_column(default=0, server_default=text('0'), nullable=False)
+    rating_count: Mapped[int] = mapped_column(default=0, server_default=text('0'), nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(),
                                                  onupdate=func.now(), nullable=False)
+    # Поисковый вектор вычисляется самой базой из названия (вес A) и описания (вес B).
+    # deferred - обычные выборки товаров его не читают
+    search_vector: Mapped[str] = mapped_column(
+        TSVECTOR,
+        Computed(f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(name, '')), 'A') || "
+                 f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(description, '')), 'B')", persisted=True),
+        deferred=True,
+    )
 
     seller_id: Mapped[int] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     seller: Mapped['User'] = relationship('User', back_populates='products')
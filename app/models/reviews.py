@@ -1,7 +1,7 @@
 from datetime import datetime
 from enum import Enum as PyEnum
 
-from sqlalchemy import String, ForeignKey, DateTime, func, Integer
+from sqlalchemy import String, ForeignKey, DateTime, Index, func, Integer, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.database import Base
@@ -17,6 +17,14 @@ class GradeEnum(int, PyEnum):
 
 class Reviews(Base):
     __tablename__ = 'reviews'
+    # Частичные индексы по активным отзывам: ленты отзывов (товара, автора и общая) и проверка
+    # "пользователь уже оставил отзыв на товар"
+    __table_args__ = (
+        Index('ix_reviews_active_product_date', 'product_id', 'comment_date', 'id', postgresql_where=text('is_active')),
+        Index('ix_reviews_active_product_user', 'product_id', 'user_id', postgresql_where=text('is_active')),
+        Index('ix_reviews_active_user_date', 'user_id', 'comment_date', 'id', postgresql_where=text('is_active')),
+        Index('ix_reviews_active_date', 'comment_date', 'id', postgresql_where=text('is_active')),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     comment: Mapped[str | None] = mapped_column(String(500), nullable=True)
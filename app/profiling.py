@@ -0,0 +1,27 @@
+from fastapi import HTTPException
+
+from app.auth import decode_access_token
+from app.config import settings
+from app.services.enum import UserRoles
+from app.utils.profiling import SamplingProfiler
+
+# Профайлер запросов воркера (см. ProfilingMiddleware); файлы всех воркеров - в общем каталоге
+profiler = SamplingProfiler(settings.profiling_dir, settings.profiling_interval_ms / 1000)
+
+
+def is_admin_request(scope: dict) -> bool:
+    """
+    Разрешает профилирование по заголовку только администраторам: роль берётся из claims
+    подписанного токена (Authorization: Bearer), без обращения к базе.
+    """
+    for name, value in scope['headers']:
+        if name == b'authorization':
+            scheme, _, token = value.decode('latin-1').partition(' ')
+            if scheme.lower() != 'bearer':
+                return False
+            try:
+                payload = decode_access_token(token)
+            except HTTPException:
+                return False
+            return payload.get('role') == UserRoles.ADMIN
+    return False
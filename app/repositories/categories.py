@@ -1,10 +1,21 @@
+from datetime import datetime
+
 from fastapi import status, HTTPException
-from sqlalchemy import select, update, insert
+from sqlalchemy import select, update, insert, func
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
-from app.models import ProductModel, CategoryModel, User
+from app.models import ProductModel, CategoryModel, User, DataVersion
 from app.repositories.common import CommonRepository
+from app.response_cache import invalidate_categories_after_commit
 from app.schemas import ProductCreate, CategoryCreate
+from app.utils.category_tree import CategoryTreeCache, CategoryTreeSnapshot
+
+# Снимок дерева активных категорий (один на воркер), перестраивается при смене версии категорий
+category_tree = CategoryTreeCache()
+# Имя счётчика версий справочника категорий в data_versions
+CATEGORIES_VERSION = 'categories'
 
 
 class CategoryRepository(CommonRepository):
@@ -16,6 +27,46 @@ class CategoryRepository(CommonRepository):
         categories = result.scalars().all()
         return categories
 
+    async def get_categories_version(self, db: AsyncSession) -> tuple[int, datetime | None]:
+        """
+        Возвращает версию справочника категорий и время её последнего изменения.
+        """
+        stmt = select(DataVersion.version, DataVersion.updated_at).where(DataVersion.name == CATEGORIES_VERSION)
+        row = (await db.execute(stmt)).first()
+        return (row.version, row.updated_at) if row is not None else (0, None)
+
+    async def _bump_categories_version(self, db: AsyncSession) -> None:
+        # Увеличиваем версию в транзакции изменения: читатели увидят её вместе с самими изменениями
+        stmt = postgresql.insert(DataVersion).values(name=CATEGORIES_VERSION, version=1)
+        stmt = stmt.on_conflict_do_update(index_elements=[DataVersion.name],
+                                          set_={'version': DataVersion.version + 1, 'updated_at': func.now()})
+        await db.execute(stmt)
+
+    async def get_category_tree(self, db: AsyncSession) -> CategoryTreeSnapshot:
+        """
+        Возвращает снимок дерева активных категорий, перестраивая его, если категории менялись:
+        каждый вызов сверяет снимок с версией категорий (запрос по первичному ключу data_versions).
+        """
+        version, _ = await self.get_categories_version(db)
+        return await category_tree.get(version, lambda: self._get_category_tree_rows(db))
+
+    async def _get_category_tree_rows(self, db: AsyncSession) -> list[tuple[int, str, int | None]]:
+        # Один рекурсивный запрос от корней вниз: в дерево попадают только категории, у которых
+        # активны все предки, а категории, зацикленные через parent_id, от корня недостижимы
+        child = aliased(self.model)
+        tree = (
+            select(self.model.id, self.model.name, self.model.parent_id)
+            .where(self.model.parent_id.is_(None), self.model.is_active.is_(True))
+            .cte('tree', recursive=True)
+        )
+        tree = tree.union_all(
+            select(child.id, child.name, child.parent_id)
+            .join(tree, child.parent_id == tree.c.id)
+            .where(child.is_active.is_(True))
+        )
+        result = await db.execute(select(tree.c.id, tree.c.name, tree.c.parent_id))
+        return [tuple(row) for row in result.all()]
+
     async def create_category(self, db: AsyncSession, category):
         # Проверка существования parent_id, если указан
 
@@ -27,11 +78,11 @@ class CategoryRepository(CommonRepository):
             if parent is None:
                 raise HTTPException(status_code=400, detail="Parent category not found")
 
-        # Создание новой категории
-        db_category = self.model(**category.model_dump(), is_active=True)
-        db.add(db_category)
-        await db.commit()
-        await db.refresh(db_category)
+        # Создание новой категории: INSERT ... RETURNING вместо refresh, коммит - в get_async_db
+        stmt = insert(self.model).values(**category.model_dump(), is_active=True).returning(self.model)
+        db_category = await db.scalar(stmt)
+        await self._bump_categories_version(db)
+        invalidate_categories_after_commit(db)
         return db_category
 
     async def update_category(self,
@@ -63,7 +114,8 @@ class CategoryRepository(CommonRepository):
         stmt = update(self.model).where(self.model.id == category_id).values(**update_data).returning(self.model)
         result = await db.execute(stmt)
         category = result.scalar_one()
-        await db.commit()
+        await self._bump_categories_version(db)
+        invalidate_categories_after_commit(db)
         return category
 
     async def delete_category(self,
@@ -81,4 +133,5 @@ class CategoryRepository(CommonRepository):
         # Мягкое удаление категории
         stmt = update(self.model).where(self.model.id == category_id).values(is_active=False)
         await db.execute(stmt)
-        await db.commit()
+        await self._bump_categories_version(db)
+        invalidate_categories_after_commit(db)
@@ -1,12 +1,76 @@
+import json
+from datetime import datetime
+from typing import AsyncIterator
+
 from fastapi import status, HTTPException
-from sqlalchemy import select, func
-from sqlalchemy import update
+from sqlalchemy import select, func, text, insert, literal, any_, Float, Integer, Numeric, or_, tuple_
+from sqlalchemy import update, Table, MetaData, Column, String, Boolean, and_, exists, literal_column
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models import ProductModel, CategoryModel, User
+from app.config import settings
+from app.models import ProductModel, CategoryModel, User, DataVersion
+from app.models.products import SEARCH_CONFIG
 from app.repositories.common import CommonRepository
-from app.schemas import ProductCreate
+from app.response_cache import invalidate_product_after_commit, invalidate_products_after_commit
+from app.schemas import ProductCreate, TotalCountEnum
+from app.utils.cache import TTLCache
 from app.utils.common import _correct_page
+from app.utils.pagination import Cursor, decode_cursor, keyset_condition, keyset_order, page_cursors
+from app.utils.single_flight import single_flight
+
+# Оценки количества товаров по сигнатуре фильтров (общие для всех запросов воркера)
+_estimated_counts = TTLCache(maxsize=1024, ttl=settings.estimated_count_ttl, name='estimated_counts')
+# Фасеты списка товаров категории по сигнатуре фильтров
+_facets_cache = TTLCache(maxsize=1024, ttl=settings.facets_cache_ttl, name='facets')
+# Имя счётчика версий товаров в data_versions: меняется только когда товар может выпасть из отфильтрованных
+# списков (удаление, смена категории или цены, переход остатка через ноль, импорт). Добавление и прочие
+# изменения сдвигают updated_at, поэтому обычная запись не обновляет общую для всех строку счётчика
+PRODUCTS_VERSION = 'products'
+
+# Промежуточная таблица CSV-импорта: временная, удаляется при коммите транзакции импорта.
+# Своя MetaData - таблица не попадает в схему базы и миграции
+product_import = Table(
+    'product_import', MetaData(),
+    Column('line', Integer, nullable=False),
+    Column('sku', String(64), nullable=False),
+    Column('name', String(100), nullable=False),
+    Column('description', String(500)),
+    Column('price', Numeric(10, 2), nullable=False),
+    Column('image_url', String(200)),
+    Column('stock', Integer, nullable=False),
+    Column('category_id', Integer, nullable=False),
+    prefixes=['TEMPORARY'],
+    postgresql_on_commit='DROP',
+)
+PRODUCT_IMPORT_COLUMNS = tuple(column.name for column in product_import.columns)
+# Поля товара, которые импорт заполняет из CSV
+_IMPORTED_FIELDS = PRODUCT_IMPORT_COLUMNS[1:]
+
+
+def category_condition(category_id: int, category_ids: list[int] | None = None):
+    """
+    Условие на категорию товара: одна категория или, если передан список, любая из category_ids.
+    Список передаётся одним параметром-массивом (category_id = ANY(:ids)), поэтому текст запроса
+    не зависит от размера поддерева.
+    """
+    if category_ids is None:
+        return ProductModel.category_id == category_id
+    return ProductModel.category_id == any_(literal(category_ids, postgresql.ARRAY(Integer)))
+
+
+def leaves_filtered_lists(product, values: dict) -> bool:
+    """
+    Может ли изменение values вывести активный товар product из списков с фильтрами
+    (категория, диапазон цены, in_stock): такие изменения увеличивают версию товаров.
+    """
+    if not product.is_active:
+        return False
+    if values.get('category_id', product.category_id) != product.category_id:
+        return True
+    if values.get('price', product.price) != product.price:
+        return True
+    return (values.get('stock', product.stock) > 0) != (product.stock > 0)
 
 
 class ProductRepository(CommonRepository):
@@ -17,34 +81,224 @@ class ProductRepository(CommonRepository):
                                       page: int,
                                       page_size: int,
                                       filters: list,
-                                      order_clauses
+                                      order_clauses,
+                                      total_mode: TotalCountEnum = TotalCountEnum.exact,
+                                      columns: list | None = None
                                       ):
-        stmt_total = (
-            select(func.count(self.model.id))
+        """
+        Страница товаров по номеру (OFFSET).
+
+        Если передан columns, выбираются только эти колонки и items - строки (Row) вместо ORM-объектов:
+        так быстрее и для базы, и для сериализации ответа.
+        """
+        stmt_product = (
+            self._select_products(columns)
             .where(*filters)
+            .order_by(*order_clauses)
         )
-        result = await db.execute(stmt_total)
-        total = result.scalar() or 0
+        if total_mode == TotalCountEnum.exact:
+            # Общее количество считаем оконной функцией в том же запросе, без отдельного COUNT(*)
+            stmt_product = stmt_product.add_columns(func.count().over().label('total'))
+
+        # Берём на одну строку больше, чтобы узнать, есть ли следующая страница
+        result = await db.execute(stmt_product.offset((page - 1) * page_size).limit(page_size + 1))
+        rows = result.all()
+
+        total = None
+        if total_mode == TotalCountEnum.exact and not rows and page > 1:
+            # Страница за пределами выборки: окно ничего не вернуло, поэтому
+            # считаем количество отдельно и корректируем page, если он слишком большой
+            total = await self._count_products(db, filters, total_mode)
+            page = _correct_page(total, page, page_size)
+            result = await db.execute(stmt_product.offset((page - 1) * page_size).limit(page_size + 1))
+            rows = result.all()
 
-        # Корректируем page, если он слишком большой
-        page = _correct_page(page, total, page_size)
+        if total_mode == TotalCountEnum.exact:
+            total = rows[0].total if rows else total or 0
+        else:
+            total = await self._count_products(db, filters, total_mode)
 
+        return {
+            "items": self._page_items(rows[:page_size], columns),
+            "total": total,
+            "total_kind": total_mode,
+            "has_more": len(rows) > page_size,
+            "page": page,
+            "page_size": page_size,
+        }
+
+    async def get_active_products_by_cursor(self,
+                                            db: AsyncSession,
+                                            page_size: int,
+                                            filters: list,
+                                            sort_keys: list,
+                                            cursor: Cursor | None,
+                                            total_mode: TotalCountEnum = TotalCountEnum.exact,
+                                            columns: list | None = None
+                                            ):
+        """
+        Keyset-пагинация: вместо OFFSET страница начинается строго после граничной строки курсора,
+        поэтому стоимость запроса не зависит от глубины страницы.
+
+        :param db: Объект сессии к базе данных
+        :param page_size: Количество элементов на странице
+        :param filters: Список условий where
+        :param sort_keys: Список пар (колонка, по убыванию) с id в конце
+        :param cursor: Раскодированный курсор или None для первой страницы
+        :param total_mode: Способ подсчёта общего количества
+        :param columns: Выбираемые колонки (вместе с ключами сортировки) или None для ORM-объектов
+        :return: Словарь для ProductList
+        """
+        backward = cursor is not None and cursor.backward
+        conditions = list(filters)
+        if cursor is not None:
+            conditions.append(keyset_condition(sort_keys, cursor.values, backward))
+
+        # Берём на одну строку больше, чтобы узнать, есть ли ещё страница в этом направлении
         stmt_product = (
-            select(self.model)
-            .where(*filters)
-            .order_by(*order_clauses)
-            .offset((page - 1) * page_size)
-            .limit(page_size)
+            self._select_products(columns)
+            .where(*conditions)
+            .order_by(*keyset_order(sort_keys, backward))
+            .limit(page_size + 1)
         )
+        if total_mode == TotalCountEnum.exact:
+            # Оконная функция посчитала бы только строки после курсора,
+            # поэтому количество по всем фильтрам берём скалярным подзапросом в том же запросе
+            stmt_product = stmt_product.add_columns(
+                select(func.count(self.model.id)).where(*filters).scalar_subquery().label('total'))
         result = await db.execute(stmt_product)
-        products = result.scalars().all()
+        rows = result.all()
+        has_more = len(rows) > page_size
+
+        if total_mode == TotalCountEnum.exact and rows:
+            total = rows[0].total
+        else:
+            total = await self._count_products(db, filters, total_mode)
+
+        products = self._page_items(rows[:page_size], columns)
+        if backward:
+            products.reverse()
+
         return {
             "items": products,
             "total": total,
-            "page": page,
+            "total_kind": total_mode,
+            "has_more": has_more if not backward else bool(products),
+            "page": None,
+            "page_size": page_size,
+            **page_cursors(products,
+                           sort_keys,
+                           has_next=has_more if not backward else True,
+                           has_prev=has_more if backward else cursor is not None),
+        }
+
+    async def search_products(self,
+                              db: AsyncSession,
+                              tsquery: str,
+                              page_size: int,
+                              filters: list,
+                              cursor: str | None,
+                              total_mode: TotalCountEnum = TotalCountEnum.none,
+                              columns: list | None = None
+                              ):
+        """
+        Полнотекстовый поиск по названию и описанию с сортировкой по релевантности.
+
+        Совпадения находятся по GIN-индексу search_vector, фильтры списка товаров применяются
+        в том же запросе, а страницы выбираются по курсору (ts_rank, id).
+
+        :param db: Объект сессии к базе данных
+        :param tsquery: Запрос в синтаксисе to_tsquery
+        :param page_size: Количество элементов на странице
+        :param filters: Список условий where
+        :param cursor: Курсор из next_cursor или None для первой страницы
+        :param total_mode: Способ подсчёта общего количества
+        :param columns: Выбираемые колонки или None для ORM-объектов
+        :return: Словарь для ProductList
+        """
+        query = func.to_tsquery(SEARCH_CONFIG, tsquery)
+        rank = func.ts_rank(self.model.search_vector, query, type_=Float).label('rank')
+        # Релевантность, затем id; ключ сортировки - выражение, поэтому курсор раскодируется здесь
+        sort_keys = [(rank, True), (self.model.id, True)]
+
+        filters = [*filters, self.model.search_vector.bool_op('@@')(query)]
+        conditions = list(filters)
+        if cursor is not None:
+            conditions.append(keyset_condition(sort_keys, decode_cursor(cursor, sort_keys).values))
+
+        stmt = (
+            self._select_products(columns)
+            .add_columns(rank)
+            .where(*conditions)
+            .order_by(*keyset_order(sort_keys))
+            .limit(page_size + 1)
+        )
+        result = await db.execute(stmt)
+        rows = result.all()
+        has_more = len(rows) > page_size
+
+        return {
+            "items": self._page_items(rows[:page_size], columns),
+            "total": await self._count_products(db, filters, total_mode),
+            "total_kind": total_mode,
+            "has_more": has_more,
+            "page": None,
             "page_size": page_size,
+            **page_cursors(rows[:page_size], sort_keys, has_next=has_more, has_prev=False),
         }
 
+    def _select_products(self, columns: list | None):
+        return select(self.model) if columns is None else select(*columns)
+
+    @staticmethod
+    def _page_items(rows: list, columns: list | None) -> list:
+        # ORM-объект - первый элемент строки; при выборке колонок элементом страницы служит сама строка
+        return [row[0] for row in rows] if columns is None else list(rows)
+
+    async def get_active_product_names(self, db: AsyncSession) -> list[tuple[int, str]]:
+        """
+        Возвращает пары (id, название) всех активных товаров для индекса подсказок.
+
+        Строки читаются потоком порциями, без построения ORM-объектов.
+        """
+        stmt = select(self.model.id, self.model.name).where(self.model.is_active.is_(True))
+        result = await db.stream(stmt.execution_options(yield_per=10000))
+        return [(product_id, name) async for product_id, name in result]
+
+    async def _count_products(self,
+                              db: AsyncSession,
+                              filters: list,
+                              total_mode: TotalCountEnum) -> int | None:
+        """
+        Количество товаров по фильтрам для случаев, когда оно не пришло вместе со страницей.
+        """
+        if total_mode == TotalCountEnum.none:
+            return None
+        if total_mode == TotalCountEnum.estimated:
+            return await self._estimate_count(db, filters)
+
+        result = await db.execute(select(func.count(self.model.id)).where(*filters))
+        return result.scalar() or 0
+
+    async def _estimate_count(self,
+                              db: AsyncSession,
+                              filters: list) -> int:
+        """
+        Оценка количества по статистике планировщика (EXPLAIN без выполнения запроса).
+        Результат кешируется по сигнатуре фильтров на settings.estimated_count_ttl секунд.
+        """
+        sql = str(select(self.model.id).where(*filters).compile(dialect=postgresql.dialect(),
+                                                                compile_kwargs={"literal_binds": True}))
+        estimate = _estimated_counts.get(sql)
+        if estimate is None:
+            result = await db.execute(text(f'EXPLAIN (FORMAT JSON) {sql}'))
+            plan = result.scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            estimate = int(plan[0]['Plan']['Plan Rows'])
+            _estimated_counts.set(sql, estimate)
+        return estimate
+
     async def create_product(self,
                              db: AsyncSession,
                              product: ProductCreate,
@@ -57,20 +311,188 @@ class ProductRepository(CommonRepository):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                                 detail=f'Category with id {product.category_id} not found or inactive')
 
-        db_product = self.model(**product.model_dump(), seller_id=current_user.id)
-        db.add(db_product)
-        await db.commit()
-        await db.refresh(db_product)
+        # INSERT ... RETURNING сразу возвращает серверные значения (id, created_at, rating),
+        # коммит выполняется один раз в get_async_db
+        stmt = insert(self.model).values(**product.model_dump(), seller_id=current_user.id).returning(self.model)
+        db_product = await db.scalar(stmt)
+        invalidate_product_after_commit(db, db_product.id, db_product.category_id)
 
         return db_product
 
+    async def stream_products(self, db: AsyncSession, filters: list, columns: list) -> AsyncIterator[list]:
+        """
+        Все товары под фильтрами в порядке id через серверный курсор: строки приходят пачками
+        по settings.export_batch_size, поэтому память не зависит от размера каталога.
+        """
+        stmt = (select(*columns)
+                .where(*filters)
+                .order_by(self.model.id)
+                .execution_options(yield_per=settings.export_batch_size))
+        result = await db.stream(stmt)
+        async for rows in result.partitions():
+            yield rows
+
+    async def create_import_staging(self, db: AsyncSession) -> None:
+        connection = await db.connection()
+        await connection.run_sync(product_import.create)
+
+    async def copy_import_records(self, db: AsyncSession, records: list[tuple]) -> None:
+        """
+        Загружает пачку записей (значения в порядке PRODUCT_IMPORT_COLUMNS) в промежуточную таблицу
+        через COPY (asyncpg copy_records_to_table) в транзакции сессии.
+        """
+        connection = await db.connection()
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(product_import.name,
+                                                                     records=records,
+                                                                     columns=PRODUCT_IMPORT_COLUMNS)
+
+    async def get_import_category_rejects(self, db: AsyncSession, limit: int) -> tuple[int, list]:
+        """
+        Строки импорта с несуществующей или неактивной категорией: их количество и первые limit строк (line, category_id).
+        """
+        missing = ~exists().where(CategoryModel.id == product_import.c.category_id, CategoryModel.is_active.is_(True))
+        count = await db.scalar(select(func.count()).select_from(product_import).where(missing))
+        rows = []
+        if count:
+            stmt = (select(product_import.c.line, product_import.c.category_id)
+                    .where(missing)
+                    .order_by(product_import.c.line)
+                    .limit(limit))
+            rows = (await db.execute(stmt)).all()
+        return count, rows
+
+    async def upsert_imported_products(self,
+                                       db: AsyncSession,
+                                       seller_id: int,
+                                       max_returned: int) -> tuple[int, int, int, list[tuple[int, str]] | None]:
+        """
+        Переносит строки промежуточной таблицы в товары продавца одним запросом
+        INSERT ... SELECT ... ON CONFLICT (seller_id, sku) DO UPDATE.
+
+        Строки с неактивной категорией пропускаются; из строк с одинаковым артикулом берётся последняя
+        (одна команда не может обновить строку дважды). Существующий товар перезаписывается и снова
+        становится активным, только если что-то изменилось: неизменные строки повторного импорта
+        не порождают новых версий строк и не сдвигают updated_at.
+
+        Тем же запросом возвращаются id и названия созданных и обновлённых товаров (для индекса подсказок),
+        если их не больше max_returned: огромный импорт не тянет все строки в память.
+
+        :return: (создано, обновлено, различных артикулов, (id, название) созданных и обновлённых товаров
+            или None, если их больше max_returned)
+        """
+        source = (select(product_import)
+                  .join(CategoryModel, and_(CategoryModel.id == product_import.c.category_id,
+                                            CategoryModel.is_active.is_(True)))
+                  .distinct(product_import.c.sku)
+                  .order_by(product_import.c.sku, product_import.c.line.desc())
+                  .cte('source'))
+        stmt = postgresql.insert(self.model).from_select(
+            [*_IMPORTED_FIELDS, 'seller_id'],
+            select(*(source.c[field] for field in _IMPORTED_FIELDS), literal(seller_id, Integer)))
+        excluded = stmt.excluded
+        changed = [getattr(self.model, field).is_distinct_from(excluded[field])
+                   for field in _IMPORTED_FIELDS if field != 'sku']
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[self.model.seller_id, self.model.sku],
+            set_={**{field: excluded[field] for field in _IMPORTED_FIELDS if field != 'sku'},
+                  'is_active': True,
+                  'updated_at': func.now()},
+            where=or_(*changed, self.model.is_active.is_(False)),
+        ).returning(self.model.id, self.model.name, literal_column('xmax = 0', Boolean).label('inserted'))
+        upserted = stmt.cte('upserted')
+        # Изменяющий CTE выполняется целиком независимо от LIMIT; одна строка лишнего - признак переполнения
+        returned = select(upserted.c.id, upserted.c.name).limit(max_returned + 1).subquery()
+        names = select(func.array_agg(returned.c.id).label('ids'),
+                       func.array_agg(returned.c.name).label('names')).subquery()
+        summary = select(
+            select(func.count()).where(upserted.c.inserted).scalar_subquery(),
+            select(func.count()).where(~upserted.c.inserted).scalar_subquery(),
+            select(func.count()).select_from(source).scalar_subquery(),
+            names.c.ids,
+            names.c.names,
+        )
+        inserted, updated, unique, ids, product_names = (await db.execute(summary)).one()
+        # Прежние значения обновлённых строк RETURNING не возвращает, поэтому любое обновление
+        # считается возможным выпадением из списков (импорт - редкая массовая операция)
+        if updated:
+            await self._bump_products_version(db)
+        products = list(zip(ids or (), product_names or ()))
+        return inserted, updated, unique, products if len(products) <= max_returned else None
+
+    async def get_active_category_ids(self, db: AsyncSession, category_ids: set[int]) -> set[int]:
+        """
+        Какие из категорий существуют и активны - один запрос с IN для всего пакета товаров.
+        """
+        if not category_ids:
+            return set()
+        stmt = select(CategoryModel.id).where(CategoryModel.id.in_(category_ids), CategoryModel.is_active.is_(True))
+        return set((await db.scalars(stmt)).all())
+
+    async def get_products_by_ids(self, db: AsyncSession, product_ids: set[int]) -> dict[int, tuple]:
+        """
+        Продавец, категория, название, цена, остаток и активность товаров пакета одним запросом: id -> строка.
+        """
+        if not product_ids:
+            return {}
+        stmt = (select(self.model.id, self.model.seller_id, self.model.category_id, self.model.name,
+                       self.model.price, self.model.stock, self.model.is_active)
+                .where(self.model.id.in_(product_ids)))
+        return {row.id: row for row in (await db.execute(stmt)).all()}
+
+    async def bulk_create_products(self,
+                                   db: AsyncSession,
+                                   products: list[ProductCreate],
+                                   current_user: User) -> list[int]:
+        """
+        Вставляет товары кусками по settings.bulk_chunk_size строк: один многострочный INSERT ... RETURNING id
+        на кусок, без загрузки ORM-объектов. Категории должны быть проверены заранее (get_active_category_ids).
+
+        :return: id созданных товаров в порядке products
+        """
+        if not products:
+            return []
+        rows = [{**product.model_dump(), 'seller_id': current_user.id} for product in products]
+        stmt = insert(self.model).returning(self.model.id, sort_by_parameter_order=True)
+        product_ids = []
+        for start in range(0, len(rows), settings.bulk_chunk_size):
+            chunk = rows[start:start + settings.bulk_chunk_size]
+            product_ids.extend((await db.scalars(stmt, chunk)).all())
+        invalidate_products_after_commit(db, product_ids, {product.category_id for product in products})
+        return product_ids
+
+    async def bulk_update_products(self,
+                                   db: AsyncSession,
+                                   updates: list[dict],
+                                   category_ids: set[int],
+                                   leaves_lists: bool = True) -> None:
+        """
+        Обновляет товары по первичному ключу: каждый словарь - id и новые значения полей.
+        SQLAlchemy группирует словари с одинаковым набором полей в один UPDATE с executemany
+        (asyncpg отправляет весь пакет параметров за один обмен), updated_at выставляется в самом UPDATE.
+        Права и категории должны быть проверены заранее.
+
+        :param category_ids: Прежние и новые категории товаров - для сброса кеша их списков
+        :param leaves_lists: Может ли какой-то товар пакета выпасть из списков (leaves_filtered_lists)
+        """
+        if not updates:
+            return
+        for start in range(0, len(updates), settings.bulk_chunk_size):
+            await db.execute(update(self.model), updates[start:start + settings.bulk_chunk_size])
+        if leaves_lists:
+            await self._bump_products_version(db)
+        invalidate_products_after_commit(db, [values['id'] for values in updates], category_ids)
+
     async def get_products_by_category_id(self,
                                           db: AsyncSession,
                                           category_id,
                                           page: int,
                                           page_size: int,
                                           filters: list,
-                                          order_sorting: list
+                                          order_sorting: list,
+                                          total_mode: TotalCountEnum = TotalCountEnum.exact,
+                                          category_ids: list[int] | None = None,
+                                          columns: list | None = None
                                           ):
         stmt = select(CategoryModel).where(CategoryModel.id == category_id, CategoryModel.is_active.is_(True))
         result = await db.execute(stmt)
@@ -78,41 +500,176 @@ class ProductRepository(CommonRepository):
         if not category:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Category not found or inactive')
 
-        stmt_total = (
-            select(func.count(self.model.id))
-            .where(self.model.category_id == category_id)
-            .where(*filters)
-        )
-        result = await db.execute(stmt_total)
-        total = result.scalar() or 0
+        return await self.get_all_active_products(db,
+                                                  page,
+                                                  page_size,
+                                                  [category_condition(category_id, category_ids), *filters],
+                                                  order_sorting,
+                                                  total_mode,
+                                                  columns)
+
+    async def get_category_facets(self,
+                                  db: AsyncSession,
+                                  category_id: int,
+                                  filters: list,
+                                  facet_groups: dict[int, int] | None = None) -> dict:
+        """
+        Считает фасеты списка товаров категории одним запросом с GROUPING SETS.
 
-        # Корректируем page, если он слишком большой
-        page = _correct_page(page, total, page_size)
+        Товары берутся из категории и её активных прямых подкатегорий: количество по подкатегориям
+        считается по всем ним, а продавцы, ценовые диапазоны и наличие - только по товарам самой
+        категории (count(*) FILTER), то есть по тем же строкам, что и в списке.
+        Если передан facet_groups (список включает подкатегории), товары берутся из всего поддерева:
+        каждая категория поддерева засчитывается в свою прямую подкатегорию, а остальные фасеты
+        считаются по всем товарам поддерева.
+        Результат кешируется по сигнатуре фильтров на settings.facets_cache_ttl секунд.
+
+        :param db: Объект сессии к базе данных
+        :param category_id: ID категории
+        :param filters: Список условий where списка товаров
+        :param facet_groups: Категория поддерева -> прямая подкатегория, в которую она входит
+        :return: Словарь для ProductFacets
+        """
+        edges = settings.facet_price_buckets
+        if facet_groups is None:
+            scope = (
+                select(CategoryModel.id.label('category_id'), CategoryModel.id, CategoryModel.name)
+                .where(or_(CategoryModel.id == category_id, CategoryModel.parent_id == category_id),
+                       CategoryModel.is_active.is_(True))
+                .cte('scope')
+            )
+            own_count = func.count().filter(self.model.category_id == category_id)
+        else:
+            subtree = func.unnest(literal(list(facet_groups), postgresql.ARRAY(Integer)),
+                                  literal(list(facet_groups.values()), postgresql.ARRAY(Integer))
+                                  ).table_valued('category_id', 'facet_id', name='subtree')
+            scope = (
+                select(subtree.c.category_id, CategoryModel.id, CategoryModel.name)
+                .join(CategoryModel, CategoryModel.id == subtree.c.facet_id)
+                .cte('scope')
+            )
+            own_count = func.count()
+        # Номер диапазона: 0 - дешевле edges[0], i - [edges[i-1], edges[i]), len(edges) - от edges[-1]
+        price_bucket = func.width_bucket(self.model.price, postgresql.array(edges, type_=Numeric))
+        in_stock = self.model.stock > 0
+        grouped = (scope.c.id, self.model.seller_id, price_bucket, in_stock)
 
         stmt = (
-            select(self.model)
-            .where(self.model.category_id == category_id, *filters)
-            .order_by(*order_sorting)
-            .offset((page - 1) * page_size)
-            .limit(page_size)
+            select(*grouped,
+                   scope.c.name,
+                   func.grouping(*grouped).label('grouping'),
+                   func.count().label('count'),
+                   own_count.label('own_count'))
+            .join(scope, scope.c.category_id == self.model.category_id)
+            .where(*filters)
+            .group_by(func.grouping_sets(tuple_(scope.c.id, scope.c.name), self.model.seller_id, price_bucket,
+                                         in_stock))
         )
+        key = str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+        facets = _facets_cache.get(key)
+        if facets is not None:
+            return facets
+
         result = await db.execute(stmt)
-        products = result.scalars().all()
-        return {
-            "items": products,
-            "total": total,
-            "page": page,
-            "page_size": page_size,
-        }
+        categories, sellers, buckets = [], [], [0] * (len(edges) + 1)
+        facets = {'in_stock': 0, 'out_of_stock': 0}
+        for row_category_id, seller_id, bucket, row_in_stock, name, grouping, count, own_count in result.all():
+            # Бит GROUPING равен 1 для колонок, не входящих в набор группировки строки
+            if grouping == 0b0111:
+                categories.append({'id': row_category_id, 'name': name, 'count': count})
+            elif not own_count:
+                continue
+            elif grouping == 0b1011:
+                sellers.append({'id': seller_id, 'count': own_count})
+            elif grouping == 0b1101:
+                buckets[bucket] = own_count
+            elif grouping == 0b1110:
+                facets['in_stock' if row_in_stock else 'out_of_stock'] = own_count
+
+        sellers.sort(key=lambda seller: (-seller['count'], seller['id']))
+        bounds = [None, *edges, None]
+        facets.update({
+            'categories': sorted(categories, key=lambda category: category['id']),
+            'sellers': sellers[:settings.facet_sellers_limit],
+            'price_buckets': [{'min_price': bounds[i], 'max_price': bounds[i + 1], 'count': count}
+                              for i, count in enumerate(buckets)],
+        })
+        _facets_cache.set(key, facets)
+        return facets
+
+    async def get_products_by_category_cursor(self,
+                                              db: AsyncSession,
+                                              category_id: int,
+                                              page_size: int,
+                                              filters: list,
+                                              sort_keys: list,
+                                              cursor: Cursor | None,
+                                              total_mode: TotalCountEnum = TotalCountEnum.exact,
+                                              category_ids: list[int] | None = None,
+                                              columns: list | None = None
+                                              ):
+        stmt = select(CategoryModel).where(CategoryModel.id == category_id, CategoryModel.is_active.is_(True))
+        result = await db.execute(stmt)
+        category = result.scalars().first()
+        if not category:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Category not found or inactive')
+
+        return await self.get_active_products_by_cursor(db,
+                                                        page_size,
+                                                        [category_condition(category_id, category_ids), *filters],
+                                                        sort_keys,
+                                                        cursor,
+                                                        total_mode,
+                                                        columns)
+
+    @single_flight
+    async def get_product_updated_at(self, db: AsyncSession, product_id: int) -> datetime | None:
+        """
+        Время последнего изменения активного товара (None, если товара нет) - проверка для условных GET.
+        """
+        stmt = select(self.model.updated_at).where(self.model.id == product_id, self.model.is_active.is_(True))
+        return await db.scalar(stmt)
+
+    async def get_list_validators(self, db: AsyncSession, filters: list) -> tuple[datetime | None, int]:
+        """
+        Время последнего изменения товаров, подходящих под фильтры, и версия товаров - проверка
+        для условных GET списков одним запросом.
+
+        max(updated_at) берётся с конца индекса ix_products_active_updated_at до первой подходящей
+        строки, а не агрегатом по всей выборке. Он не замечает товары, выпавшие из выборки (удаление,
+        смена категории, цены или наличия), - их учитывает версия товаров.
+        """
+        last_modified = select(func.max(self.model.updated_at)).where(*filters).scalar_subquery()
+        version = select(DataVersion.version).where(DataVersion.name == PRODUCTS_VERSION).scalar_subquery()
+        last_modified, version = (await db.execute(select(last_modified, version))).one()
+        return last_modified, version or 0
+
+    async def _bump_products_version(self, db: AsyncSession) -> None:
+        # Как и версия категорий, увеличивается в транзакции изменения
+        stmt = postgresql.insert(DataVersion).values(name=PRODUCTS_VERSION, version=1)
+        stmt = stmt.on_conflict_do_update(index_elements=[DataVersion.name],
+                                          set_={'version': DataVersion.version + 1, 'updated_at': func.now()})
+        await db.execute(stmt)
+
+    # Одновременные запросы карточки одного товара (например, во время распродажи) выполняют один SELECT.
+    # Запросы делят результат, поэтому читается строка Core, а не ORM-объект
+    @single_flight
+    async def _get_product_row(self, db: AsyncSession, product_id: int, columns: tuple | None):
+        stmt = (select(*(columns or self.model.__table__.c))
+                .where(self.model.id == product_id, self.model.is_active.is_(True)))
+        return (await db.execute(stmt)).first()
 
     async def get_product_id(self,
                              db: AsyncSession,
-                             product_id: int
+                             product_id: int,
+                             columns: tuple | None = None
                              ):
-        stmt = select(self.model).where(self.model.id == product_id, self.model.is_active.is_(True))
-        result = await db.execute(stmt)
-        product = result.scalars().first()
-        if not product:
+        """
+        Активный товар по id: строка со всеми колонками товара или, если переданы columns,
+        только с этими колонками.
+        """
+        product = await self._get_product_row(db, product_id, columns)
+        if product is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Products not found')
 
         return product
@@ -139,11 +696,16 @@ class ProductRepository(CommonRepository):
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                                     detail=f'Category with id {product_update.category_id} not found')
 
-        update_data = product_update.model_dump(exclude_unset=True)
+        # UPDATE ... RETURNING обновит этот же объект, поэтому прежние значения проверяем заранее
+        old_category_id = product.category_id
+        update_data = product_update.model_dump(exclude_unset=True, exclude_none=True)
+        leaves_lists = leaves_filtered_lists(product, update_data)
         stmt = update(self.model).where(self.model.id == product_id).values(**update_data).returning(self.model)
         result = await db.execute(stmt)
         db_product = result.scalar_one()
-        await db.commit()
+        if leaves_lists:
+            await self._bump_products_version(db)
+        invalidate_product_after_commit(db, product_id, old_category_id, db_product.category_id)
 
         return db_product
 
@@ -164,6 +726,6 @@ class ProductRepository(CommonRepository):
         stmt = update(self.model).where(self.model.id == product_id).values(is_active=False).returning(self.model)
         result = await db.execute(stmt)
         product_db = result.scalar_one()
-        await db.commit()
-        await db.refresh(product_db)
+        await self._bump_products_version(db)
+        invalidate_product_after_commit(db, product_id, product_db.category_id)
         return product_db
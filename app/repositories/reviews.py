@@ -1,58 +1,116 @@
 from fastapi import status, HTTPException
-from sqlalchemy import select, func, update
+from sqlalchemy import select, update, insert, case, text
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, aliased, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
 
 from app.models import ProductModel, User, Reviews
 from app.repositories.common import CommonRepository
-from app.schemas import ReviewsCreate
+from app.response_cache import invalidate_product_after_commit
+from app.schemas import ReviewsCreate, UserSchema
+from app.utils.pagination import Cursor, keyset_condition, keyset_order, page_cursors
+
+
+_REBUILD_RATINGS_SQL = """
+    UPDATE products AS p
+    SET rating_sum = agg.rating_sum,
+        rating_count = agg.rating_count,
+        rating = agg.rating
+    FROM (
+        SELECT p.id,
+               coalesce(sum(r.grade), 0) AS rating_sum,
+               count(r.id) AS rating_count,
+               coalesce(avg(r.grade), 0)::float AS rating
+        FROM products AS p
+        LEFT JOIN reviews AS r ON r.product_id = p.id AND r.is_active
+        WHERE p.id BETWEEN :first_id AND :last_id
+        GROUP BY p.id
+    ) AS agg
+    WHERE p.id = agg.id
+      AND (p.rating_sum, p.rating_count, p.rating) IS DISTINCT FROM (agg.rating_sum, agg.rating_count, agg.rating)
+    RETURNING p.id
+"""
 
 
 class ReviewRepository(CommonRepository):
     model = Reviews
 
-    async def get_all_reviews(self,
-                              db: AsyncSession):
+    async def get_reviews_page(self,
+                               db: AsyncSession,
+                               filters: list,
+                               sort_keys: list,
+                               page_size: int,
+                               cursor: Cursor | None = None) -> dict:
         """
-        Возвращает список всех активных отзывов.
+        Возвращает страницу активных отзывов вместе с email автора и названием товара.
+
+        Автор и товар подтягиваются JOIN-ами в том же запросе, а страница выбирается по курсору
+        (keyset), поэтому и память, и число запросов не зависят от размера таблицы.
 
         :param db: Объект сессии к базе данных
-        :return: Список активных отзывов
+        :param filters: Дополнительные условия WHERE
+        :param sort_keys: Ключи сортировки в виде пар (колонка, по убыванию)
+        :param page_size: Количество отзывов на странице
+        :param cursor: Раскодированный курсор предыдущей страницы
+        :return: Словарь с items и next_cursor
         """
-        stmt = select(self.model).where(self.model.is_active.is_(True))
+        conditions = [self.model.is_active.is_(True), *filters]
+        if cursor is not None:
+            conditions.append(keyset_condition(sort_keys, cursor.values))
+
+        stmt = (
+            select(*self.model.__table__.c,
+                   User.email.label('author_name'),
+                   ProductModel.name.label('product_name'))
+            .join(User, User.id == self.model.user_id)
+            .join(ProductModel, ProductModel.id == self.model.product_id)
+            .where(*conditions)
+            .order_by(*keyset_order(sort_keys))
+            .limit(page_size + 1)
+        )
         result = await db.execute(stmt)
-        reviews = result.scalars().all()
-        return reviews
+        rows = result.all()
 
-    async def get_product_all_reviews(self,
-                                      db: AsyncSession,
-                                      product_id: int):
+        items = rows[:page_size]
+        return {
+            'items': items,
+            'next_cursor': page_cursors(items, sort_keys, has_next=len(rows) > page_size, has_prev=False)['next_cursor'],
+        }
 
+    async def get_product_reviews_page(self,
+                                       db: AsyncSession,
+                                       product_id: int,
+                                       filters: list,
+                                       sort_keys: list,
+                                       page_size: int,
+                                       cursor: Cursor | None = None) -> dict:
         """
-        Возвращает список всех активных отзывов для указанного товара.
+        Возвращает страницу активных отзывов для указанного товара.
 
         :param db: Объект сессии к базе данных
         :param product_id: ID товара
-        :return: Список активных отзывов
+        :param filters: Дополнительные условия WHERE
+        :param sort_keys: Ключи сортировки в виде пар (колонка, по убыванию)
+        :param page_size: Количество отзывов на странице
+        :param cursor: Раскодированный курсор предыдущей страницы
+        :return: Словарь с items и next_cursor
         :raises HTTPException: If product with given id is not found or inactive
         """
-        stmt = select(ProductModel).where(ProductModel.id == product_id, ProductModel.is_active.is_(True))
-        result = await db.execute(stmt)
-        product = result.scalars().first()
-
-        if not product:
+        stmt = select(ProductModel.id).where(ProductModel.id == product_id, ProductModel.is_active.is_(True))
+        if await db.scalar(stmt) is None:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                                 detail=f'Product with id {product_id} not found or inactive')
 
-        stmt = select(self.model).where(self.model.product_id == product_id, self.model.is_active.is_(True))
-        result = await db.execute(stmt)
-        reviews = result.scalars().all()
-
-        return reviews
+        return await self.get_reviews_page(db,
+                                           [self.model.product_id == product_id, *filters],
+                                           sort_keys,
+                                           page_size,
+                                           cursor)
 
     async def create_review(self,
                             db: AsyncSession,
                             review_data: ReviewsCreate,
-                            current_user: User) -> Reviews:
+                            current_user: UserSchema) -> Reviews:
         """
         Создаёт новый отзыв к товару.
 
@@ -78,31 +136,58 @@ class ReviewRepository(CommonRepository):
         review = result.scalars().first()
 
         if review:
-            raise HTTPException(status_code=status.HTTP_409_CONFLICTT,
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT,
                                 detail='You have already reviewed this product')
 
-        db_review = self.model(**review_data.model_dump(exclude_unset=True),
-                               user_id=current_user.id)
-        db.add(db_review)
-        await db.flush()  # ← Отправляет в БД без коммита
-
-        stmt = select(func.avg(self.model.grade)).where(self.model.product_id == review_data.product_id,
-                                                        self.model.is_active.is_(True))
+        # Отзыв и агрегаты рейтинга товара меняются одним запросом:
+        # WITH new_review AS (INSERT ... RETURNING ...) UPDATE products ... FROM new_review
+        new_review = (
+            insert(self.model)
+            .values(**review_data.model_dump(exclude_unset=True), user_id=current_user.id)
+            .returning(*self.model.__table__.c)
+            .cte('new_review')
+        )
+        product_rating = (
+            update(ProductModel)
+            .where(ProductModel.id == new_review.c.product_id)
+            .values(rating_sum=ProductModel.rating_sum + new_review.c.grade,
+                    rating_count=ProductModel.rating_count + 1,
+                    rating=(ProductModel.rating_sum + new_review.c.grade) / (ProductModel.rating_count + 1))
+            .returning(ProductModel.id, ProductModel.rating_sum, ProductModel.rating_count, ProductModel.rating)
+            .cte('product_rating')
+        )
+        stmt = (
+            select(aliased(self.model, new_review),
+                   product_rating.c.rating_sum, product_rating.c.rating_count, product_rating.c.rating)
+            .join(product_rating, product_rating.c.id == new_review.c.product_id)
+        )
         result = await db.execute(stmt)
-        avg_rating = result.scalars().one()
-        product.rating = avg_rating or 0.0
+        db_review, rating_sum, rating_count, rating = result.one()
+        self._set_product_rating(product, rating_sum, rating_count, rating)
+        invalidate_product_after_commit(db, product.id, product.category_id)
 
-        await db.commit()
-        await db.refresh(db_review)
+        # Автор и товар уже загружены - связываем их с отзывом без дополнительных запросов.
+        # current_user - общий для запросов снимок из кеша, поэтому автор - отдельный
+        # ORM-объект этой сессии, собранный из снимка
+        author = User(id=current_user.id, email=current_user.email,
+                      is_active=current_user.is_active, role=current_user.role)
+        make_transient_to_detached(author)
+        author = await db.merge(author, load=False)
+        set_committed_value(db_review, 'author', author)
+        set_committed_value(db_review, 'product', product)
 
         return db_review
 
     async def delete_review(self,
                             db: AsyncSession,
                             review_id: int,
-                            current_user: User):
+                            current_user: UserSchema):
 
-        stmt = select(self.model).where(self.model.id == review_id, self.model.is_active.is_(True))
+        stmt = (
+            select(self.model)
+            .options(joinedload(self.model.author), joinedload(self.model.product))
+            .where(self.model.id == review_id, self.model.is_active.is_(True))
+        )
         result = await db.execute(stmt)
         review = result.scalars().first()
 
@@ -114,17 +199,59 @@ class ReviewRepository(CommonRepository):
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                                 detail='Only the author or the admin can delete the review')
 
-        review.is_active = False
-        await db.flush()  # ← Отправляет в БД без коммита
-
-        stmt = select(func.avg(self.model.grade)).where(self.model.product_id == review.product_id,
-                                                        self.model.is_active.is_(True))
+        # Снятие отзыва и вычитание его оценки из агрегатов товара - один запрос.
+        # Условие is_active в CTE защищает от двойного вычитания при параллельном удалении
+        deleted_review = (
+            update(self.model)
+            .where(self.model.id == review_id, self.model.is_active.is_(True))
+            .values(is_active=False)
+            .returning(self.model.product_id, self.model.grade)
+            .cte('deleted_review')
+        )
+        remaining = ProductModel.rating_count - 1
+        stmt = (
+            update(ProductModel)
+            .where(ProductModel.id == deleted_review.c.product_id)
+            .values(rating_sum=ProductModel.rating_sum - deleted_review.c.grade,
+                    rating_count=remaining,
+                    rating=case((remaining > 0, (ProductModel.rating_sum - deleted_review.c.grade) / remaining),
+                                else_=0.0))
+            .returning(ProductModel.rating_sum, ProductModel.rating_count, ProductModel.rating)
+            .execution_options(synchronize_session=False)
+        )
         result = await db.execute(stmt)
-        avg_rating = result.scalars().first() or 0.0
+        row = result.one_or_none()
 
-        stmt = update(ProductModel).where(ProductModel.id == review.product_id).values(rating=avg_rating)
-        await db.execute(stmt)
+        if row is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                detail=f'Review with id {review_id} not found or inactive')
 
-        await db.commit()
+        set_committed_value(review, 'is_active', False)
+        self._set_product_rating(review.product, *row)
+        invalidate_product_after_commit(db, review.product.id, review.product.category_id)
 
         return review
+
+    @staticmethod
+    def _set_product_rating(product: ProductModel, rating_sum: int, rating_count: int, rating: float) -> None:
+        # Переносим значения, возвращённые запросом, в уже загруженный объект товара без его перечитывания
+        set_committed_value(product, 'rating_sum', rating_sum)
+        set_committed_value(product, 'rating_count', rating_count)
+        set_committed_value(product, 'rating', rating)
+
+    async def rebuild_product_ratings(self,
+                                      db: AsyncSession,
+                                      first_id: int,
+                                      last_id: int) -> int:
+        """
+        Пересчитывает агрегаты рейтинга товаров с id из [first_id, last_id] по активным отзывам.
+
+        Меняет только строки, где сохранённые значения разошлись с фактическими.
+
+        :param db: Сессия к базе данных.
+        :param first_id: Первый ID товара диапазона.
+        :param last_id: Последний ID товара диапазона.
+        :return: Количество исправленных товаров.
+        """
+        result = await db.execute(text(_REBUILD_RATINGS_SQL), {'first_id': first_id, 'last_id': last_id})
+        return len(result.all())
@@ -0,0 +1,57 @@
+from typing import Iterable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import on_commit
+from app.utils.response_cache import MemoryBackend, RedisBackend, ResponseCache
+
+# Кеш ответов публичных списков и карточек товаров (один на воркер, хранилище может быть общим)
+response_cache = ResponseCache(
+    RedisBackend(settings.response_cache_redis_url) if settings.response_cache_redis_url
+    else MemoryBackend(settings.response_cache_size),
+    ttl=settings.response_cache_ttl,
+    hold_off=settings.db_replica_max_lag if settings.db_replica_urls else 0.0,
+)
+
+# Теги ответов: общий список товаров, карточка товара (каждая и все сразу), список товаров категории
+# и всё, что зависит от дерева категорий
+PRODUCT_LIST_TAG = 'product-list'
+PRODUCT_DETAIL_TAG = 'product-detail'
+CATEGORIES_TAG = 'categories'
+
+
+def product_tag(product_id: int) -> str:
+    return f'product:{product_id}'
+
+
+def category_tag(category_id: int) -> str:
+    return f'category:{category_id}'
+
+
+def invalidate_product_after_commit(db: AsyncSession, product_id: int, *category_ids: int) -> None:
+    """
+    После коммита сбрасывает ответы, в которые мог попасть товар: его карточку, общий список
+    и списки категорий (при смене категории - старой и новой).
+    """
+    invalidate_products_after_commit(db, [product_id], category_ids)
+
+
+def invalidate_products_after_commit(db: AsyncSession, product_ids: Iterable[int], category_ids: Iterable[int]) -> None:
+    """
+    То же для пакета товаров: все теги сбрасываются одним вызовом после коммита.
+    """
+    tags = [PRODUCT_LIST_TAG, *map(product_tag, product_ids), *map(category_tag, set(category_ids))]
+    on_commit(db, lambda: response_cache.invalidate(tags))
+
+
+def invalidate_catalog_after_commit(db: AsyncSession) -> None:
+    """
+    После коммита сбрасывает все ответы с товарами: списки, карточки и списки категорий.
+    Для массовых изменений (импорт), когда перечислять товары по одному дороже, чем собрать кеш заново.
+    """
+    on_commit(db, lambda: response_cache.invalidate([PRODUCT_LIST_TAG, PRODUCT_DETAIL_TAG, CATEGORIES_TAG]))
+
+
+def invalidate_categories_after_commit(db: AsyncSession) -> None:
+    on_commit(db, lambda: response_cache.invalidate([CATEGORIES_TAG]))
@@ -2,9 +2,9 @@ from fastapi import APIRouter, status, Depends
 
 from app.auth import get_current_user, get_current_seller
 from app.models import CategoryModel
-from app.schemas import CategorySchema
+from app.schemas import CategorySchema, CategoryTreeSchema
 from app.services.categories import get_all_categories_services, create_category_services, update_category_services, \
-    delete_category_services
+    delete_category_services, get_category_tree_services, categories_not_modified_services
 
 # Создаём маршрутизатор с префиксом и тегом
 router = APIRouter(
@@ -15,7 +15,7 @@ router = APIRouter(
 
 @router.get("/",
             response_model=list[CategorySchema],
-            dependencies=[Depends(get_current_user)],
+            dependencies=[Depends(get_current_user), Depends(categories_not_modified_services)],
             status_code=status.HTTP_200_OK)
 async def get_all_categories(categories: list[CategoryModel] = Depends(get_all_categories_services)):
     """
@@ -24,6 +24,17 @@ async def get_all_categories(categories: list[CategoryModel] = Depends(get_all_c
     return categories
 
 
+@router.get("/tree",
+            response_model=CategoryTreeSchema,
+            dependencies=[Depends(get_current_user)],
+            status_code=status.HTTP_200_OK)
+async def get_category_tree(tree: CategoryTreeSchema = Depends(get_category_tree_services)):
+    """
+    Возвращает дерево активных категорий: корневые категории с вложенными подкатегориями.
+    """
+    return tree
+
+
 @router.post("/",
              response_model=CategorySchema,
              dependencies=[Depends(get_current_seller)],
@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Depends, Response
+
+from app.metrics import verify_metrics_token
+from app.utils.metrics import registry
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False, dependencies=[Depends(verify_metrics_token)])
+async def metrics():
+    """
+    Метрики процесса в текстовом формате Prometheus: HTTP-запросы по маршрутам, пулы соединений,
+    задержка event loop, попадания в кеши.
+    """
+    return Response(registry.render(), media_type=registry.content_type)
@@ -1,10 +1,20 @@
 from fastapi import APIRouter, status, Depends
+from fastapi.responses import StreamingResponse
 
 from app.models import ProductModel
-from app.schemas import ProductSchema, ProductList
+from app.response_cache import response_cache
+from app.auth import get_current_admin
+from app.schemas import ProductSchema, ProductList, AutocompleteItem, ProductBulkResult, ProductImportReport
+from app.services.autocomplete import autocomplete_products_services, product_name_index
+from app.services.product_import import import_products_services
+from app.utils.single_flight import single_flight_stats
 from app.services.products import (get_all_products_services, create_product_services,
                                    get_products_by_category_services,
-                                   get_product_services, update_product_services, delete_product_services)
+                                   get_product_services, update_product_services, delete_product_services,
+                                   search_products_services, products_not_modified_services,
+                                   category_products_not_modified_services, product_not_modified_services,
+                                   bulk_create_products_services, bulk_update_products_services,
+                                   export_products_services)
 
 # Создаём маршрутизатор для товаров
 router = APIRouter(
@@ -13,11 +23,14 @@ router = APIRouter(
 )
 
 
-@router.get("/", response_model=ProductList, status_code=status.HTTP_200_OK)
+@router.get("/",
+            response_model=ProductList,
+            dependencies=[Depends(products_not_modified_services)],
+            status_code=status.HTTP_200_OK)
 async def get_all_products(products: list[ProductList] = Depends(get_all_products_services)):
     """
     Возвращает список всех активных товаров.
-
+    fields= ограничивает набор полей товаров: остальные поля в items отсутствуют.
     """
     return products
 
@@ -31,16 +44,108 @@ async def create_product(product: ProductModel = Depends(create_product_services
     return product
 
 
-@router.get("/category/{category_id}", response_model=ProductList, status_code=status.HTTP_200_OK)
+@router.get("/category/{category_id}",
+            response_model=ProductList,
+            dependencies=[Depends(category_products_not_modified_services)],
+            status_code=status.HTTP_200_OK)
 async def get_products_by_category(products: ProductList = Depends(get_products_by_category_services)):
     """
     Возвращает список товаров в указанной категории по её ID.
+    fields= ограничивает набор полей товаров: остальные поля в items отсутствуют.
+    """
+
+    return products
+
+
+# Объявлены до /{product_id}, иначе "bulk", "export", "autocomplete", "cache", "single-flight" и "search"
+# попадут в product_id
+@router.post("/bulk", response_model=ProductBulkResult, status_code=status.HTTP_200_OK)
+async def bulk_create_products(result: dict = Depends(bulk_create_products_services)):
+    """
+    Создаёт до BULK_MAX_ITEMS товаров одним запросом. Ошибки возвращаются по каждому товару,
+    остальные товары пакета создаются.
+    """
+    return result
+
+
+@router.post("/import", response_model=ProductImportReport, status_code=status.HTTP_200_OK)
+async def import_products(report: dict = Depends(import_products_services)):
+    """
+    Импортирует каталог продавца из CSV-файла (колонки sku, name, price, stock, category_id,
+    необязательные description и image_url). Товары с уже известным артикулом обновляются.
+    Возвращает скорость импорта и отклонённые строки.
+    """
+    return report
+
+
+@router.patch("/bulk", response_model=ProductBulkResult, status_code=status.HTTP_200_OK)
+async def bulk_update_products(result: dict = Depends(bulk_update_products_services)):
+    """
+    Частично обновляет до BULK_MAX_ITEMS своих товаров одним запросом. Ошибки возвращаются по каждому товару,
+    остальные товары пакета обновляются.
+    """
+    return result
+
+
+@router.get("/autocomplete", response_model=list[AutocompleteItem], status_code=status.HTTP_200_OK)
+async def autocomplete_products(items: list[dict] = Depends(autocomplete_products_services)):
+    """
+    Подсказки по названиям активных товаров для поиска по мере ввода.
+    """
+
+    return items
+
+
+@router.get("/autocomplete/stats", dependencies=[Depends(get_current_admin)])
+async def autocomplete_stats():
+    """
+    Размер индекса подсказок, занимаемая им память и время последней перестройки (только для администратора).
+    """
+    return product_name_index.stats()
+
+
+@router.get("/export",
+            response_class=StreamingResponse,
+            dependencies=[Depends(get_current_admin)],
+            status_code=status.HTTP_200_OK)
+async def export_products(response: StreamingResponse = Depends(export_products_services)):
+    """
+    Выгружает все активные товары под фильтрами списка одним потоком в NDJSON или CSV (только для администратора).
+    fields= ограничивает набор полей.
+    """
+    return response
+
+
+@router.get("/cache/stats", dependencies=[Depends(get_current_admin)])
+async def response_cache_stats():
+    """
+    Доля попаданий, вытеснения и сбросы кеша ответов товаров (только для администратора).
+    """
+    return await response_cache.stats()
+
+
+@router.get("/single-flight/stats", dependencies=[Depends(get_current_admin)])
+async def single_flight_statistics():
+    """
+    Сколько чтений выполнено и сколько одновременных одинаковых запросов к ним присоединилось (только для администратора).
+    """
+    return single_flight_stats()
+
+
+@router.get("/search", response_model=ProductList, status_code=status.HTTP_200_OK)
+async def search_products(products: ProductList = Depends(search_products_services)):
+    """
+    Ищет активные товары по названию и описанию (каждое слово - по префиксу), от самых релевантных.
+    Поддерживает те же фильтры и fields=, что и список товаров; следующая страница - cursor=next_cursor.
     """
 
     return products
 
 
-@router.get("/{product_id}", response_model=ProductSchema, status_code=status.HTTP_200_OK)
+@router.get("/{product_id}",
+            response_model=ProductSchema,
+            dependencies=[Depends(product_not_modified_services)],
+            status_code=status.HTTP_200_OK)
 async def get_product(product: ProductModel = Depends(get_product_services)):
     """
     Возвращает детальную информацию о товаре по его ID.
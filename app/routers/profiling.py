@@ -0,0 +1,45 @@
+import asyncio
+
+from fastapi import APIRouter, Depends, Response, status
+
+from app.auth import get_current_admin
+from app.config import settings
+from app.profiling import profiler
+from app.utils.profiling import load_profiles
+
+router = APIRouter(
+    prefix="/profiling",
+    tags=["profiling"],
+    dependencies=[Depends(get_current_admin)],
+)
+
+
+@router.get("/", status_code=status.HTTP_200_OK)
+async def profiling_summary():
+    """
+    Сколько стеков собрано по каждому маршруту во всех воркерах и состояние профайлера
+    этого воркера (только для администратора).
+    """
+    stacks = await asyncio.to_thread(load_profiles, settings.profiling_dir)
+    routes = {}
+    for stack, count in stacks.items():
+        route = stack.partition(';')[0]
+        routes[route] = routes.get(route, 0) + count
+    return {
+        "routes": dict(sorted(routes.items(), key=lambda item: item[1], reverse=True)),
+        "worker": profiler.stats(),
+    }
+
+
+@router.get("/stacks", status_code=status.HTTP_200_OK)
+async def profiling_stacks(route: str | None = None):
+    """
+    Свёрнутые стеки всех воркеров для flamegraph.pl или speedscope (только для администратора).
+    route - метод и шаблон маршрута, например "GET /products/"; без него - все маршруты.
+    """
+    stacks = await asyncio.to_thread(load_profiles, settings.profiling_dir)
+    if route is not None:
+        prefix = f'{route};'
+        stacks = {stack: count for stack, count in stacks.items() if stack.startswith(prefix)}
+    content = ''.join(f'{stack} {count}\n' for stack, count in sorted(stacks.items()))
+    return Response(content, media_type='text/plain; charset=utf-8')
@@ -1,7 +1,6 @@
 from fastapi import APIRouter, status, Depends
 
-from app.models import Reviews
-from app.schemas import ReviewsSchema
+from app.schemas import ReviewsSchema, ReviewList
 from app.services.reviews import (create_review_services, get_all_reviews_services, get_product_reviews_services,
                                   delete_review_services)
 
@@ -12,24 +11,25 @@ router = APIRouter(
 )
 
 
-@router.get("/", response_model=list[ReviewsSchema], status_code=status.HTTP_200_OK)
-async def get_all_reviews(reviews: list[Reviews] = Depends(get_all_reviews_services)):
+@router.get("/", response_model=ReviewList, status_code=status.HTTP_200_OK)
+async def get_all_reviews(reviews: ReviewList = Depends(get_all_reviews_services)):
     """
-    Возвращает список всех комментариев.
+    Возвращает страницу комментариев, от новых к старым.
+    Следующая страница запрашивается с cursor=next_cursor.
 
-    :returns: Список комментариев
-    :rtype: List[ReviewsSchema]
+    :returns: Страница комментариев
+    :rtype: ReviewList
     """
     return reviews
 
 
-@router.get("/products/{product_id}/reviews/", response_model=list[ReviewsSchema], status_code=status.HTTP_200_OK)
-async def get_product_reviews(reviews: list[Reviews] = Depends(get_product_reviews_services)):
+@router.get("/products/{product_id}/reviews/", response_model=ReviewList, status_code=status.HTTP_200_OK)
+async def get_product_reviews(reviews: ReviewList = Depends(get_product_reviews_services)):
     """
-    Возвращает список всех комментариев для указанного товара по его ID.
+    Возвращает страницу комментариев для указанного товара по его ID.
 
-    :returns: Список комментариев
-    :rtype: List[ReviewsSchema]
+    :returns: Страница комментариев
+    :rtype: ReviewList
     """
     return reviews
 
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, status, Depends, HTTPException
-from sqlalchemy import select, exists
+from sqlalchemy import select, exists, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import OAuth2PasswordRequestForm
 import jwt
-from app.auth import hash_password, verify_password, create_access_token, create_refresh_token
+from app.auth import (hash_password_async, verify_password_async, create_access_token, create_refresh_token,
+                      get_current_admin, user_cache, password_executor)
 from app.config import SECRET_KEY, ALGORITHM
 from app.db_depends import get_async_db
 from app.models import User
@@ -17,7 +18,7 @@ router = APIRouter(
 
 
 @router.post('/', response_model=UserSchema, status_code=status.HTTP_201_CREATED)
-async def create_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_async_db, scope="function")):
     '''
     Регистрирует нового пользователя с ролью 'buyer', 'admin' или 'seller'.
     '''
@@ -27,27 +28,41 @@ async def create_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)
         raise HTTPException(status_code=status.HTTP_409_CONFLICT,
                             detail=f'Пользователь с mail: {user.email} существует')
 
-    db_user = User(
+    stmt = insert(User).values(
         email=user.email,
-        hashed_password=hash_password(user.password.get_secret_value()),
+        hashed_password=await hash_password_async(user.password.get_secret_value()),
         role=user.role
-    )
-    db.add(db_user)
-    await db.commit()
-    await db.refresh(db_user)
+    ).returning(User)
+    db_user = await db.scalar(stmt)
     return db_user
 
 
+@router.get('/cache-stats', dependencies=[Depends(get_current_admin)])
+async def get_user_cache_stats():
+    '''
+    Возвращает счётчики кеша пользователей get_current_user (попадания, промахи, вытеснения).
+    '''
+    return user_cache.stats()
+
+
+@router.get('/password-hash-stats', dependencies=[Depends(get_current_admin)])
+async def get_password_hash_stats():
+    '''
+    Возвращает состояние пула bcrypt: очередь, выполняющиеся и отклонённые хеширования, время ожидания.
+    '''
+    return password_executor.stats()
+
+
 @router.post("/token")
 async def login(form_data: OAuth2PasswordRequestForm = Depends(),
-                db: AsyncSession = Depends(get_async_db)):
+                db: AsyncSession = Depends(get_async_db, scope="function")):
     """
     Аутентифицирует пользователя и возвращает JWT с email, role и id.
     """
     stmt = select(User).where(User.email == form_data.username, User.is_active.is_(True))
     result = await db.execute(stmt)
     user = result.scalars().first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail='Неверный адрес электронной почты или пароль',
@@ -61,7 +76,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(),
 @router.post("/refresh-token")
 async def refresh_token(
         body: RefreshTokenRequest,
-        db: AsyncSession = Depends(get_async_db),
+        db: AsyncSession = Depends(get_async_db, scope="function"),
 ):
     """
     Обновляет refresh-токен, принимая старый refresh-токен в теле запроса.
@@ -115,7 +130,7 @@ async def refresh_token(
 @router.post("/access-token", response_model=TokenResponse)
 async def refresh_token(
         body: RefreshTokenRequest,
-        db: AsyncSession = Depends(get_async_db),
+        db: AsyncSession = Depends(get_async_db, scope="function"),
 ):
     """
     Возвращает новый access-токен, принимая refresh-токен в теле запроса.
@@ -1,13 +1,19 @@
-from pydantic import BaseModel, Field, ConfigDict, EmailStr, SecretStr
+from functools import lru_cache
+
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, SecretStr, create_model
 from decimal import Decimal
 from datetime import datetime
 from fastapi import Query
 from enum import Enum
-from typing import Annotated
+from typing import Annotated, Any
 
+from app.config import settings
 from app.models import ProductModel
 from app.models.reviews import GradeEnum
 
+# Наибольшее значение колонки integer (int4) в PostgreSQL
+INT4_MAX = 2 ** 31 - 1
+
 
 class CategoryCreate(BaseModel):
     """
@@ -32,6 +38,20 @@ class CategorySchema(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class CategoryTreeNode(BaseModel):
+    id: int = Field(..., description="Уникальный идентификатор категории")
+    name: str = Field(..., description="Название категории")
+    children: list['CategoryTreeNode'] = Field(default_factory=list, description="Активные подкатегории")
+
+
+class CategoryTreeSchema(BaseModel):
+    """
+    Дерево активных категорий.
+    """
+    version: int = Field(..., description="Версия снимка дерева, меняется при изменении категорий")
+    items: list[CategoryTreeNode] = Field(..., description="Корневые категории")
+
+
 class ProductCreate(BaseModel):
     """
     Модель для создания и обновления товара.
@@ -41,10 +61,39 @@ class ProductCreate(BaseModel):
                       description="Название товара (3-100 символов)")
     description: str | None = Field(None, max_length=500,
                                     description="Описание товара (до 500 символов)")
-    price: Decimal = Field(..., gt=0, description="Цена товара (больше 0)", decimal_places=2)
+    # Границы колонок products (Numeric(10, 2), integer): значение за ними - ошибка проверки
+    # строки (422 или отказ строки импорта), а не ошибка базы на всю вставку
+    price: Decimal = Field(..., gt=0, description="Цена товара (больше 0)", max_digits=10, decimal_places=2)
     image_url: str | None = Field(None, max_length=200, description="URL изображения товара")
-    stock: int = Field(..., ge=0, description="Количество товара на складе (0 или больше)")
-    category_id: int = Field(..., description="ID категории, к которой относится товар")
+    stock: int = Field(..., ge=0, le=INT4_MAX, description="Количество товара на складе (0 или больше)")
+    category_id: int = Field(..., le=INT4_MAX, description="ID категории, к которой относится товар")
+
+
+class ProductImportRow(ProductCreate):
+    """
+    Строка CSV-импорта каталога: поля ProductCreate и артикул продавца, по которому товар обновляется при повторном импорте.
+    """
+    sku: str = Field(..., min_length=1, max_length=64, description="Артикул товара у продавца")
+
+
+class ProductImportReject(BaseModel):
+    line: int = Field(..., description="Номер строки CSV")
+    detail: Any = Field(..., description="Причина отказа")
+
+
+class ProductImportReport(BaseModel):
+    """
+    Отчёт об импорте каталога.
+    """
+    rows: int = Field(..., description="Прочитано строк данных")
+    inserted: int = Field(..., description="Создано товаров")
+    updated: int = Field(..., description="Обновлено товаров (артикул уже был у продавца)")
+    unchanged: int = Field(..., description="Товаров, которые уже совпадали со строкой CSV")
+    duplicates: int = Field(..., description="Строк с повторным артикулом: применяется последняя")
+    rejected: int = Field(..., description="Отклонено строк")
+    rejects: list[ProductImportReject] = Field(..., description="Первые отклонённые строки")
+    seconds: float = Field(..., description="Время импорта, секунды")
+    rows_per_second: float = Field(..., description="Скорость импорта, строк в секунду")
 
 
 class ProductUpdate(BaseModel):
@@ -62,6 +111,41 @@ class ProductUpdate(BaseModel):
     category_id: int | None = Field(None, description="ID категории, к которой относится товар")
 
 
+class ProductBulkUpdateItem(ProductUpdate):
+    """
+    Элемент PATCH /products/bulk: id товара и изменяемые поля.
+    """
+    id: int = Field(..., gt=0, description="ID обновляемого товара")
+
+
+class ProductBulkRequest(BaseModel):
+    """
+    Пакет товаров для /products/bulk: ProductCreate для POST, ProductBulkUpdateItem для PATCH.
+    Элементы проверяются по одному, поэтому ошибка в одном товаре не отклоняет весь пакет.
+    """
+    items: list[dict[str, Any]] = Field(..., min_length=1, max_length=settings.bulk_max_items,
+                                        description="Товары пакета")
+
+
+class BulkItemResult(BaseModel):
+    """
+    Результат для одного элемента пакета.
+    """
+    index: int = Field(..., description="Позиция элемента в запросе")
+    status: int = Field(..., description="HTTP-статус операции над элементом")
+    id: int | None = Field(None, description="ID созданного или обновлённого товара")
+    detail: Any = Field(None, description="Описание ошибки")
+
+
+class ProductBulkResult(BaseModel):
+    """
+    Ответ /products/bulk: результаты в порядке элементов запроса.
+    """
+    succeeded: int = Field(..., description="Количество успешно обработанных товаров")
+    failed: int = Field(..., description="Количество товаров с ошибками")
+    items: list[BulkItemResult]
+
+
 class ProductSchema(BaseModel):
     """
     Модель для ответа с данными товара.
@@ -73,9 +157,11 @@ class ProductSchema(BaseModel):
     price: Decimal = Field(..., description="Цена товара в рублях", gt=0, decimal_places=2)
     image_url: str | None = Field(None, description="URL изображения товара")
     stock: int = Field(..., description="Количество товара на складе")
+    sku: str | None = Field(None, description="Артикул товара у продавца")
     category_id: int = Field(..., description="ID категории")
     is_active: bool = Field(..., description="Активность товара")
     rating: float = Field(..., ge=0, le=5, description="Рейтинг товара")
+    rating_count: int = Field(0, ge=0, description="Количество активных отзывов")
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -96,14 +182,74 @@ class ProductOut(BaseModel):
     )
 
 
+
+@lru_cache(maxsize=256)
+def sparse_model(model: type[BaseModel], fields: tuple[str, ...]) -> type[BaseModel]:
+    """
+    Модель ответа только с полями fields из model (для параметра fields=).
+    Строится один раз на набор полей, описания и ограничения полей берутся из исходной модели.
+    """
+    return create_model(f'{model.__name__}[{",".join(fields)}]',
+                        __config__=ConfigDict(from_attributes=True),
+                        **{name: (model.model_fields[name].annotation, model.model_fields[name]) for name in fields})
+
+
+class AutocompleteItem(BaseModel):
+    """Подсказка по названию товара"""
+    id: int
+    name: str
+
+class TotalCountEnum(str, Enum):
+    exact = "exact"
+    estimated = "estimated"
+    none = "none"
+
+
+class CategoryFacet(BaseModel):
+    id: int = Field(..., description="ID категории")
+    name: str = Field(..., description="Название категории")
+    count: int = Field(..., ge=0, description="Количество товаров в категории с учётом фильтров")
+
+
+class SellerFacet(BaseModel):
+    id: int = Field(..., description="ID продавца")
+    count: int = Field(..., ge=0, description="Количество товаров продавца")
+
+
+class PriceBucketFacet(BaseModel):
+    min_price: Decimal | None = Field(None, description="Нижняя граница (включительно), null - без ограничения")
+    max_price: Decimal | None = Field(None, description="Верхняя граница (не включительно), null - без ограничения")
+    count: int = Field(..., ge=0, description="Количество товаров в диапазоне цен")
+
+
+class ProductFacets(BaseModel):
+    """
+    Агрегаты для фильтров каталога.
+
+    categories считаются по самой категории и её прямым подкатегориям,
+    остальные - по тем же товарам, что и список.
+    """
+    categories: list[CategoryFacet] = Field(default_factory=list)
+    sellers: list[SellerFacet] = Field(default_factory=list, description="Продавцы с наибольшим количеством товаров")
+    price_buckets: list[PriceBucketFacet] = Field(default_factory=list)
+    in_stock: int = Field(0, ge=0, description="Товаров в наличии")
+    out_of_stock: int = Field(0, ge=0, description="Товаров без остатка")
+
+
 class ProductList(BaseModel):
     """
     Список пагинации для товаров.
     """
-    items: list[ProductOut] = Field(description="Товары для текущей страницы")
-    total: int = Field(ge=0, description="Общее количество товаров")
-    page: int = Field(ge=1, description="Номер текущей страницы")
+    items: list[ProductOut] = Field(description="Товары для текущей страницы. С параметром fields= "
+                                                "в каждом товаре только запрошенные поля и id")
+    total: int | None = Field(None, ge=0, description="Общее количество товаров (None при total_mode=none)")
+    total_kind: TotalCountEnum = Field(TotalCountEnum.exact, description="Как получено total: точно, оценкой или не считалось")
+    has_more: bool = Field(False, description="Есть ли следующая страница")
+    page: int | None = Field(None, ge=1, description="Номер текущей страницы (None при пагинации по курсору)")
     page_size: int = Field(ge=1, description="Количество элементов на странице")
+    next_cursor: str | None = Field(None, description="Курсор следующей страницы")
+    prev_cursor: str | None = Field(None, description="Курсор предыдущей страницы")
+    facets: ProductFacets | None = Field(None, description="Агрегаты для фильтров (при facets=true)")
 
     model_config = ConfigDict(
         from_attributes=True,  # Для ORM
@@ -120,7 +266,8 @@ class UserSchema(BaseModel):
     is_active: bool
     role: str
 
-    model_config = ConfigDict(from_attributes=True)
+    # Экземпляры кешируются в app.auth.user_cache и разделяются между запросами
+    model_config = ConfigDict(from_attributes=True, frozen=True)
 
 
 class UserCreate(BaseModel):
@@ -187,6 +334,20 @@ class ReviewsSchema(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class ReviewList(BaseModel):
+    """
+    Страница отзывов для keyset-пагинации.
+    """
+    items: list[ReviewsSchema] = Field(..., description="Отзывы на текущей странице")
+    next_cursor: str | None = Field(None, description="Курсор следующей страницы, null - это последняя страница")
+
+
+# Форматы выгрузки каталога
+class ExportFormatEnum(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
 # Определяем возможные поля для сортировки
 class SortFieldEnum(str, Enum):
     id = "id"
@@ -213,8 +374,17 @@ class SortParams(BaseModel):
 class PageValidateSchema(BaseModel):
     page: Annotated[int, Field(ge=1, description="Номер текущей страницы", default=1)]
     page_size: Annotated[int, Field(ge=1, le=100, description="Количество элементов на странице", default=20)]
+    cursor: Annotated[str | None, Field(description="Курсор из next_cursor/prev_cursor; при указании page игнорируется")] = None
+    total_mode: Annotated[TotalCountEnum, Field(description="Подсчёт total: exact, estimated или none")] = TotalCountEnum.exact
+
 
 
+class ProductSearchSchema(BaseModel):
+    q: Annotated[str, Field(min_length=1, max_length=200, description="Поисковая строка; последнее слово можно не дописывать")]
+    page_size: Annotated[int, Field(ge=1, le=100, description="Количество элементов на странице", default=20)]
+    cursor: Annotated[str | None, Field(description="Курсор из next_cursor предыдущей страницы")] = None
+    total_mode: Annotated[TotalCountEnum, Field(description="Подсчёт total: exact, estimated или none")] = TotalCountEnum.none
+
 class ProductFilterParamsSchema(BaseModel):
     category_id: Annotated[int | None, Field(description="ID категории для фильтрации")] = None
     min_price: Annotated[float | None, Field(description="Минимальная цена товара", ge=0)] = None
@@ -222,3 +392,16 @@ class ProductFilterParamsSchema(BaseModel):
     in_stock: Annotated[
         bool | None, Field(description="true — только товары в наличии, false — только без остатка")] = None
     seller_id: Annotated[int | None, Field(description="ID продавца для фильтрации")] = None
+    include_subcategories: Annotated[
+        bool, Field(description="Учитывать товары из всех подкатегорий фильтруемой категории")] = False
+
+
+class ReviewPageSchema(BaseModel):
+    page_size: Annotated[int, Field(ge=1, le=100, description="Количество отзывов на странице", default=20)]
+    cursor: Annotated[str | None, Field(description="Курсор из next_cursor предыдущей страницы")] = None
+    order: Annotated[SortOrderEnum, Field(description="Сортировка по дате отзыва")] = SortOrderEnum.desc
+
+
+class ReviewFilterParamsSchema(BaseModel):
+    grade: Annotated[int | None, Field(description="Оценка для фильтрации", ge=1, le=5)] = None
+    user_id: Annotated[int | None, Field(description="ID автора для фильтрации", ge=1)] = None
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+from typing import Annotated
+
+from fastapi import HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import async_read_session_maker, on_commit, replicas
+from app.models import ProductModel
+from app.repositories.products import ProductRepository
+from app.utils.autocomplete import PrefixIndex
+
+logger = logging.getLogger(__name__)
+
+# Индекс подсказок по названиям активных товаров (один на воркер)
+product_name_index = PrefixIndex()
+# Фоновые перестройки индекса, запущенные после коммита (ссылки держим, чтобы задачи не собрал GC)
+_refresh_tasks: set[asyncio.Task] = set()
+
+
+async def refresh_product_name_index() -> None:
+    """
+    Перестраивает индекс подсказок по активным товарам из базы (с реплики, если она есть).
+    Снимок собирается по частям, не занимая event loop надолго.
+    """
+    async def load():
+        async with async_read_session_maker() as session:
+            session.info["replica"] = await replicas.choose()
+            return await ProductRepository().get_active_product_names(session)
+
+    await product_name_index.rebuild(load)
+    logger.info(f"Autocomplete index rebuilt: {len(product_name_index)} products "
+                f"in {product_name_index.rebuild_seconds:.3f}s")
+
+
+async def refresh_product_name_index_periodically(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await refresh_product_name_index()
+        except Exception as e:
+            logger.warning(f"Autocomplete index refresh failed: {e}")
+
+
+def index_product_after_commit(db: AsyncSession, product: ProductModel) -> None:
+    """
+    Обновляет товар в индексе подсказок после коммита транзакции запроса.
+    """
+    product_id, name, is_active = product.id, product.name, product.is_active
+    if is_active:
+        on_commit(db, lambda: product_name_index.upsert(product_id, name))
+    else:
+        on_commit(db, lambda: product_name_index.remove(product_id))
+
+
+async def _refresh_product_name_index_logged() -> None:
+    try:
+        await refresh_product_name_index()
+    except Exception as e:
+        logger.warning(f"Autocomplete index refresh failed: {e}")
+
+
+def refresh_product_name_index_after_commit(db: AsyncSession) -> None:
+    """
+    После коммита перестраивает индекс подсказок целиком в фоне - для изменений, затронувших
+    слишком много товаров, чтобы применять их по одному (импорт каталога).
+    """
+    def schedule():
+        task = asyncio.get_running_loop().create_task(_refresh_product_name_index_logged())
+        _refresh_tasks.add(task)
+        task.add_done_callback(_refresh_tasks.discard)
+
+    on_commit(db, schedule)
+
+
+def index_products_after_commit(db: AsyncSession, products: list[tuple[int, str]]) -> None:
+    """
+    Добавляет пакет активных товаров (id, название) в индекс подсказок после коммита одним upsert_many.
+    """
+    if products:
+        on_commit(db, lambda: product_name_index.upsert_many(products))
+
+
+async def autocomplete_products_services(
+        q: Annotated[str, Query(min_length=1, max_length=100, description="Начало любого слова названия товара")],
+        limit: Annotated[int, Query(ge=1, le=20, description="Максимальное количество подсказок")] = 10,
+):
+    """
+    Возвращает подсказки из in-process индекса, без обращения к базе.
+    """
+    if not product_name_index.loaded:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Autocomplete index is not loaded yet",
+                            headers={"Retry-After": "5"})
+    return product_name_index.search(q, limit)
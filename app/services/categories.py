@@ -1,22 +1,43 @@
-from fastapi import Depends
+from fastapi import Depends, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.auth import get_current_user
-from app.db_depends import get_async_db
+from app.db_depends import get_async_db, get_async_db_read
 from app.models import User
 from app.repositories.categories import CategoryRepository
 from app.repositories.dependencies import get_category_repository
-from app.schemas import CategoryCreate
+from app.schemas import CategoryCreate, CategoryTreeSchema
+from app.utils.conditional import check_not_modified, make_etag
 
 
-async def get_all_categories_services(db: AsyncSession = Depends(get_async_db),
+async def get_all_categories_services(db: AsyncSession = Depends(get_async_db_read),
                                       category_repo: CategoryRepository = Depends(get_category_repository)):
     categories = await category_repo.get_all_active_categories(db)
     return categories
 
 
+async def categories_not_modified_services(request: Request,
+                                           response: Response,
+                                           db: AsyncSession = Depends(get_async_db_read),
+                                           category_repo: CategoryRepository = Depends(get_category_repository)):
+    """
+    Условный GET списка категорий по счётчику версий справочника: один запрос к data_versions вместо выборки.
+    """
+    version, updated_at = await category_repo.get_categories_version(db)
+    check_not_modified(request, response, make_etag(request.url.path, version), updated_at)
+
+
+async def get_category_tree_services(db: AsyncSession = Depends(get_async_db_read),
+                                     category_repo: CategoryRepository = Depends(get_category_repository)):
+    """
+    Возвращает дерево активных категорий из in-process снимка: база читается, только когда снимок устарел.
+    """
+    tree = await category_repo.get_category_tree(db)
+    return CategoryTreeSchema(version=tree.version, items=tree.as_nested())
+
+
 async def create_category_services(category_data: CategoryCreate,
-                                   db: AsyncSession = Depends(get_async_db),
+                                   db: AsyncSession = Depends(get_async_db, scope="function"),
                                    category_repo: CategoryRepository = Depends(get_category_repository)
                                    ):
     category = await category_repo.create_category(db, category_data)
@@ -25,7 +46,7 @@ async def create_category_services(category_data: CategoryCreate,
 
 async def update_category_services(category_id: int,
                                    category: CategoryCreate,
-                                   db: AsyncSession = Depends(get_async_db),
+                                   db: AsyncSession = Depends(get_async_db, scope="function"),
                                    category_repo: CategoryRepository = Depends(get_category_repository)
                                    ):
     category = await category_repo.update_category(db, category_id, category)
@@ -33,7 +54,7 @@ async def update_category_services(category_id: int,
 
 
 async def delete_category_services(category_id: int,
-                                   db: AsyncSession = Depends(get_async_db),
+                                   db: AsyncSession = Depends(get_async_db, scope="function"),
                                    category_repo: CategoryRepository = Depends(get_category_repository)
                                    ):
     await category_repo.delete_category(db, category_id)
@@ -0,0 +1,149 @@
+import asyncio
+import codecs
+import csv
+import itertools
+import time
+from typing import Annotated, TextIO
+
+from fastapi import Depends, HTTPException, UploadFile, status
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth import get_current_seller
+from app.config import settings
+from app.db_depends import get_async_db
+from app.models import User
+from app.repositories.dependencies import get_product_repository
+from app.repositories.products import ProductRepository, PRODUCT_IMPORT_COLUMNS
+from app.response_cache import invalidate_catalog_after_commit
+from app.schemas import ProductImportRow
+from app.services.autocomplete import index_products_after_commit, refresh_product_name_index_after_commit
+
+# Колонки CSV, которые обязаны быть в заголовке, и все колонки, которые читает импорт
+REQUIRED_IMPORT_COLUMNS = frozenset(name for name, field in ProductImportRow.model_fields.items()
+                                    if field.is_required())
+IMPORT_COLUMNS = frozenset(ProductImportRow.model_fields)
+
+
+def read_import_chunk(reader: csv.DictReader, size: int) -> tuple[int, list[tuple], list[dict]]:
+    """
+    Читает из CSV до size строк и проверяет их по ProductImportRow. Выполняется в потоке.
+
+    :return: (прочитано строк, записи для COPY в порядке PRODUCT_IMPORT_COLUMNS, отклонённые строки)
+    """
+    rows = 0
+    records = []
+    rejects = []
+    for row in itertools.islice(reader, size):
+        rows += 1
+        # Пустая ячейка - отсутствующее значение необязательного поля
+        values = {name: value for name, value in row.items() if name in IMPORT_COLUMNS and value != ''}
+        try:
+            item = ProductImportRow.model_validate(values)
+        except ValidationError as e:
+            rejects.append({'line': reader.line_num, 'detail': e.errors(include_url=False, include_context=False)})
+            continue
+        records.append((reader.line_num, *(getattr(item, name) for name in PRODUCT_IMPORT_COLUMNS[1:])))
+    return rows, records, rejects
+
+
+async def import_products_csv(db: AsyncSession,
+                              file: TextIO,
+                              seller_id: int,
+                              products_repo: ProductRepository | None = None
+                              ) -> tuple[dict, list[tuple[int, str]] | None]:
+    """
+    Импортирует каталог продавца из CSV (заголовок - имена полей ProductImportRow) в транзакции db.
+
+    Файл читается и проверяется пачками по settings.import_chunk_size строк в потоке; пока пачка
+    загружается COPY в промежуточную таблицу, следующая уже разбирается. Затем один запрос
+    переносит строки в товары: новые артикулы создаются, известные обновляются.
+    Отклонённые строки (ошибка проверки, нет категории) пропускаются и попадают в отчёт.
+
+    :raises HTTPException: 400, если в заголовке CSV нет обязательных колонок
+    :return: Отчёт в форме ProductImportReport и (id, название) созданных и обновлённых товаров
+        (None, если их больше settings.import_index_max_products)
+    """
+    products_repo = products_repo or ProductRepository()
+    started = time.perf_counter()
+    reader = csv.DictReader(file)
+    fieldnames = await asyncio.to_thread(lambda: reader.fieldnames)
+    missing = REQUIRED_IMPORT_COLUMNS.difference(fieldnames or ())
+    if missing:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"CSV header must contain columns: {', '.join(sorted(missing))}")
+
+    await products_repo.create_import_staging(db)
+    rows = 0
+    staged = 0
+    rejected = 0
+    rejects = []
+
+    def read_next_chunk() -> asyncio.Future:
+        return asyncio.ensure_future(asyncio.to_thread(read_import_chunk, reader, settings.import_chunk_size))
+
+    next_chunk = read_next_chunk()
+    try:
+        while True:
+            chunk_rows, records, chunk_rejects = await next_chunk
+            if not chunk_rows:
+                break
+            next_chunk = read_next_chunk()
+            rows += chunk_rows
+            rejected += len(chunk_rejects)
+            rejects.extend(chunk_rejects[:settings.import_max_rejects - len(rejects)])
+            if records:
+                await products_repo.copy_import_records(db, records)
+                staged += len(records)
+    finally:
+        # Поток, читающий следующую пачку, не прервать: дожидаемся его, чтобы файл не закрыли под ним
+        await asyncio.gather(next_chunk, return_exceptions=True)
+
+    category_rejected, category_rejects = await products_repo.get_import_category_rejects(db,
+                                                                                           settings.import_max_rejects)
+    rejected += category_rejected
+    rejects.extend({'line': line, 'detail': f'Category with id {category_id} not found or inactive'}
+                   for line, category_id in category_rejects)
+    rejects.sort(key=lambda reject: reject['line'])
+
+    inserted, updated, unique, products = await products_repo.upsert_imported_products(
+        db, seller_id, settings.import_index_max_products)
+    if inserted or updated:
+        invalidate_catalog_after_commit(db)
+
+    seconds = time.perf_counter() - started
+    report = {
+        "rows": rows,
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": unique - inserted - updated,
+        "duplicates": staged - category_rejected - unique,
+        "rejected": rejected,
+        "rejects": rejects[:settings.import_max_rejects],
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds, 1) if seconds else 0.0,
+    }
+    return report, products
+
+
+async def import_products_services(file: UploadFile,
+                                   db: Annotated[AsyncSession, Depends(get_async_db, scope="function")],
+                                   current_user: Annotated[User, Depends(get_current_seller)],
+                                   products_repo: Annotated[ProductRepository, Depends(get_product_repository)]):
+    """
+    Импорт каталога продавца из загруженного CSV-файла (UTF-8, разделитель - запятая).
+    После коммита созданные и обновлённые товары добавляются в индекс подсказок; после очень большого
+    импорта индекс перестраивается из базы в фоне.
+    """
+    # Декодер поверх файла без его закрытия (закроет сам UploadFile); TextIOWrapper не подходит:
+    # SpooledTemporaryFile до Python 3.11 не реализует readable()
+    text = codecs.getreader('utf-8-sig')(file.file)
+    try:
+        report, products = await import_products_csv(db, text, current_user.id, products_repo)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="CSV file must be UTF-8 encoded")
+    if products is None:
+        refresh_product_name_index_after_commit(db)
+    else:
+        index_products_after_commit(db, products)
+    return report
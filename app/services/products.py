@@ -1,23 +1,76 @@
-from fastapi import Depends, HTTPException, status, Path
+import asyncio
+from datetime import datetime, timezone
+
+from fastapi import Depends, HTTPException, status, Path, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.auth import get_current_seller
-from app.db_depends import get_async_db
+from app.db_depends import get_async_db, get_async_db_read, get_read_session_manager
 from app.models import User, ProductModel
 from app.repositories.dependencies import get_product_repository, get_sort_params
-from app.repositories.products import ProductRepository
-from app.schemas import (ProductCreate, ProductUpdate, ProductList, ProductOut, SortParams, SortOrderEnum,
-                         SortFieldEnum,
-                         PageValidateSchema, ProductFilterParamsSchema)
+from app.repositories.categories import CategoryRepository
+from app.repositories.products import ProductRepository, category_condition, leaves_filtered_lists
+from app.response_cache import PRODUCT_LIST_TAG, PRODUCT_DETAIL_TAG, CATEGORIES_TAG, product_tag, category_tag
+from app.schemas import (ProductCreate, ProductUpdate, ProductList, ProductOut, ProductSchema, SortParams,
+                         SortOrderEnum, SortFieldEnum,
+                         PageValidateSchema, ProductFilterParamsSchema, ProductSearchSchema, sparse_model,
+                         ProductBulkRequest, ProductBulkUpdateItem, ExportFormatEnum)
+from app.services.autocomplete import index_product_after_commit, index_products_after_commit
 from app.services.enum import UserRoles
+from app.utils.pagination import decode_cursor, page_cursors
+from app.utils.products import build_prefix_tsquery
+from app.utils.conditional import check_not_modified, make_etag
+from app.utils.export import csv_lines, ndjson_lines
+from app.utils.json_response import FastJSONResponse, rows_as_dicts
+from app.utils.response_cache import cache_key, tag_response
 from typing import Annotated
 
+# Поля товара в ответах списков
+PRODUCT_OUT_FIELDS = tuple(ProductOut.model_fields)
+
+# Параметр facets списка товаров категории: общий для обработчика и проверки условного GET
+FacetsQuery = Annotated[bool, Query(description="Добавить в ответ фасеты: подкатегории, продавцы, "
+                                                "диапазоны цен и наличие")]
+
+
+def product_fields_dependency(schema: type[ProductOut | ProductSchema]):
+    """
+    Зависимость для параметра fields= (sparse fieldsets): список полей schema через запятую.
+    Возвращает кортеж запрошенных полей в порядке schema (id добавляется всегда) или None, если нужны все поля.
+
+    :raises HTTPException: 400, если запрошено поле, которого нет в schema
+    """
+    known = tuple(schema.model_fields)
+
+    def get_fields(fields: Annotated[str | None, Query(description=f"Поля товара в ответе через запятую: "
+                                                                   f"{', '.join(known)}")] = None
+                   ) -> tuple[str, ...] | None:
+        if fields is None:
+            return None
+        requested = {name.strip() for name in fields.split(',') if name.strip()}
+        unknown = requested.difference(known)
+        if unknown:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"Неизвестные поля: {', '.join(sorted(unknown))}")
+        requested.add('id')
+        return tuple(name for name in known if name in requested)
+
+    return get_fields
+
+
+get_list_fields = product_fields_dependency(ProductOut)
+get_detail_fields = product_fields_dependency(ProductSchema)
+
 
 async def get_all_products_services(pagination_params: Annotated[PageValidateSchema, Depends()],
-                                    db: Annotated[AsyncSession, Depends(get_async_db)],
+                                    db: Annotated[AsyncSession, Depends(get_async_db_read)],
                                     filters: Annotated[ProductFilterParamsSchema, Depends()],
                                     sort_params: Annotated[SortParams, Depends(get_sort_params)],
-                                    products_repo: Annotated[ProductRepository, Depends(get_product_repository)]
+                                    products_repo: Annotated[ProductRepository, Depends(get_product_repository)],
+                                    response: Response,
+                                    fields: Annotated[tuple[str, ...] | None, Depends(get_list_fields)]
                                     ):
     """
     Возвращает список товаров с учетом фильтров и сортировки.
@@ -27,8 +80,10 @@ async def get_all_products_services(pagination_params: Annotated[PageValidateSch
     :param filters: Фильтры для товаров.
     :param sort_params: Параметры сортировки.
     :param products_repo: Репозиторий для работы с товарами.
+    :param response: Ответ с уже выставленными заголовками (ETag).
+    :param fields: Запрошенные поля товаров или None для всех полей ProductOut.
 
-    :return: Список товаров в виде ProductList.
+    :return: Готовый JSON-ответ в форме ProductList.
     """
 
     # Проверка логики min_price <= max_price
@@ -39,19 +94,190 @@ async def get_all_products_services(pagination_params: Annotated[PageValidateSch
                                filters.min_price,
                                filters.max_price,
                                filters.in_stock,
-                               filters.seller_id)
+                               filters.seller_id,
+                               await get_subcategory_ids(db, filters.category_id, filters.include_subcategories))
 
     # Применяем сортировку
-    order_sorting_list = get_order_sorting_list(sort_params)
+    sort_keys = get_sort_keys(sort_params)
+
+    if pagination_params.cursor is not None:
+        data = await products_repo.get_active_products_by_cursor(db,
+                                                                 pagination_params.page_size,
+                                                                 filters,
+                                                                 sort_keys,
+                                                                 decode_cursor(pagination_params.cursor, sort_keys),
+                                                                 pagination_params.total_mode,
+                                                                 get_list_columns(sort_keys, fields))
+    else:
+        data = await products_repo.get_all_active_products(db,
+                                                           pagination_params.page,
+                                                           pagination_params.page_size,
+                                                           filters,
+                                                           get_order_sorting_list(sort_params),
+                                                           pagination_params.total_mode,
+                                                           get_list_columns(sort_keys, fields)
+                                                           )
+        data.update(get_page_cursors(data, sort_keys))
+    tag_response(PRODUCT_LIST_TAG)
+    return product_list_response(data, response, fields)
+
+
+async def search_products_services(search_params: Annotated[ProductSearchSchema, Depends()],
+                                   filters: Annotated[ProductFilterParamsSchema, Depends()],
+                                   db: Annotated[AsyncSession, Depends(get_async_db_read)],
+                                   products_repo: Annotated[ProductRepository, Depends(get_product_repository)],
+                                   response: Response,
+                                   fields: Annotated[tuple[str, ...] | None, Depends(get_list_fields)]
+                                   ):
+    """
+    Полнотекстовый поиск активных товаров по названию и описанию с учётом фильтров списка товаров.
+
+    :param search_params: Поисковая строка и параметры пагинации.
+    :param filters: Фильтры для товаров.
+    :param db: Сессия к базе данных.
+    :param products_repo: Репозиторий для работы с товарами.
+    :param fields: Запрошенные поля товаров или None для всех полей ProductOut.
+
+    :return: Готовый JSON-ответ в форме ProductList, самые релевантные товары первыми.
+    """
+    tsquery = build_prefix_tsquery(search_params.q)
+    if tsquery is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Поисковая строка должна содержать хотя бы одно слово")
+
+    # Проверка логики min_price <= max_price
+    validate_price_range(filters.min_price, filters.max_price)
 
-    data = await products_repo.get_all_active_products(db,
-                                                       pagination_params.page,
-                                                       pagination_params.page_size,
-                                                       filters,
-                                                       order_sorting_list
-                                                       )
-    data['items'] = [ProductOut.model_validate(product) for product in data['items']]
-    return ProductList(**data)
+    # Формируем список фильтров
+    filters = get_list_filters(filters.category_id,
+                               filters.min_price,
+                               filters.max_price,
+                               filters.in_stock,
+                               filters.seller_id,
+                               await get_subcategory_ids(db, filters.category_id, filters.include_subcategories))
+
+    data = await products_repo.search_products(db,
+                                               tsquery,
+                                               search_params.page_size,
+                                               filters,
+                                               search_params.cursor,
+                                               search_params.total_mode,
+                                               get_list_columns([], fields))
+    return product_list_response(data, response, fields)
+
+
+EXPORT_MEDIA_TYPES = {ExportFormatEnum.ndjson: 'application/x-ndjson', ExportFormatEnum.csv: 'text/csv; charset=utf-8'}
+
+
+async def export_products_services(
+        filters: Annotated[ProductFilterParamsSchema, Depends()],
+        fields: Annotated[tuple[str, ...] | None, Depends(get_detail_fields)],
+        export_format: Annotated[ExportFormatEnum, Query(alias="format", description="Формат выгрузки")]
+        = ExportFormatEnum.ndjson):
+    """
+    Потоковая выгрузка всех товаров под фильтрами списка (NDJSON или CSV) в порядке id.
+
+    Параметры проверяются до начала ответа, а база читается уже в генераторе ответа через
+    серверный курсор в собственной сессии: строки отправляются клиенту пачками по мере чтения,
+    память не зависит от размера каталога, а соединение занято только на время выгрузки.
+
+    :return: StreamingResponse с файлом products-<дата>.<формат>
+    """
+    validate_price_range(filters.min_price, filters.max_price)
+    fields = fields or tuple(ProductSchema.model_fields)
+    columns = [getattr(ProductModel, field) for field in fields]
+
+    async def body():
+        if export_format == ExportFormatEnum.csv:
+            # Заголовок уходит сразу, ещё до первого запроса к базе
+            yield csv_lines((), fields, header=True)
+        async with get_read_session_manager() as db:
+            conditions = get_list_filters(filters.category_id,
+                                          filters.min_price,
+                                          filters.max_price,
+                                          filters.in_stock,
+                                          filters.seller_id,
+                                          await get_subcategory_ids(db, filters.category_id,
+                                                                    filters.include_subcategories))
+            async for rows in ProductRepository().stream_products(db, conditions, columns):
+                if export_format == ExportFormatEnum.csv:
+                    yield csv_lines(rows, fields)
+                else:
+                    yield ndjson_lines(rows, fields)
+
+    filename = f'products-{datetime.now(timezone.utc):%Y%m%d}.{export_format.value}'
+    return StreamingResponse(body(),
+                             media_type=EXPORT_MEDIA_TYPES[export_format],
+                             headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+async def products_not_modified_services(request: Request,
+                                        response: Response,
+                                        filters: Annotated[ProductFilterParamsSchema, Depends()],
+                                        db: Annotated[AsyncSession, Depends(get_async_db_read)],
+                                        products_repo: Annotated[ProductRepository, Depends(get_product_repository)]
+                                        ):
+    """
+    Условный GET списка товаров: ETag из параметров запроса, max(updated_at) подходящих товаров
+    и версии товаров. Выполняется до загрузки списка и при совпадении отвечает 304.
+    Проверка не считает выборку целиком, поэтому не отменяет выигрыш total_mode=none/estimated.
+
+    If-Modified-Since для списков не проверяется: товар, выпавший из выборки, не сдвигает max(updated_at).
+    """
+    conditions = get_list_filters(filters.category_id,
+                                  filters.min_price,
+                                  filters.max_price,
+                                  filters.in_stock,
+                                  filters.seller_id,
+                                  await get_subcategory_ids(db, filters.category_id, filters.include_subcategories))
+    last_modified, version = await products_repo.get_list_validators(db, conditions)
+    check_not_modified(request, response, make_etag(cache_key(request.scope), last_modified, version), last_modified,
+                       use_if_modified_since=False)
+
+
+async def category_products_not_modified_services(
+        request: Request,
+        response: Response,
+        category_id: Annotated[int, Path(gt=0)],
+        filters: Annotated[ProductFilterParamsSchema, Depends()],
+        db: Annotated[AsyncSession, Depends(get_async_db_read)],
+        products_repo: Annotated[ProductRepository, Depends(get_product_repository)],
+        facets: FacetsQuery = False):
+    """
+    Условный GET списка товаров категории. С фасетами проверяются все товары, по которым они
+    считаются (категория с подкатегориями), а в ETag входят и названия этих подкатегорий.
+    """
+    scope_ids = None
+    category_names = None
+    if filters.include_subcategories or facets:
+        tree = await CategoryRepository().get_category_tree(db)
+        if filters.include_subcategories:
+            scope_ids = tree.subtree_ids(category_id)
+        elif facets:
+            scope_ids = [category_id, *tree.children.get(category_id, ())]
+        if facets:
+            category_names = [(scope_id, tree.names.get(scope_id)) for scope_id in scope_ids]
+
+    conditions = [category_condition(category_id, scope_ids),
+                  *get_list_filters(None, filters.min_price, filters.max_price, filters.in_stock, filters.seller_id)]
+    last_modified, version = await products_repo.get_list_validators(db, conditions)
+    etag = make_etag(cache_key(request.scope), last_modified, version, category_names)
+    check_not_modified(request, response, etag, last_modified, use_if_modified_since=False)
+
+
+async def product_not_modified_services(request: Request,
+                                        response: Response,
+                                        product_id: int,
+                                        db: Annotated[AsyncSession, Depends(get_async_db_read)],
+                                        products_repo: Annotated[ProductRepository, Depends(get_product_repository)]
+                                        ):
+    """
+    Условный GET карточки товара по его updated_at. Если товара нет, ответ 404 вернёт основной обработчик.
+    В ETag входят и параметры запроса: ответы с разными fields= различаются.
+    """
+    updated_at = await products_repo.get_product_updated_at(db, product_id)
+    if updated_at is not None:
+        check_not_modified(request, response, make_etag(cache_key(request.scope), updated_at), updated_at)
 
 
 def validate_price_range(min_price: float | None, max_price: float | None) -> None:
@@ -61,11 +287,24 @@ def validate_price_range(min_price: float | None, max_price: float | None) -> No
             detail="min_price не может быть больше max_price")
 
 
-def get_list_filters(category_id, min_price, max_price, in_stock, seller_id):
+async def get_subcategory_ids(db: AsyncSession,
+                              category_id: int | None,
+                              include_subcategories: bool) -> list[int] | None:
+    """
+    Возвращает id категории вместе со всеми её подкатегориями из снимка дерева категорий
+    или None, если подкатегории учитывать не нужно.
+    """
+    if category_id is None or not include_subcategories:
+        return None
+    tree = await CategoryRepository().get_category_tree(db)
+    return tree.subtree_ids(category_id)
+
+
+def get_list_filters(category_id, min_price, max_price, in_stock, seller_id, category_ids=None):
     filters = [ProductModel.is_active.is_(True)]
 
     if category_id is not None:
-        filters.append(ProductModel.category_id == category_id)
+        filters.append(category_condition(category_id, category_ids))
     if min_price is not None:
         filters.append(ProductModel.price >= min_price)
     if max_price is not None:
@@ -77,26 +316,65 @@ def get_list_filters(category_id, min_price, max_price, in_stock, seller_id):
     return filters
 
 
-def get_order_sorting_list(sort_params: SortParams):
-    order_clauses = []
+def get_sort_keys(sort_params: SortParams) -> list:
+    """
+    Возвращает ключи сортировки в виде пар (колонка, по убыванию).
+    Последним ключом всегда идёт id, поэтому порядок однозначен и годится для keyset-пагинации.
+    id сортируется в том же направлении, что и основное поле: так весь ORDER BY читается
+    одним проходом индекса (поле, id) в прямом или обратном порядке.
+    """
+    descending = sort_params.order == SortOrderEnum.desc
 
     # Добавляем основную сортировку
-    column = getattr(ProductModel, sort_params.field)
-    if sort_params.order == SortOrderEnum.desc:
-        order_clauses.append(column.desc())
-    else:
-        order_clauses.append(column.asc())
+    sort_keys = [(getattr(ProductModel, sort_params.field), descending)]
 
     # Добавляем сортировку по ID для стабильности
     if sort_params.field != SortFieldEnum.id:
-        order_clauses.append(ProductModel.id)
+        sort_keys.append((ProductModel.id, descending))
 
-    return order_clauses
+    return sort_keys
+
+
+def get_order_sorting_list(sort_params: SortParams):
+    return [column.desc() if descending else column.asc() for column, descending in get_sort_keys(sort_params)]
+
+
+def get_list_columns(sort_keys: list, fields: tuple[str, ...] | None = None) -> list:
+    """
+    Колонки для выборки страницы списка: запрошенные поля (по умолчанию все поля ProductOut)
+    и ключи сортировки (по ним строятся курсоры).
+    """
+    fields = fields or PRODUCT_OUT_FIELDS
+    columns = [getattr(ProductModel, field) for field in fields]
+    columns.extend(column for column, _ in sort_keys if column.key not in fields)
+    return columns
+
+
+def product_list_response(data: dict, response: Response, fields: tuple[str, ...] | None = None) -> FastJSONResponse:
+    """
+    Собирает ответ списка товаров из строк выборки без промежуточных моделей: строки сразу
+    превращаются в словари и кодируются orjson, а повторная проверка по response_model не выполняется.
+    Заголовки, выставленные зависимостями (ETag, Last-Modified), переносятся в ответ.
+    С fields= в товарах только запрошенные поля: get_list_fields уже вернула их в порядке ProductOut и с id.
+    """
+    data['items'] = rows_as_dicts(data['items'], PRODUCT_OUT_FIELDS if fields is None else fields)
+    content = {name: data.get(name, field.default) for name, field in ProductList.model_fields.items()}
+    return FastJSONResponse(content, headers=dict(response.headers))
+
+
+def get_page_cursors(data: dict, sort_keys: list) -> dict:
+    """
+    Курсоры для ответа в режиме page, чтобы с любой страницы можно было перейти на keyset-пагинацию.
+    """
+    return page_cursors(data['items'],
+                        sort_keys,
+                        has_next=data['has_more'],
+                        has_prev=data['page'] > 1)
 
 
 async def create_product_services(
         product_data: ProductCreate,
-        db: AsyncSession = Depends(get_async_db),
+        db: AsyncSession = Depends(get_async_db, scope="function"),
         current_user: User = Depends(get_current_seller),
         products_repo: ProductRepository = Depends(get_product_repository),
 ):
@@ -104,62 +382,243 @@ async def create_product_services(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Only sellers can perform this action")
 
     product = await products_repo.create_product(db, product_data, current_user)
+    index_product_after_commit(db, product)
     return product
 
 
+def bulk_error(index: int, status_code: int, detail) -> dict:
+    return {"index": index, "status": status_code, "id": None, "detail": detail}
+
+
+def bulk_result(results: list[dict]) -> dict:
+    succeeded = sum(result["detail"] is None for result in results)
+    return {"succeeded": succeeded, "failed": len(results) - succeeded, "items": results}
+
+
+def validate_bulk_items(items: list[dict], schema, results: list[dict | None]) -> list:
+    """
+    Проверяет элементы пакета по schema по одному: ошибки записываются в results (422),
+    возвращаются пары (позиция, модель) для прошедших проверку.
+    """
+    valid = []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, schema.model_validate(item)))
+        except ValidationError as e:
+            results[index] = bulk_error(index, status.HTTP_422_UNPROCESSABLE_CONTENT,
+                                        e.errors(include_url=False, include_context=False))
+    return valid
+
+
+async def bulk_create_products_services(
+        payload: ProductBulkRequest,
+        db: Annotated[AsyncSession, Depends(get_async_db, scope="function")],
+        current_user: Annotated[User, Depends(get_current_seller)],
+        products_repo: Annotated[ProductRepository, Depends(get_product_repository)]):
+    """
+    Создаёт пакет товаров. Категории всех товаров проверяются одним запросом, вставка идёт
+    многострочными INSERT ... RETURNING, коммит - один на весь пакет.
+    Товары с ошибками пропускаются, остальные создаются.
+
+    :return: Результат по каждому элементу в порядке запроса (201 с id или статус ошибки).
+    """
+    results: list[dict | None] = [None] * len(payload.items)
+    valid = validate_bulk_items(payload.items, ProductCreate, results)
+
+    active_category_ids = await products_repo.get_active_category_ids(db, {product.category_id
+                                                                            for _, product in valid})
+    to_create = []
+    for index, product in valid:
+        if product.category_id in active_category_ids:
+            to_create.append((index, product))
+        else:
+            results[index] = bulk_error(index, status.HTTP_400_BAD_REQUEST,
+                                        f'Category with id {product.category_id} not found or inactive')
+
+    product_ids = await products_repo.bulk_create_products(db, [product for _, product in to_create], current_user)
+    for (index, _), product_id in zip(to_create, product_ids):
+        results[index] = {"index": index, "status": status.HTTP_201_CREATED, "id": product_id, "detail": None}
+    index_products_after_commit(db, [(product_id, product.name)
+                                     for (_, product), product_id in zip(to_create, product_ids)])
+    return bulk_result(results)
+
+
+async def bulk_update_products_services(
+        payload: ProductBulkRequest,
+        db: Annotated[AsyncSession, Depends(get_async_db, scope="function")],
+        current_user: Annotated[User, Depends(get_current_seller)],
+        products_repo: Annotated[ProductRepository, Depends(get_product_repository)]):
+    """
+    Частично обновляет пакет товаров продавца. Товары и категории пакета читаются двумя запросами,
+    обновление выполняется пакетами UPDATE, коммит - один на весь пакет.
+    Товары с ошибками (нет товара, чужой товар, нет категории) пропускаются, остальные обновляются.
+
+    :return: Результат по каждому элементу в порядке запроса (200 с id или статус ошибки).
+    """
+    results: list[dict | None] = [None] * len(payload.items)
+    valid = []
+    seen = set()
+    for index, item in validate_bulk_items(payload.items, ProductBulkUpdateItem, results):
+        if item.id in seen:
+            results[index] = bulk_error(index, status.HTTP_400_BAD_REQUEST,
+                                        f'Product with id {item.id} is listed more than once')
+        else:
+            seen.add(item.id)
+            valid.append((index, item))
+
+    products = await products_repo.get_products_by_ids(db, seen)
+    active_category_ids = await products_repo.get_active_category_ids(db, {item.category_id for _, item in valid
+                                                                            if item.category_id is not None})
+    updates = []
+    category_ids = set()
+    indexed = []
+    leaves_lists = False
+    for index, item in valid:
+        product = products.get(item.id)
+        if product is None:
+            results[index] = bulk_error(index, status.HTTP_404_NOT_FOUND, 'Products not found')
+        elif product.seller_id != current_user.id:
+            results[index] = bulk_error(index, status.HTTP_403_FORBIDDEN, 'You can only update your own products')
+        elif item.category_id is not None and item.category_id not in active_category_ids:
+            results[index] = bulk_error(index, status.HTTP_400_BAD_REQUEST,
+                                        f'Category with id {item.category_id} not found')
+        else:
+            results[index] = {"index": index, "status": status.HTTP_200_OK, "id": item.id, "detail": None}
+            values = item.model_dump(exclude_unset=True, exclude_none=True)
+            # Элемент без изменяемых полей обновлять не нужно
+            if len(values) > 1:
+                updates.append(values)
+                category_ids.update({product.category_id, values.get('category_id', product.category_id)})
+                leaves_lists = leaves_lists or leaves_filtered_lists(product, values)
+                if 'name' in values and product.is_active:
+                    indexed.append((item.id, values['name']))
+
+    await products_repo.bulk_update_products(db, updates, category_ids, leaves_lists)
+    index_products_after_commit(db, indexed)
+    return bulk_result(results)
+
+
+async def _category_facets(products_repo: ProductRepository,
+                           category_id: int,
+                           filters: list,
+                           facet_groups: dict[int, int] | None) -> dict:
+    """
+    Фасеты списка категории в собственной сессии чтения: сессия не выполняет два запроса сразу,
+    а так запрос фасетов идёт по второму соединению одновременно с запросом страницы.
+    """
+    async with get_read_session_manager() as db:
+        return await products_repo.get_category_facets(db, category_id, filters, facet_groups)
+
+
 async def get_products_by_category_services(pagination_params: Annotated[PageValidateSchema, Depends()],
                                             filters: Annotated[ProductFilterParamsSchema, Depends()],
                                             sort_params: Annotated[SortParams, Depends(get_sort_params)],
                                             category_id: Annotated[int, Path(gt=0)],
-                                            db: Annotated[AsyncSession, Depends(get_async_db)],
+                                            db: Annotated[AsyncSession, Depends(get_async_db_read)],
                                             products_repo: Annotated[
-                                                ProductRepository, Depends(get_product_repository)]):
+                                                ProductRepository, Depends(get_product_repository)],
+                                            response: Response,
+                                            fields: Annotated[tuple[str, ...] | None, Depends(get_list_fields)],
+                                            facets: FacetsQuery = False):
     # Проверка логики min_price <= max_price
     validate_price_range(filters.min_price, filters.max_price)
+    include_subcategories = filters.include_subcategories
 
-    # Формируем список фильтров
-    filters = get_list_filters(filters.category_id,
+    # Формируем список фильтров. Категория задаётся путём: одноимённое поле фильтров FastAPI
+    # заполняет тем же значением из пути, поэтому отдельным условием его не добавляем
+    filters = get_list_filters(None,
                                filters.min_price,
                                filters.max_price,
                                filters.in_stock,
                                filters.seller_id)
 
-    # Применяем сортировку
-    order_sorting_list = get_order_sorting_list(sort_params)
-
-    data = await products_repo.get_products_by_category_id(db,
-                                                           category_id,
-                                                           pagination_params.page,
-                                                           pagination_params.page_size,
-                                                           filters,
-                                                           order_sorting_list)
+    # Подкатегории категории из пути берутся из того же снимка дерева
+    category_ids = None
+    facet_groups = None
+    if include_subcategories:
+        tree = await CategoryRepository().get_category_tree(db)
+        category_ids = tree.subtree_ids(category_id)
+        facet_groups = tree.facet_groups(category_id)
 
-    data['items'] = [ProductOut.model_validate(product) for product in data['items']]
-    return ProductList(**data)
+    # Применяем сортировку
+    sort_keys = get_sort_keys(sort_params)
+
+    # Фасеты считаются в своей сессии чтения параллельно со страницей, а не отдельным обменом с базой после неё
+    facets_task = None
+    if facets:
+        facets_task = asyncio.create_task(_category_facets(products_repo, category_id, filters, facet_groups))
+    try:
+        if pagination_params.cursor is not None:
+            data = await products_repo.get_products_by_category_cursor(db,
+                                                                       category_id,
+                                                                       pagination_params.page_size,
+                                                                       filters,
+                                                                       sort_keys,
+                                                                       decode_cursor(pagination_params.cursor, sort_keys),
+                                                                       pagination_params.total_mode,
+                                                                       category_ids,
+                                                                       get_list_columns(sort_keys, fields))
+        else:
+            data = await products_repo.get_products_by_category_id(db,
+                                                                   category_id,
+                                                                   pagination_params.page,
+                                                                   pagination_params.page_size,
+                                                                   filters,
+                                                                   get_order_sorting_list(sort_params),
+                                                                   pagination_params.total_mode,
+                                                                   category_ids,
+                                                                   get_list_columns(sort_keys, fields))
+            data.update(get_page_cursors(data, sort_keys))
+    except BaseException:
+        if facets_task is not None:
+            facets_task.cancel()
+        raise
+
+    if facets_task is not None:
+        data['facets'] = await facets_task
+    tag_response(CATEGORIES_TAG, *map(category_tag, category_ids or [category_id]))
+    return product_list_response(data, response, fields)
 
 
 async def get_product_services(product_id: int,
-                               db: AsyncSession = Depends(get_async_db),
-                               products_repo: ProductRepository = Depends(get_product_repository)
+                               response: Response,
+                               db: AsyncSession = Depends(get_async_db_read),
+                               products_repo: ProductRepository = Depends(get_product_repository),
+                               fields: tuple[str, ...] | None = Depends(get_detail_fields)
                                ):
-    product = await products_repo.get_product_id(db, product_id)
-    return product
+    """
+    Карточка товара. С fields= из базы читаются только запрошенные колонки, а ответ
+    сериализуется закешированной урезанной моделью ProductSchema.
+    """
+    if fields is None:
+        product = await products_repo.get_product_id(db, product_id)
+        tag_response(PRODUCT_DETAIL_TAG, product_tag(product_id))
+        return product
+
+    row = await products_repo.get_product_id(db, product_id, tuple(getattr(ProductModel, field) for field in fields))
+    tag_response(PRODUCT_DETAIL_TAG, product_tag(product_id))
+    # Заголовки, выставленные зависимостями (ETag, Last-Modified), переносятся в ответ
+    return Response(sparse_model(ProductSchema, fields).model_validate(row).model_dump_json(),
+                    media_type='application/json',
+                    headers=dict(response.headers))
 
 
 async def update_product_services(product_id: Annotated[int, Path(gt=0)],
                                   product_update: Annotated[ProductUpdate, Depends()],
-                                  db: Annotated[AsyncSession, Depends(get_async_db)],
+                                  db: Annotated[AsyncSession, Depends(get_async_db, scope="function")],
                                   current_user: Annotated[User, Depends(get_current_seller)],
                                   products_repo: Annotated[ProductRepository, Depends(get_product_repository)]
                                   ):
     product = await products_repo.update_product(db, product_id, product_update, current_user)
+    index_product_after_commit(db, product)
     return product
 
 
 async def delete_product_services(product_id: int,
-                                  db: AsyncSession = Depends(get_async_db),
+                                  db: AsyncSession = Depends(get_async_db, scope="function"),
                                   current_user: User = Depends(get_current_seller),
                                   products_repo: ProductRepository = Depends(get_product_repository)
                                   ):
     product = await products_repo.delete_product(db, product_id, current_user)
+    index_product_after_commit(db, product)
     return product
@@ -1,42 +1,84 @@
+from typing import Annotated
+
 from fastapi import Depends, Path
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.auth import get_current_user
-from app.db_depends import get_async_db
-from app.models import User
+from app.auth import get_current_user_primary
+from app.db_depends import get_async_db, get_async_db_read
+from app.models import User, Reviews
 from app.repositories.dependencies import get_review_repository
 from app.repositories.reviews import ReviewRepository
-from app.schemas import ReviewsCreate, ReviewsSchema
+from app.schemas import (ReviewsCreate, ReviewsSchema, ReviewList, ReviewPageSchema, ReviewFilterParamsSchema,
+                         SortOrderEnum)
+from app.utils.pagination import Cursor, decode_cursor
 
 
 async def get_all_reviews_services(
-        db: AsyncSession = Depends(get_async_db),
+        pagination_params: Annotated[ReviewPageSchema, Depends()],
+        filters: Annotated[ReviewFilterParamsSchema, Depends()],
+        db: AsyncSession = Depends(get_async_db_read),
         reviews_repo: ReviewRepository = Depends(get_review_repository),
 ):
     """
-    Возвращает список всех активных отзывов.
+    Возвращает страницу активных отзывов.
 
+    :param pagination_params: Параметры пагинации и сортировки.
+    :param filters: Фильтры по оценке и автору.
     :param db: Сессия к базе данных.
     :param reviews_repo: Репозиторий для работы с отзывами.
-    :return: Список активных отзывов.
+    :return: Страница отзывов в виде ReviewList.
     """
-    reviews = await reviews_repo.get_all_reviews(db)
-    return reviews
+    sort_keys = get_review_sort_keys(pagination_params.order)
+    data = await reviews_repo.get_reviews_page(db,
+                                               get_review_filters(filters),
+                                               sort_keys,
+                                               pagination_params.page_size,
+                                               get_review_cursor(pagination_params.cursor, sort_keys))
+    return ReviewList(**data)
 
 
 async def get_product_reviews_services(
+        pagination_params: Annotated[ReviewPageSchema, Depends()],
+        filters: Annotated[ReviewFilterParamsSchema, Depends()],
         product_id: int = Path(..., ge=1, description="ID активного продукта"),
-        db: AsyncSession = Depends(get_async_db),
+        db: AsyncSession = Depends(get_async_db_read),
         reviews_repo: ReviewRepository = Depends(get_review_repository),
 ):
-    reviews = await reviews_repo.get_product_all_reviews(db, product_id)
-    return reviews
+    sort_keys = get_review_sort_keys(pagination_params.order)
+    data = await reviews_repo.get_product_reviews_page(db,
+                                                       product_id,
+                                                       get_review_filters(filters),
+                                                       sort_keys,
+                                                       pagination_params.page_size,
+                                                       get_review_cursor(pagination_params.cursor, sort_keys))
+    return ReviewList(**data)
+
+
+def get_review_filters(filters: ReviewFilterParamsSchema) -> list:
+    conditions = []
+    if filters.grade is not None:
+        conditions.append(Reviews.grade == filters.grade)
+    if filters.user_id is not None:
+        conditions.append(Reviews.user_id == filters.user_id)
+    return conditions
+
+
+def get_review_sort_keys(order: SortOrderEnum) -> list:
+    """
+    Отзывы сортируются по дате, id добавлен для однозначного порядка при одинаковой дате.
+    """
+    descending = order == SortOrderEnum.desc
+    return [(Reviews.comment_date, descending), (Reviews.id, descending)]
+
+
+def get_review_cursor(cursor: str | None, sort_keys: list) -> Cursor | None:
+    return decode_cursor(cursor, sort_keys) if cursor is not None else None
 
 
 async def create_review_services(
         review_data: ReviewsCreate,
-        db: AsyncSession = Depends(get_async_db),
-        current_user: User = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_db, scope="function"),
+        current_user: User = Depends(get_current_user_primary),
         reviews_repo: ReviewRepository = Depends(get_review_repository),
 ):
     """
@@ -51,9 +93,6 @@ async def create_review_services(
     """
     db_review = await reviews_repo.create_review(db, review_data, current_user)
 
-    #  Загружаем связанные данные (автора и продукт)
-    await db.refresh(db_review, ['author', 'product'])
-
     #  Формируем ответ со всеми полями
     return ReviewsSchema(
         id=db_review.id,
@@ -70,12 +109,11 @@ async def create_review_services(
 
 async def delete_review_services(
         review_id: int = Path(..., ge=1, description="ID активного комментария"),
-        db: AsyncSession = Depends(get_async_db),
-        current_user: User = Depends(get_current_user),
+        db: AsyncSession = Depends(get_async_db, scope="function"),
+        current_user: User = Depends(get_current_user_primary),
         reviews_repo: ReviewRepository = Depends(get_review_repository),
 ):
     review = await reviews_repo.delete_review(db, review_id, current_user)
-    await db.refresh(review, ['author', 'product'])
 
     return ReviewsSchema(
         id=review.id,
@@ -0,0 +1,304 @@
+import asyncio
+import bisect
+import heapq
+import re
+import sys
+import time
+from itertools import filterfalse, islice
+from typing import Awaitable, Callable, Iterable
+
+_WORD_START = re.compile(r'(?<!\w)\w')
+# Разделитель ключа и id: меньше любого печатного символа, поэтому не влияет на порядок префиксов
+_ID_SEPARATOR = '\x00'
+# Ключ хранит не весь хвост названия, а первые MAX_KEY_CHARS символов: длинные префиксы
+# дополнительно сверяются с названием, зато память почти не зависит от длины названий
+MAX_KEY_CHARS = 32
+# С какого числа новых ключей upsert_many сливает пакет с индексом в фоне, а не вставляет ключи
+# по одному: вставка сдвигает весь список (на миллионе ключей ~0.3 мс), так что пакет до порога
+# занимает event loop не дольше ~10 мс
+MERGE_THRESHOLD = 32
+# Сколько ключей сборка снимка обрабатывает между передачами управления event loop (единицы миллисекунд)
+BUILD_CHUNK_KEYS = 1000
+
+
+def normalize(text: str) -> str:
+    return text.casefold().replace('ё', 'е').replace(_ID_SEPARATOR, '').strip()
+
+
+def _word_suffixes(name: str) -> list[str]:
+    # Хвосты названия с начала каждого слова: "смартфон samsung galaxy", "samsung galaxy", "galaxy"
+    normalized = normalize(name)
+    return [normalized[match.start():] for match in _WORD_START.finditer(normalized)]
+
+
+def _word_keys(product_id: int, name: str) -> list[str]:
+    return [f'{suffix[:MAX_KEY_CHARS]}{_ID_SEPARATOR}{product_id}' for suffix in _word_suffixes(name)]
+
+
+async def _sorted_runs(products: Iterable[tuple[int, str]]) -> tuple[list[list[str]], int]:
+    """
+    Ключи товаров отсортированными кусками примерно по BUILD_CHUNK_KEYS и их общий размер в байтах.
+    Между кусками управление возвращается event loop.
+    """
+    runs, run, size = [], [], 0
+    for product_id, name in products:
+        run.extend(_word_keys(product_id, name))
+        if len(run) >= BUILD_CHUNK_KEYS:
+            run.sort()
+            size += sum(map(sys.getsizeof, run))
+            runs.append(run)
+            run = []
+            await asyncio.sleep(0)
+    run.sort()
+    size += sum(map(sys.getsizeof, run))
+    runs.append(run)
+    return runs, size
+
+
+async def _merge_runs(runs: list[list[str]], exclude: set[str] | None = None) -> list[str]:
+    """
+    Сливает отсортированные куски в один список без ключей exclude, по BUILD_CHUNK_KEYS ключей
+    за шаг event loop.
+    """
+    merged = heapq.merge(*runs)
+    if exclude:
+        merged = filterfalse(exclude.__contains__, merged)
+    keys: list[str] = []
+    while True:
+        size = len(keys)
+        keys.extend(islice(merged, BUILD_CHUNK_KEYS))
+        if len(keys) - size < BUILD_CHUNK_KEYS:
+            return keys
+        await asyncio.sleep(0)
+
+
+class IndexSnapshot:
+    """
+    Готовое содержимое индекса: отсортированные ключи, названия товаров и размер ключей в байтах.
+    """
+
+    def __init__(self, keys: list[str], names: dict[int, str], keys_bytes: int, build_seconds: float = 0.0):
+        self.keys = keys
+        self.names = names
+        self.keys_bytes = keys_bytes
+        self.build_seconds = build_seconds
+
+    @classmethod
+    async def build(cls, products: Iterable[tuple[int, str]]) -> 'IndexSnapshot':
+        """
+        Строит снимок из пар (id, название) в event loop, но кусками: ключи собираются и сортируются
+        частями по BUILD_CHUNK_KEYS, а затем части сливаются по столько же ключей за шаг. Поток
+        (asyncio.to_thread) здесь не помогает: сборка и сортировка строк держат GIL, и loop всё
+        равно стоит. Сборка по частям дольше цельной сортировки, зато loop не занят дольше
+        одного куска.
+        """
+        started = time.perf_counter()
+        names: dict[int, str] = {}
+
+        def remember():
+            for product_id, name in products:
+                names[product_id] = name
+                yield product_id, name
+
+        runs, keys_bytes = await _sorted_runs(remember())
+        keys = await _merge_runs(runs)
+        return cls(keys, names, keys_bytes, time.perf_counter() - started)
+
+
+class PrefixIndex:
+    """
+    In-process индекс для подсказок по префиксу: отсортированный список строк и bisect.
+
+    Для каждого названия хранится по ключу на начало каждого слова, поэтому подсказка находит
+    товар по любому слову названия. К ключу приписан id товара, так что все ключи уникальны:
+    удаление находит свой ключ одним bisect, а поиск разбирает id только у найденных строк.
+    Поиск - O(log n + k), вставка и удаление - O(n) из-за сдвига списка, что для единичных
+    изменений несущественно; большие пакеты upsert_many сливает с индексом в фоне.
+
+    Перестройка (rebuild) и слияние пакета собирают новый список по частям, отдавая управление
+    event loop, и выполняются по очереди. Изменения, пришедшие за время сборки, записываются
+    в журнал (start_journal) и повторно применяются к новому списку в install.
+
+    Рассчитан на использование из одного event loop: кроме очереди сборок, блокировок нет.
+    """
+
+    def __init__(self):
+        self._keys: list[str] = []
+        self._names: dict[int, str] = {}
+        self._keys_bytes = 0
+        self._journals: list[list[tuple[int, str | None]]] = []
+        self._build_lock = asyncio.Lock()
+        # Фоновые слияния пакетов (ссылки держим, чтобы задачи не собрал GC)
+        self._merges: set[asyncio.Task] = set()
+        self.loaded = False
+        self.lookups = 0
+        self.updates = 0
+        self.rebuild_seconds = 0.0
+        self.rebuilt_at: float | None = None
+
+    def start_journal(self) -> list[tuple[int, str | None]]:
+        """
+        Начинает запоминать изменения, чтобы не потерять их при последующей сборке. Журналов
+        может быть несколько: каждое изменение записывается во все.
+        """
+        journal = []
+        self._journals.append(journal)
+        return journal
+
+    def stop_journal(self, journal: list[tuple[int, str | None]]) -> None:
+        self._journals = [active for active in self._journals if active is not journal]
+
+    def _record(self, product_id: int, name: str | None) -> None:
+        for journal in self._journals:
+            journal.append((product_id, name))
+
+    def install(self, snapshot: IndexSnapshot, journal: list[tuple[int, str | None]]) -> None:
+        """
+        Подменяет содержимое индекса готовым снимком и применяет изменения из журнала.
+        """
+        self.stop_journal(journal)
+        self._keys = snapshot.keys
+        self._names = snapshot.names
+        self._keys_bytes = snapshot.keys_bytes
+        self.loaded = True
+
+        for product_id, name in journal:
+            if name is None:
+                self.remove(product_id)
+            else:
+                self.upsert(product_id, name)
+
+    async def rebuild(self, load: Callable[[], Awaitable[Iterable[tuple[int, str]]]]) -> None:
+        """
+        Строит индекс заново из пар (id, название), которые возвращает load (например, запрос к базе).
+        Журнал начинается до загрузки, поэтому изменения, закоммиченные во время чтения, не теряются.
+        """
+        async with self._build_lock:
+            journal = self.start_journal()
+            try:
+                snapshot = await IndexSnapshot.build(await load())
+            except BaseException:
+                self.stop_journal(journal)
+                raise
+            self.install(snapshot, journal)
+        self.rebuild_seconds = snapshot.build_seconds
+        self.rebuilt_at = time.time()
+
+    async def wait_merges(self) -> None:
+        """
+        Дожидается фоновых слияний пакетов upsert_many.
+        """
+        while self._merges:
+            await asyncio.gather(*self._merges)
+
+    def upsert(self, product_id: int, name: str) -> None:
+        self._record(product_id, name)
+        if self._names.get(product_id) == name:
+            return
+        self._remove(product_id)
+        for key in _word_keys(product_id, name):
+            bisect.insort(self._keys, key)
+            self._keys_bytes += sys.getsizeof(key)
+        self._names[product_id] = name
+        self.updates += 1
+
+    def upsert_many(self, products: Iterable[tuple[int, str]]) -> None:
+        """
+        Пакетный upsert (массовое создание, переименование и импорт товаров). Небольшой пакет
+        вставляется сразу. Пакет от MERGE_THRESHOLD ключей сливается с индексом фоновой задачей
+        по частям: одно слияние проходит весь список, и целиком оно занимало бы event loop
+        на сотни миллисекунд. До окончания слияния подсказки показывают прежние названия.
+        Большой пакет требует запущенного event loop.
+        """
+        products = list(products)
+        changed = {product_id: name for product_id, name in products if self._names.get(product_id) != name}
+        # У каждого товара хотя бы один ключ, поэтому ключи считаются только у небольших пакетов
+        if (len(changed) < MERGE_THRESHOLD
+                and sum(len(_word_suffixes(name)) for name in changed.values()) < MERGE_THRESHOLD):
+            for product_id, name in products:
+                self.upsert(product_id, name)
+            return
+
+        # Журнал начинается сразу: изменения, пришедшие после пакета, применятся поверх него
+        journal = self.start_journal()
+        task = asyncio.get_running_loop().create_task(self._merge(products, journal))
+        self._merges.add(task)
+        task.add_done_callback(self._merges.discard)
+
+    async def _merge(self, products: list[tuple[int, str]], journal: list[tuple[int, str | None]]) -> None:
+        try:
+            async with self._build_lock:
+                # Копии текущего состояния: пока идёт слияние, индекс продолжает меняться (изменения в журнале)
+                names = self._names.copy()
+                keys = self._keys.copy()
+                keys_bytes = self._keys_bytes
+                changed = {product_id: name for product_id, name in products if names.get(product_id) != name}
+                stale_runs, stale_bytes = await _sorted_runs(
+                    (product_id, names[product_id]) for product_id in changed if product_id in names)
+                stale = set()
+                for run in stale_runs:
+                    stale.update(run)
+                new_runs, new_bytes = await _sorted_runs(changed.items())
+                names.update(changed)
+                keys = await _merge_runs([keys, *new_runs], stale)
+                snapshot = IndexSnapshot(keys, names, keys_bytes + new_bytes - stale_bytes)
+        except BaseException:
+            self.stop_journal(journal)
+            raise
+        self.install(snapshot, journal)
+        self.updates += len(changed)
+
+    def remove(self, product_id: int) -> None:
+        self._record(product_id, None)
+        if product_id in self._names:
+            self._remove(product_id)
+            self.updates += 1
+
+    def _remove(self, product_id: int) -> None:
+        name = self._names.pop(product_id, None)
+        if name is None:
+            return
+        for key in _word_keys(product_id, name):
+            i = bisect.bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                del self._keys[i]
+                self._keys_bytes -= sys.getsizeof(key)
+
+    def search(self, prefix: str, limit: int = 10) -> list[dict]:
+        """
+        Возвращает до limit товаров, в названии которых есть слово, начинающееся с prefix.
+        """
+        self.lookups += 1
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        key_prefix = prefix[:MAX_KEY_CHARS]
+        found: dict[int, str] = {}
+        i = bisect.bisect_left(self._keys, key_prefix)
+        while i < len(self._keys) and len(found) < limit and self._keys[i].startswith(key_prefix):
+            product_id = int(self._keys[i].rpartition(_ID_SEPARATOR)[2])
+            name = self._names[product_id]
+            if key_prefix == prefix or any(suffix.startswith(prefix) for suffix in _word_suffixes(name)):
+                found.setdefault(product_id, name)
+            i += 1
+        return [{'id': product_id, 'name': name} for product_id, name in found.items()]
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def stats(self) -> dict:
+        memory_bytes = (self._keys_bytes
+                        + sys.getsizeof(self._keys)
+                        + sys.getsizeof(self._names)
+                        + sum(sys.getsizeof(name) for name in self._names.values()))
+        return {
+            "loaded": self.loaded,
+            "products": len(self._names),
+            "entries": len(self._keys),
+            "memory_bytes": memory_bytes,
+            "rebuild_seconds": self.rebuild_seconds,
+            "rebuilt_at": self.rebuilt_at,
+            "lookups": self.lookups,
+            "updates": self.updates,
+            "pending_merges": len(self._merges),
+        }
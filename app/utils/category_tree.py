@@ -0,0 +1,117 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Iterable
+
+
+class CategoryTreeSnapshot:
+    """
+    Неизменяемый снимок дерева активных категорий.
+
+    Строится из строк (id, название, id родителя) и отвечает на вопросы о дереве без обращения
+    к базе: поддерево категории, группировка поддерева по прямым подкатегориям, вложенное дерево.
+    Результаты вычисляются при первом обращении и запоминаются, поэтому повторные запросы бесплатны.
+    """
+
+    def __init__(self, rows: Iterable[tuple[int, str, int | None]], version: int):
+        self.version = version
+        self.names: dict[int, str] = {}
+        self.children: dict[int, list[int]] = {}
+        self.roots: list[int] = []
+        for category_id, name, parent_id in rows:
+            self.names[category_id] = name
+            if parent_id is None:
+                self.roots.append(category_id)
+            else:
+                self.children.setdefault(parent_id, []).append(category_id)
+        self.roots.sort()
+        for children in self.children.values():
+            children.sort()
+        self._subtrees: dict[int, list[int]] = {}
+        self._nested: list[dict] | None = None
+
+    def __contains__(self, category_id: int) -> bool:
+        return category_id in self.names
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def subtree_ids(self, category_id: int) -> list[int]:
+        """
+        Возвращает id категории и всех её активных потомков.
+        Категории, которой нет в снимке, соответствует только она сама.
+        """
+        ids = self._subtrees.get(category_id)
+        if ids is None:
+            ids, stack = [], [category_id]
+            while stack:
+                current = stack.pop()
+                ids.append(current)
+                stack.extend(self.children.get(current, ()))
+            self._subtrees[category_id] = ids
+        return ids
+
+    def facet_groups(self, category_id: int) -> dict[int, int]:
+        """
+        Сопоставляет каждой категории поддерева ту прямую подкатегорию category_id, в которую она входит.
+        Сама категория относится к себе.
+        """
+        groups = {category_id: category_id}
+        for child_id in self.children.get(category_id, ()):
+            groups.update(dict.fromkeys(self.subtree_ids(child_id), child_id))
+        return groups
+
+    def as_nested(self) -> list[dict]:
+        """
+        Возвращает дерево в виде вложенных словарей {id, name, children}.
+        """
+        if self._nested is None:
+            def node(category_id: int) -> dict:
+                return {'id': category_id,
+                        'name': self.names[category_id],
+                        'children': [node(child_id) for child_id in self.children.get(category_id, ())]}
+
+            self._nested = [node(root_id) for root_id in self.roots]
+        return self._nested
+
+
+class CategoryTreeCache:
+    """
+    Кеш снимка дерева категорий, сверяемый с версией справочника категорий в базе.
+
+    Вызывающий передаёт текущую версию (счётчик в data_versions, который увеличивает каждое изменение
+    категорий в своей транзакции); снимок более ранней версии перестраивается. Так изменения любого
+    воркера видны со следующего запроса, без ожидания срока жизни. Версии только растут, поэтому
+    снимок более поздней версии, чем прочитал вызывающий, тоже годится.
+    Одновременные перестройки объединяются блокировкой.
+
+    Рассчитан на использование из одного event loop.
+    """
+
+    def __init__(self):
+        self.rebuilds = 0
+        self.rebuild_seconds = 0.0
+        self._snapshot: CategoryTreeSnapshot | None = None
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self, version: int) -> bool:
+        return self._snapshot is not None and self._snapshot.version >= version
+
+    async def get(self,
+                  version: int,
+                  load: Callable[[], Awaitable[Iterable[tuple[int, str, int | None]]]]) -> CategoryTreeSnapshot:
+        """
+        Возвращает снимок не старше version, при необходимости перестраивая его из строк, которые вернёт load.
+        version должна быть прочитана до load: изменение во время загрузки оставит снимок устаревшим
+        для следующей проверки, а не наоборот.
+        """
+        if self._is_fresh(version):
+            return self._snapshot
+        async with self._lock:
+            if self._is_fresh(version):
+                return self._snapshot
+            started = time.perf_counter()
+            snapshot = CategoryTreeSnapshot(await load(), version)
+            self.rebuild_seconds = time.perf_counter() - started
+            self.rebuilds += 1
+            self._snapshot = snapshot
+            return snapshot
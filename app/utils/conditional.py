@@ -0,0 +1,70 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import HTTPException, Request, Response, status
+
+
+def make_etag(*parts) -> str:
+    """
+    Строгий ETag из частей, однозначно определяющих тело ответа (сигнатура запроса и состояние данных).
+    """
+    digest = hashlib.blake2b(json.dumps(parts, default=str).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Время без часового пояса считаем UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def _http_date(value: datetime) -> str:
+    return format_datetime(_as_utc(value), usegmt=True)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # Для If-None-Match используется слабое сравнение: префикс W/ не учитывается
+    if if_none_match.strip() == '*':
+        return True
+    return any(candidate.strip().removeprefix('W/') == etag for candidate in if_none_match.split(','))
+
+
+def _not_modified_since(if_modified_since: str, last_modified: datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    # В заголовке время с точностью до секунды
+    return _as_utc(last_modified).replace(microsecond=0) <= _as_utc(since)
+
+
+def check_not_modified(request: Request,
+                       response: Response,
+                       etag: str,
+                       last_modified: datetime | None = None,
+                       use_if_modified_since: bool = True) -> None:
+    """
+    Проставляет ETag и Last-Modified в ответ, а если клиент прислал совпадающие валидаторы,
+    прерывает обработку ответом 304 без тела.
+
+    If-None-Match имеет приоритет: If-Modified-Since проверяется, только если его нет и use_if_modified_since.
+
+    :raises HTTPException: 304 Not Modified
+    """
+    headers = {'ETag': etag}
+    if last_modified is not None:
+        headers['Last-Modified'] = _http_date(last_modified)
+
+    if_none_match = request.headers.get('if-none-match')
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_none_match is not None:
+        not_modified = etag_matches(if_none_match, etag)
+    else:
+        not_modified = (use_if_modified_since
+                        and last_modified is not None
+                        and if_modified_since is not None
+                        and _not_modified_since(if_modified_since, last_modified))
+    if not_modified:
+        raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
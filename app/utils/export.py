@@ -0,0 +1,37 @@
+import csv
+import io
+from operator import attrgetter
+from typing import Iterable
+
+import orjson
+
+from app.utils.json_response import json_default
+
+
+def ndjson_lines(rows: Iterable, fields: tuple[str, ...]) -> bytes:
+    """
+    Кодирует строки выборки в NDJSON: по JSON-объекту с полями fields на строку.
+    """
+    get = attrgetter(*fields)
+    if len(fields) == 1:
+        objects = ({fields[0]: get(row)} for row in rows)
+    else:
+        objects = (dict(zip(fields, get(row))) for row in rows)
+    return b''.join(orjson.dumps(obj, default=json_default, option=orjson.OPT_APPEND_NEWLINE) for obj in objects)
+
+
+def csv_lines(rows: Iterable, fields: tuple[str, ...], header: bool = False) -> bytes:
+    """
+    Кодирует строки выборки в CSV (поля fields, при header - со строкой заголовка).
+    None выводится пустой ячейкой, Decimal - как есть ("10.00").
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if header:
+        writer.writerow(fields)
+    get = attrgetter(*fields)
+    if len(fields) == 1:
+        writer.writerows((get(row),) for row in rows)
+    else:
+        writer.writerows(map(get, rows))
+    return buffer.getvalue().encode()
@@ -0,0 +1,35 @@
+from decimal import Decimal
+from operator import attrgetter
+from typing import Any, Iterable
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+def json_default(value):
+    # Decimal отдаём строкой, как pydantic ("10.00"), чтобы формат ответа не зависел от способа сериализации
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f'Type is not JSON serializable: {type(value).__name__}')
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON-ответ, который кодируется orjson прямо из словарей и списков.
+
+    Обработчик, вернувший такой ответ, минует проверку и сериализацию по response_model,
+    поэтому содержимое должно уже иметь форму схемы ответа.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=json_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def rows_as_dicts(rows: Iterable, fields: tuple[str, ...]) -> list[dict]:
+    """
+    Превращает строки выборки (Row или объекты) в словари с полями fields.
+    """
+    get = attrgetter(*fields)
+    if len(fields) == 1:
+        return [{fields[0]: get(row)} for row in rows]
+    return [dict(zip(fields, get(row))) for row in rows]
@@ -0,0 +1,255 @@
+import asyncio
+import math
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Callable, Iterable
+
+from starlette.routing import BaseRoute, Match
+
+try:
+    # FastAPI 0.14x хранит подключённые роутеры вложенными, а не списком маршрутов с префиксами
+    from fastapi.routing import iter_route_contexts
+except ImportError:
+    iter_route_contexts = None
+
+# Границы гистограмм по умолчанию (секунды) - те же, что у клиентских библиотек Prometheus
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+# Методы, которые попадают в метки как есть; остальные считаются как other
+HTTP_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+# Метка маршрута запросов, не подошедших ни к одному маршруту
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple) -> str:
+    return ','.join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def lines(self) -> Iterable[str]:
+        for labels, value in self._values.items():
+            if labels:
+                yield f'{self.name}{{{_format_labels(self.labelnames, labels)}}} {_format_value(value)}'
+            else:
+                yield f'{self.name} {_format_value(value)}'
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {_escape(self.documentation)}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self.lines())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """
+    Монотонно растущий счётчик. Значения меток передаются кортежем в порядке labelnames.
+    """
+    kind = 'counter'
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set(self, labels: tuple, value: float) -> None:
+        # Для счётчиков, которые уже ведёт сам объект (кеши): значение снимается при выгрузке метрик
+        self._values[labels] = value
+
+
+class Gauge(_Metric):
+    """
+    Значение, которое может и расти, и уменьшаться.
+    """
+    kind = 'gauge'
+
+    def set(self, labels: tuple, value: float) -> None:
+        self._values[labels] = value
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels: tuple = (), amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+
+class Histogram(_Metric):
+    """
+    Гистограмма: число наблюдений по корзинам (le), их сумма и количество.
+
+    Наблюдение увеличивает одну корзину (поиск границы делением пополам), накопленные значения
+    le считаются только при выгрузке, поэтому запись дешёвая при любом числе корзин.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            # Счётчики корзин (последняя - выше всех границ, +Inf) и сумма наблюдений
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def lines(self) -> Iterable[str]:
+        bounds = (*(_format_value(bound) for bound in self.buckets), '+Inf')
+        for labels, (counts, total) in self._series.items():
+            # Метки серии форматируются один раз на все её строки
+            formatted = _format_labels(self.labelnames, labels)
+            bucket_prefix = f'{self.name}_bucket{{{formatted},le="' if formatted else f'{self.name}_bucket{{le="'
+            series_labels = f'{{{formatted}}}' if formatted else ''
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield f'{bucket_prefix}{bound}"}} {cumulative}'
+            yield f'{self.name}_sum{series_labels} {_format_value(total)}'
+            yield f'{self.name}_count{series_labels} {cumulative}'
+
+
+class Registry:
+    """
+    Набор метрик процесса и выгрузка в текстовом формате Prometheus (0.0.4).
+
+    Метрики, значения которых ведут другие объекты (пулы соединений, кеши), не обновляются
+    на каждом событии: их снимают сборщики - функции, вызываемые при каждой выгрузке.
+    """
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Callable[[], Iterable[_Metric]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[_Metric]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        metrics = [*self._metrics]
+        for collector in self._collectors:
+            metrics.extend(collector())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+# Метрики процесса: их пополняют модули, которым есть что считать
+registry = Registry()
+
+
+@lru_cache(maxsize=8)
+def _app_routes(app) -> tuple[BaseRoute, ...]:
+    routes = getattr(app, 'routes', ())
+    if iter_route_contexts is None:
+        return tuple(routes)
+    return tuple(context.route for context in iter_route_contexts(routes))
+
+
+def route_template(scope: dict) -> str:
+    """
+    Шаблон маршрута запроса (/products/{product_id}), а не сам путь: так число значений метки
+    ограничено числом маршрутов.
+
+    Маршрут, выбранный роутером, FastAPI кладёт в scope["route"]. Если до роутера запрос не дошёл
+    (ответ из кеша ответов) - маршрут ищется по списку маршрутов приложения, собранному при первом
+    таком запросе.
+    """
+    route = scope.get('route')
+    if route is not None:
+        return route.path
+    app = scope.get('app')
+    if app is None:
+        return UNMATCHED_ROUTE
+    for route in _app_routes(app):
+        match, _ = route.matches(scope)
+        if match is Match.FULL:
+            return route.path
+    return UNMATCHED_ROUTE
+
+
+http_requests_total = registry.counter('http_requests_total', 'HTTP requests', ('method', 'route', 'status'))
+http_request_duration_seconds = registry.histogram('http_request_duration_seconds', 'HTTP request latency',
+                                                   ('method', 'route', 'status'))
+http_requests_in_flight = registry.gauge('http_requests_in_flight', 'HTTP requests being processed')
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: число и длительность HTTP-запросов по методу, шаблону маршрута и статусу
+    и число выполняющихся запросов.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        # Запрос, упавший до начала ответа, ServerErrorMiddleware отдаст как 500
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - started
+            http_requests_in_flight.dec()
+            method = scope['method'] if scope['method'] in HTTP_METHODS else 'other'
+            labels = (method, route_template(scope), str(status_code))
+            http_requests_total.inc(labels)
+            http_request_duration_seconds.observe(duration, labels)
+
+
+async def monitor_event_loop_lag(histogram: Histogram, interval: float) -> None:
+    """
+    Каждые interval секунд измеряет, насколько позже срока event loop разбудил задачу:
+    задержка - это время, которое loop был занят чужим кодом (синхронные вызовы, тяжёлые обработчики).
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        histogram.observe(lag)
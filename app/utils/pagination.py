@@ -0,0 +1,113 @@
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, literal, or_, tuple_
+
+
+@dataclass(frozen=True)
+class Cursor:
+    """
+    Раскодированный курсор keyset-пагинации.
+
+    values - значения ключей сортировки граничной строки,
+    backward - True, если курсор ведёт на предыдущую страницу.
+    """
+    values: list
+    backward: bool = False
+
+
+def _sort_signature(sort_keys: list) -> str:
+    # Сигнатура сортировки, чтобы курсор нельзя было применить к другому порядку
+    return ','.join(f'{column.key}:{"desc" if descending else "asc"}' for column, descending in sort_keys)
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'Unsupported cursor value: {value!r}')
+
+
+def _python_value(column, raw):
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(raw)
+    return python_type(raw)
+
+
+def encode_cursor(row, sort_keys: list, backward: bool = False) -> str:
+    """
+    Кодирует значения ключей сортировки строки row в непрозрачный курсор.
+    """
+    payload = {
+        's': _sort_signature(sort_keys),
+        'v': [getattr(row, column.key) for column, _ in sort_keys],
+        'b': backward,
+    }
+    raw = json.dumps(payload, default=_json_default, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, sort_keys: list) -> Cursor:
+    """
+    Раскодирует курсор и проверяет, что он выдан для той же сортировки.
+
+    :raises HTTPException: Если курсор повреждён или не соответствует сортировке
+    """
+    invalid_cursor = HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if payload['s'] != _sort_signature(sort_keys) or len(payload['v']) != len(sort_keys):
+            raise invalid_cursor
+        values = [_python_value(column, value) for (column, _), value in zip(sort_keys, payload['v'])]
+        return Cursor(values=values, backward=bool(payload['b']))
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise invalid_cursor
+
+
+def keyset_order(sort_keys: list, backward: bool = False) -> list:
+    """
+    Возвращает ORDER BY для ключей сортировки; при backward направление инвертируется.
+    """
+    return [column.asc() if descending == backward else column.desc() for column, descending in sort_keys]
+
+
+def keyset_condition(sort_keys: list, values: list, backward: bool = False):
+    """
+    Строит условие "строго после граничной строки" для составного ключа сортировки.
+
+    Все ключи списков сортируются в одном направлении, поэтому условие - сравнение строк
+    (a, id) > (:a, :id) (< для убывания): по нему PostgreSQL начинает чтение индекса (a, id)
+    прямо с граничной строки, и дальние страницы стоят столько же, сколько первая.
+    Для ключей с разными направлениями сравнение строк неприменимо - условие раскрывается
+    в OR по префиксам: (a > :a) OR (a = :a AND b > :b) ...
+    """
+    directions = {descending for _, descending in sort_keys}
+    if len(directions) == 1:
+        row = tuple_(*(column for column, _ in sort_keys))
+        boundary = tuple_(*(literal(value, column.type) for (column, _), value in zip(sort_keys, values)))
+        return row > boundary if directions.pop() == backward else row < boundary
+
+    clauses = []
+    for i, (column, descending) in enumerate(sort_keys):
+        equal_prefix = [prev_column == prev_value for (prev_column, _), prev_value in zip(sort_keys[:i], values[:i])]
+        after = column > values[i] if descending == backward else column < values[i]
+        clauses.append(and_(*equal_prefix, after))
+    return or_(*clauses)
+
+
+def page_cursors(items: list, sort_keys: list, has_next: bool, has_prev: bool) -> dict:
+    """
+    Возвращает курсоры на соседние страницы для уже выбранной страницы items.
+    """
+    return {
+        'next_cursor': encode_cursor(items[-1], sort_keys) if items and has_next else None,
+        'prev_cursor': encode_cursor(items[0], sort_keys, backward=True) if items and has_prev else None,
+    }
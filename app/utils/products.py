@@ -0,0 +1,16 @@
+import re
+
+# Ограничение на число слов в поисковом запросе: каждое слово - отдельный просмотр GIN-индекса
+MAX_SEARCH_WORDS = 8
+
+
+def build_prefix_tsquery(text: str) -> str | None:
+    """
+    Превращает пользовательскую строку в запрос to_tsquery, где каждое слово ищется по префиксу:
+    "смарт самс" -> "смарт:* & самс:*".
+
+    Из строки берутся только буквы и цифры, поэтому операторы tsquery из ввода не попадают в запрос.
+    Возвращает None, если слов в строке нет.
+    """
+    words = re.findall(r'[^\W_]+', text)[:MAX_SEARCH_WORDS]
+    return ' & '.join(f'{word}:*' for word in words) or None
@@ -0,0 +1,219 @@
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from types import CodeType, FrameType
+from typing import Callable, Coroutine
+
+from app.utils.metrics import HTTP_METHODS, route_template
+
+logger = logging.getLogger(__name__)
+
+# Корень стеков, выполнявшихся в greenlet SQLAlchemy (синхронная часть ORM: сборка объектов,
+# flush): стек greenlet не связан с корутинами запроса, поэтому он начинается отдельно
+GREENLET_FRAME = '[greenlet]'
+
+PROFILE_SUFFIX = '.collapsed'
+_UNSAFE_FILENAME = re.compile(r'[^\w{}.-]+')
+
+
+class _Session:
+    """
+    Профилируемый запрос: корутина обработчика, поток её event loop и собранные стеки.
+    """
+    __slots__ = ('coroutine', 'root', 'thread_id', 'stacks')
+
+    def __init__(self, coroutine: Coroutine):
+        self.coroutine = coroutine
+        self.root = coroutine.cr_frame
+        self.thread_id = threading.get_ident()
+        self.stacks: Counter[str] = Counter()
+
+
+class SamplingProfiler:
+    """
+    Семплирующий профайлер запросов: фоновый поток каждые interval секунд снимает стек потока
+    event loop (sys._current_frames) и засчитывает его тем профилируемым запросам, корутина которых
+    в этот момент выполняется (cr_running). Так чужие запросы, идущие в том же loop, в профиль
+    не попадают, а синхронный код в greenlet SQLAlchemy - попадает: пока он работает, корутина,
+    ожидающая greenlet, считается выполняющейся.
+
+    Стеки копятся по маршрутам и пишутся в directory в свёрнутом формате (collapsed stacks:
+    "корень;...;вызванная функция число", как у flamegraph.pl и speedscope) - файл на маршрут
+    и процесс. Время ожидания ответа базы в профиль не попадает (loop в это время простаивает):
+    его показывает Server-Timing.
+
+    Поток запускается с первым профилируемым запросом и спит, пока таких запросов нет.
+    """
+
+    def __init__(self, directory: str, interval: float = 0.005):
+        self.directory = Path(directory)
+        self.interval = interval
+        self.profiled = 0
+        self._sessions: set[_Session] = set()
+        self._profiles: dict[str, Counter[str]] = {}
+        self._dirty: set[str] = set()
+        self._labels: dict[CodeType, str] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._closed = False
+
+    def start(self, coroutine: Coroutine) -> _Session:
+        session = _Session(coroutine)
+        with self._lock:
+            self._sessions.add(session)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+        self._wakeup.set()
+        return session
+
+    def finish(self, session: _Session, name: str) -> None:
+        """
+        Завершает профилирование запроса и добавляет его стеки к профилю name (метод и маршрут).
+        """
+        with self._lock:
+            self._sessions.discard(session)
+            if session.stacks:
+                self._profiles.setdefault(name, Counter()).update(session.stacks)
+                self._dirty.add(name)
+        self.profiled += 1
+        self._wakeup.set()
+
+    def close(self) -> None:
+        """
+        Останавливает поток, дописав накопленное в файлы.
+        """
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "profiled_requests": self.profiled,
+                "active": len(self._sessions),
+                "routes": {name: sum(stacks.values()) for name, stacks in self._profiles.items()},
+            }
+
+    def _run(self) -> None:
+        while not self._closed:
+            if not self._sessions:
+                self._flush()
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            for session in list(self._sessions):
+                self._sample(session, frames)
+            if self._dirty:
+                self._flush()
+        self._flush()
+
+    def _sample(self, session: _Session, frames: dict[int, FrameType]) -> None:
+        frame = frames.get(session.thread_id)
+        if frame is None or not session.coroutine.cr_running:
+            return
+        labels = []
+        while frame is not None and frame is not session.root:
+            labels.append(self._label(frame))
+            frame = frame.f_back
+        if frame is None:
+            labels.append(GREENLET_FRAME)
+        stack = ';'.join(reversed(labels))
+        # Между снятием стека и проверкой loop мог переключиться на другой запрос
+        if session.coroutine.cr_running:
+            with self._lock:
+                session.stacks[stack] += 1
+
+    def _label(self, frame: FrameType) -> str:
+        code = frame.f_code
+        label = self._labels.get(code)
+        if label is None:
+            module = frame.f_globals.get('__name__', '?')
+            name = getattr(code, 'co_qualname', code.co_name)
+            label = self._labels[code] = f'{module}:{name}'.replace(';', ',').replace(' ', '_')
+        return label
+
+    def _flush(self) -> None:
+        with self._lock:
+            dirty = {name: dict(self._profiles[name]) for name in self._dirty}
+            self._dirty.clear()
+        for name, stacks in dirty.items():
+            slug = _UNSAFE_FILENAME.sub('_', name).strip('_')
+            path = self.directory / f'{slug}.{os.getpid()}{PROFILE_SUFFIX}'
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                temporary = path.with_name(path.name + '.tmp')
+                temporary.write_text(''.join(f'{name};{stack} {count}\n' for stack, count in stacks.items()),
+                                     encoding='utf-8')
+                os.replace(temporary, path)
+            except OSError as e:
+                logger.warning(f"Profile {name} was not written to {path}: {e}")
+
+
+def load_profiles(directory: str) -> Counter[str]:
+    """
+    Читает и складывает свёрнутые стеки всех файлов профилей каталога (всех маршрутов и процессов).
+    """
+    stacks: Counter[str] = Counter()
+    for path in Path(directory).glob(f'*{PROFILE_SUFFIX}'):
+        for line in path.read_text(encoding='utf-8').splitlines():
+            stack, _, count = line.rpartition(' ')
+            if stack and count.isdigit():
+                stacks[stack] += int(count)
+    return stacks
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware: профилирует каждый sample_rate-й запрос (0 - никакой) и запросы с заголовком header,
+    если authorize(scope) их разрешает. Профиль запроса записывается под его методом и шаблоном маршрута.
+
+    Непрофилируемый запрос стоит счётчика и просмотра заголовков.
+    """
+
+    def __init__(self, app, profiler: SamplingProfiler, sample_rate: int = 0, header: str | None = None,
+                 authorize: Callable[[dict], bool] | None = None):
+        self.app = app
+        self.profiler = profiler
+        self.sample_rate = sample_rate
+        self.header = header.lower().encode('latin-1') if header else None
+        self.authorize = authorize
+        self._requests = 0
+
+    def _should_profile(self, scope) -> bool:
+        self._requests += 1
+        if self.sample_rate and self._requests % self.sample_rate == 0:
+            return True
+        if self.header is None:
+            return False
+        for name, _ in scope['headers']:
+            if name == self.header:
+                return self.authorize is None or self.authorize(scope)
+        return False
+
+    async def _call_app(self, scope, receive, send):
+        await self.app(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        # Своя корутина вокруг приложения: её cr_running показывает, что выполняется именно этот запрос,
+        # а её кадр - граница, ниже которой стек (event loop, внешние middleware) не нужен
+        coroutine = self._call_app(scope, receive, send)
+        session = self.profiler.start(coroutine)
+        try:
+            await coroutine
+        finally:
+            method = scope['method'] if scope['method'] in HTTP_METHODS else 'other'
+            self.profiler.finish(session, f"{method} {route_template(scope)}")
@@ -0,0 +1,143 @@
+import logging
+import re
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import lru_cache
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger('app.slow_queries')
+
+_FINGERPRINT_RULES = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),               # строковые литералы
+    (re.compile(r'\$\d+|%\(\w+\)s|(?<![:\w]):[A-Za-z_]\w*'), '?'),  # параметры asyncpg, psycopg, именованные
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),             # числа
+    # списки IN (?, ?, ...) любой длины, в том числе с приведением типа (?::INTEGER, ...)
+    (re.compile(r'\bIN\s*\(\s*\?(?:::\w+)?(?:\s*,\s*\?(?:::\w+)?)*\s*\)', re.IGNORECASE), 'IN (?+)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(statement: str) -> str:
+    """
+    Нормализованный текст запроса: литералы и параметры заменены на ?, списки значений свёрнуты,
+    пробелы схлопнуты. Запросы, различающиеся только значениями, получают один отпечаток.
+    """
+    for pattern, replacement in _FINGERPRINT_RULES:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+@dataclass
+class QueryStats:
+    """
+    Запросы к базе, выполненные в рамках одного HTTP-запроса.
+    """
+    count: int = 0
+    seconds: float = 0.0
+    slowest_seconds: float = 0.0
+    slowest_statement: str | None = None
+
+    def add(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.seconds += seconds
+        if seconds > self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement
+
+    def server_timing(self) -> str:
+        return (f'db;dur={self.seconds * 1000:.1f};desc="{self.count} queries", '
+                f'db-slowest;dur={self.slowest_seconds * 1000:.1f}')
+
+    def log_fields(self) -> dict:
+        return {
+            "db_queries": self.count,
+            "db_ms": round(self.seconds * 1000, 1),
+            "db_slowest_ms": round(self.slowest_seconds * 1000, 1),
+            "db_slowest": fingerprint(self.slowest_statement) if self.slowest_statement else None,
+        }
+
+
+# Статистика текущего HTTP-запроса; вне запросов (команды, фоновые задачи при старте) - None
+_current_stats: ContextVar[QueryStats | None] = ContextVar('query_stats', default=None)
+
+
+def instrument_engine(engine: AsyncEngine, slow_query_ms: float) -> None:
+    """
+    Подключает к движку учёт запросов: время каждого запроса добавляется к статистике текущего
+    HTTP-запроса, а запросы дольше slow_query_ms (0 - не писать) попадают в лог медленных запросов
+    с отпечатком вместо текста, так что значения параметров в лог не попадают.
+
+    События выполняются в том же контексте, что и вызвавшая запрос корутина (SQLAlchemy переносит
+    контекст в свой greenlet), поэтому статистика относится к правильному запросу.
+    """
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - context._query_started
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.add(statement, seconds)
+        if slow_query_ms and seconds * 1000 >= slow_query_ms:
+            sql = fingerprint(statement)
+            slow_query_logger.warning(f"Slow query {seconds * 1000:.1f}ms: {sql}",
+                                      extra={"db_ms": round(seconds * 1000, 1),
+                                             "fingerprint": sql,
+                                             "executemany": executemany})
+
+
+class QueryStatsMiddleware:
+    """
+    ASGI middleware: собирает запросы к базе каждого HTTP-запроса, отдаёт их в заголовке
+    Server-Timing (db - суммарное время и количество, db-slowest - самый долгий запрос)
+    и пишет по строке лога на запрос со структурированными полями (extra): маршрут, статус,
+    количество запросов, время в базе и отпечаток самого долгого запроса.
+
+    Заголовок отправляется вместе с началом ответа: запросы потокового ответа, выполненные
+    после этого, попадают только в лог.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        started = time.perf_counter()
+        status_code = None
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                total_ms = (time.perf_counter() - started) * 1000
+                timing = f'{stats.server_timing()}, app;dur={total_ms:.1f}'
+                message = {**message, 'headers': [*message.get('headers', []),
+                                                  (b'server-timing', timing.encode('latin-1'))]}
+            await send(message)
+
+        token = _current_stats.set(stats)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_stats.reset(token)
+            route = scope.get('route')
+            path = getattr(route, 'path', scope['path'])
+            total_ms = round((time.perf_counter() - started) * 1000, 1)
+            logger.info(f"{scope['method']} {path} {status_code} {total_ms}ms, "
+                        f"{stats.count} queries in {stats.seconds * 1000:.1f}ms",
+                        extra={"method": scope['method'],
+                               "route": path,
+                               "status": status_code,
+                               "duration_ms": total_ms,
+                               **stats.log_fields()})
@@ -0,0 +1,343 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterable
+from urllib.parse import parse_qsl, urlencode
+
+from app.utils.cache import TTLCache
+from app.utils.conditional import etag_matches
+
+logger = logging.getLogger(__name__)
+
+# Теги ответа текущего запроса: обработчик добавляет их через tag_response, middleware сохраняет ответ с ними
+_response_tags: ContextVar[list[str] | None] = ContextVar('response_cache_tags', default=None)
+# Заголовки, которые не должны попадать в кеш и отдаваться другим клиентам
+_UNCACHED_HEADERS = {b'set-cookie', b'date', b'server', b'x-cache'}
+
+
+def tag_response(*tags: str) -> None:
+    """
+    Помечает ответ текущего запроса тегами кеша: по ним ответ будет сброшен при изменении данных.
+    Ответ без тегов не кешируется, поэтому кешируются только обработчики, явно вызвавшие эту функцию.
+    """
+    tags_list = _response_tags.get()
+    if tags_list is not None:
+        tags_list.extend(tags)
+
+
+def cache_key(scope: dict) -> str:
+    """
+    Ключ кеша: путь и параметры запроса, отсортированные по имени, чтобы порядок параметров не плодил копии.
+    """
+    query = parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True)
+    return f"{scope['path']}?{urlencode(sorted(query))}"
+
+
+@dataclass
+class CachedResponse:
+    status: int
+    headers: list[tuple[bytes, bytes]]
+    body: bytes
+    tags: tuple[str, ...]
+    # Время начала запроса, породившего ответ (time.time())
+    created_at: float
+
+    def dumps(self) -> bytes:
+        meta = {'status': self.status,
+                'headers': [[name.decode('latin-1'), value.decode('latin-1')] for name, value in self.headers],
+                'tags': list(self.tags),
+                'created_at': self.created_at}
+        return json.dumps(meta).encode() + b'\n' + self.body
+
+    @classmethod
+    def loads(cls, data: bytes) -> 'CachedResponse':
+        meta, _, body = data.partition(b'\n')
+        meta = json.loads(meta)
+        return cls(status=meta['status'],
+                   headers=[(name.encode('latin-1'), value.encode('latin-1')) for name, value in meta['headers']],
+                   body=body,
+                   tags=tuple(meta['tags']),
+                   created_at=meta['created_at'])
+
+
+class MemoryBackend:
+    """
+    In-process LRU с временем жизни записей и индексом тег -> ключи для точечного сброса.
+
+    Рассчитан на использование из одного event loop, поэтому обходится без блокировок.
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._data: OrderedDict[str, tuple[float, CachedResponse]] = OrderedDict()
+        self._keys_by_tag: dict[str, set[str]] = {}
+        self.evictions = 0
+
+    async def get(self, key: str) -> CachedResponse | None:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[0] < time.monotonic():
+            self._delete(key)
+            return None
+        self._data.move_to_end(key)
+        return item[1]
+
+    async def set(self, key: str, response: CachedResponse, ttl: float) -> None:
+        self._delete(key)
+        self._data[key] = (time.monotonic() + ttl, response)
+        for tag in response.tags:
+            self._keys_by_tag.setdefault(tag, set()).add(key)
+        while len(self._data) > self.maxsize:
+            self._delete(next(iter(self._data)))
+            self.evictions += 1
+
+    async def invalidate(self, tags: Iterable[str]) -> None:
+        for tag in tags:
+            for key in list(self._keys_by_tag.get(tag, ())):
+                self._delete(key)
+
+    def _delete(self, key: str) -> None:
+        item = self._data.pop(key, None)
+        if item is None:
+            return
+        for tag in item[1].tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    async def stats(self) -> dict:
+        return {"backend": "memory", "size": len(self._data), "maxsize": self.maxsize, "evictions": self.evictions}
+
+    async def close(self) -> None:
+        self._data.clear()
+        self._keys_by_tag.clear()
+
+
+class RedisBackend:
+    """
+    Общий для всех воркеров кеш в Redis: ответ хранится строкой с TTL, а ключи ответов с тегом - в множестве тега.
+    Требует пакет redis (pip install redis).
+    """
+
+    def __init__(self, url: str, prefix: str = 'response-cache:'):
+        try:
+            from redis import asyncio as redis
+        except ImportError as e:
+            raise RuntimeError('Redis response cache backend requires the "redis" package') from e
+        self._redis = redis.from_url(url)
+        self._prefix = prefix
+
+    def _tag_key(self, tag: str) -> str:
+        return f'{self._prefix}tag:{tag}'
+
+    async def get(self, key: str) -> CachedResponse | None:
+        data = await self._redis.get(self._prefix + key)
+        return CachedResponse.loads(data) if data is not None else None
+
+    async def set(self, key: str, response: CachedResponse, ttl: float) -> None:
+        ttl_ms = int(ttl * 1000)
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.set(self._prefix + key, response.dumps(), px=ttl_ms)
+            # Множество тега живёт не меньше самого свежего ответа в нём
+            for tag in response.tags:
+                pipe.sadd(self._tag_key(tag), self._prefix + key)
+                pipe.pexpire(self._tag_key(tag), ttl_ms)
+            await pipe.execute()
+
+    async def invalidate(self, tags: Iterable[str]) -> None:
+        tag_keys = [self._tag_key(tag) for tag in tags]
+        if not tag_keys:
+            return
+        # Состав множеств читается и множества удаляются атомарно: ответ, сохранённый после этого,
+        # попадёт уже в новое множество тега
+        async with self._redis.pipeline(transaction=True) as pipe:
+            for tag_key in tag_keys:
+                pipe.smembers(tag_key)
+            pipe.delete(*tag_keys)
+            *members, _ = await pipe.execute()
+        keys = set().union(*members)
+        if keys:
+            await self._redis.delete(*keys)
+
+    async def stats(self) -> dict:
+        info = await self._redis.info('stats')
+        return {"backend": "redis", "evictions": info.get('evicted_keys')}
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+class ResponseCache:
+    """
+    Кеш готовых HTTP-ответов поверх подключаемого хранилища (MemoryBackend или RedisBackend).
+
+    Сброс по тегам сразу отмечается локально (время сброса тега), поэтому в этом воркере ответ,
+    построенный до сброса, больше не отдаётся и не сохраняется, даже если запрос к хранилищу
+    ещё не выполнен. Ошибки хранилища не ломают запросы: кеш просто пропускается.
+
+    hold_off - отставание реплик: ответ не сохраняется, если его тег сброшен позже, чем за hold_off
+    секунд до начала запроса. Такой ответ мог быть прочитан с реплики, ещё не получившей изменение,
+    и иначе пролежал бы в кеше весь ttl.
+    """
+
+    def __init__(self, backend: MemoryBackend | RedisBackend, ttl: float = 30.0, hold_off: float = 0.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.hold_off = hold_off
+        self._invalidated_at = TTLCache(maxsize=100000, ttl=max(ttl, hold_off))
+        self._tasks: set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def _is_stale(self, response: CachedResponse, hold_off: float = 0.0) -> bool:
+        return any(self._invalidated_at.get(tag, 0.0) >= response.created_at - hold_off for tag in response.tags)
+
+    async def get(self, key: str) -> CachedResponse | None:
+        try:
+            response = await self.backend.get(key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Response cache lookup failed: {e}")
+            response = None
+        if response is None or self._is_stale(response):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return response
+
+    async def set(self, key: str, response: CachedResponse) -> None:
+        # Теги сброшены, пока выполнялся запрос или незадолго до него: ответ мог быть построен
+        # по старым данным (в том числе с отстающей реплики)
+        if self._is_stale(response, self.hold_off):
+            return
+        try:
+            await self.backend.set(key, response, self.ttl)
+            self.stores += 1
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Response cache store failed: {e}")
+
+    def invalidate(self, tags: Iterable[str]) -> None:
+        """
+        Сбрасывает ответы с любым из тегов. Вызывается синхронно (например, из on_commit),
+        обращение к хранилищу выполняется в фоновой задаче.
+        """
+        tags = tuple(tags)
+        now = time.time()
+        for tag in tags:
+            self._invalidated_at.set(tag, now)
+        self.invalidations += 1
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(self._invalidate_backend(tags))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _invalidate_backend(self, tags: tuple[str, ...]) -> None:
+        try:
+            await self.backend.invalidate(tags)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Response cache invalidation failed: {e}")
+
+    async def stats(self) -> dict:
+        try:
+            backend_stats = await self.backend.stats()
+        except Exception as e:
+            backend_stats = {"backend_error": str(e)}
+        lookups = self.hits + self.misses
+        return {
+            **backend_stats,
+            "ttl": self.ttl,
+            "hold_off": self.hold_off,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+        }
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+class ResponseCacheMiddleware:
+    """
+    ASGI middleware: отдаёт GET-ответы подходящих путей из кеша, а ответы 200, помеченные
+    обработчиком через tag_response, сохраняет. Заголовок X-Cache: HIT или MISS.
+    Если ETag ответа из кеша совпадает с If-None-Match, клиент сразу получает 304.
+    Запрос с Cache-Control: no-cache идёт мимо кеша, но его ответ кеш обновляет.
+    """
+
+    def __init__(self, app, cache: ResponseCache, paths: Iterable[str]):
+        self.app = app
+        self.cache = cache
+        self.paths = re.compile('|'.join(f'(?:{path})' for path in paths))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] != 'GET' or not self.paths.fullmatch(scope['path']):
+            await self.app(scope, receive, send)
+            return
+
+        key = cache_key(scope)
+        request_headers = dict(scope['headers'])
+        cached = None if b'no-cache' in request_headers.get(b'cache-control', b'') else await self.cache.get(key)
+        if cached is not None:
+            validators = [(name, value) for name, value in cached.headers if name in (b'etag', b'last-modified')]
+            etag = dict(validators).get(b'etag')
+            if_none_match = request_headers.get(b'if-none-match')
+            if etag is not None and if_none_match is not None \
+                    and etag_matches(if_none_match.decode('latin-1'), etag.decode('latin-1')):
+                await send({'type': 'http.response.start',
+                            'status': 304,
+                            'headers': [*validators, (b'x-cache', b'HIT')]})
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+            await send({'type': 'http.response.start',
+                        'status': cached.status,
+                        'headers': [*cached.headers, (b'x-cache', b'HIT')]})
+            await send({'type': 'http.response.body', 'body': cached.body})
+            return
+
+        started = time.time()
+        tags: list[str] = []
+        start_message = None
+        body: list[bytes] = []
+
+        async def send_and_capture(message):
+            nonlocal start_message
+            if message['type'] == 'http.response.start':
+                start_message = message
+                message = {**message, 'headers': [*message.get('headers', []), (b'x-cache', b'MISS')]}
+            elif message['type'] == 'http.response.body':
+                body.append(message.get('body', b''))
+            await send(message)
+
+        token = _response_tags.set(tags)
+        try:
+            await self.app(scope, receive, send_and_capture)
+        finally:
+            _response_tags.reset(token)
+
+        if start_message is not None and start_message['status'] == 200 and tags:
+            headers = [(name, value) for name, value in start_message.get('headers', [])
+                       if name.lower() not in _UNCACHED_HEADERS]
+            await self.cache.set(key, CachedResponse(status=200,
+                                                     headers=headers,
+                                                     body=b''.join(body),
+                                                     tags=tuple(dict.fromkeys(tags)),
+                                                     created_at=started))
@@ -0,0 +1,104 @@
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Hashable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Все группы процесса по именам - для статистики
+_groups: dict[str, 'SingleFlight'] = {}
+
+
+class _LeaderFailed(Exception):
+    """
+    Общий вызов не дал результата (отменён или завершился ошибкой): ожидающие повторяют вызов сами.
+    """
+
+
+class SingleFlight:
+    """
+    Объединение одновременных одинаковых вызовов (single-flight): пока вызов с ключом выполняется,
+    остальные вызовы с тем же ключом не запускают свой, а ждут и получают его результат.
+
+    Делится только результат: он должен быть неизменяемыми данными (строка Core, число, дата).
+    Исключение общего вызова получает только выполнявший запрос - объект исключения с его
+    traceback не разделяется между запросами. Если выполняющий запрос отменён или упал,
+    ожидающие повторяют вызов (один из них становится выполняющим).
+    Отмена ожидающего не затрагивает общий вызов.
+
+    Рассчитан на использование из одного event loop, поэтому обходится без блокировок.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.coalesced = 0
+        _groups[name] = self
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        while (future := self._calls.get(key)) is not None:
+            try:
+                result = await asyncio.shield(future)
+            except _LeaderFailed:
+                continue
+            self.coalesced += 1
+            return result
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        self.calls += 1
+        try:
+            result = await call()
+        except BaseException:
+            self._set_exception(future, _LeaderFailed())
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+    @staticmethod
+    def _set_exception(future: asyncio.Future, exc: BaseException) -> None:
+        future.set_exception(exc)
+        # Ожидающих может не быть: помечаем исключение полученным, чтобы asyncio не писал о нём в лог
+        future.exception()
+
+    def stats(self) -> dict:
+        requests = self.calls + self.coalesced
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._calls),
+            "coalesced_ratio": self.coalesced / requests if requests else 0.0,
+        }
+
+
+def single_flight(method: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """
+    Декоратор метода репозитория для чтения: одновременные вызовы с одинаковыми аргументами
+    выполняют один запрос к базе и делят его результат.
+
+    Ключ - аргументы вызова без self, а вместо сессии (каждый запрос приходит со своей) - база,
+    к которой она сейчас обращается: запрос, читающий с основной базы, не получит результат,
+    прочитанный с отстающей реплики. Аргументы должны быть хешируемыми. Результат общий для всех
+    ожидавших, поэтому метод должен возвращать неизменяемые данные, а не ORM-объекты сессии
+    выполнившего запроса.
+    """
+    flights = SingleFlight(method.__qualname__)
+
+    def key_part(value):
+        return ('bind', value.get_bind()) if isinstance(value, AsyncSession) else value
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        key = (tuple(key_part(arg) for arg in args),
+               tuple(sorted((name, key_part(value)) for name, value in kwargs.items())))
+        return await flights.do(key, lambda: method(self, *args, **kwargs))
+
+    wrapper.single_flight = flights
+    return wrapper
+
+
+def single_flight_stats() -> dict[str, dict]:
+    return {name: group.stats() for name, group in _groups.items()}
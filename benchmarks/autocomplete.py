@@ -0,0 +1,83 @@
+"""
+Микробенчмарк индекса подсказок PrefixIndex: перестройка (и насколько она задерживает event loop),
+память, поиск и точечные обновления.
+
+Названия товаров генерируются из словаря, поэтому бенчмарку не нужна база.
+
+    python -m benchmarks.autocomplete --products 1000000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from app.utils.autocomplete import PrefixIndex
+
+WORDS = ("смартфон ноутбук планшет телевизор наушники колонка часы камера принтер монитор "
+         "клавиатура мышь роутер холодильник пылесос чайник кофемашина утюг фен блендер "
+         "samsung apple xiaomi huawei sony lg philips bosch lenovo asus acer dell hp canon "
+         "pro max mini lite plus ultra air neo black white silver gold 64gb 128gb 256gb 512gb").split()
+
+
+def product_names(count: int, rng: random.Random):
+    for product_id in range(1, count + 1):
+        yield product_id, ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 8)))
+
+
+async def measure_loop_lag(lags: list[float], interval: float = 0.001) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - started - interval)
+
+
+async def run(products: int, lookups: int, limit: int, seed: int) -> None:
+    rng = random.Random(seed)
+    index = PrefixIndex()
+    names = list(product_names(products, rng))
+
+    async def load():
+        return names
+
+    lags = []
+    monitor = asyncio.create_task(measure_loop_lag(lags))
+    await asyncio.sleep(0)
+    await index.rebuild(load)
+    monitor.cancel()
+    stats = index.stats()
+    lags.sort()
+    print(f"rebuild: {products} products, {stats['entries']} entries in {stats['rebuild_seconds']:.2f}s, "
+          f"memory ~{stats['memory_bytes'] / 2 ** 20:.1f} MiB")
+    print(f"event loop lag during rebuild: max {lags[-1] * 1e3:.1f} ms, "
+          f"p99 {lags[int(len(lags) * 0.99)] * 1e3:.1f} ms")
+
+    for prefix_length in (1, 2, 3, 5):
+        prefixes = [rng.choice(WORDS)[:prefix_length] for _ in range(lookups)]
+        started = time.perf_counter()
+        for prefix in prefixes:
+            index.search(prefix, limit)
+        elapsed = time.perf_counter() - started
+        print(f"search prefix len={prefix_length}: {lookups / elapsed:12,.0f} lookups/s "
+              f"({elapsed / lookups * 1e6:.1f} us per lookup, limit={limit})")
+
+    updates = min(lookups, 10000)
+    started = time.perf_counter()
+    for i in range(updates):
+        product_id = rng.randint(1, products)
+        if i % 2:
+            index.remove(product_id)
+        else:
+            index.upsert(product_id, ' '.join(rng.choice(WORDS) for _ in range(3)))
+    elapsed = time.perf_counter() - started
+    print(f"upsert/remove: {updates / elapsed:12,.0f} updates/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=100000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    asyncio.run(run(args.products, args.lookups, args.limit, args.seed))
@@ -0,0 +1,89 @@
+"""
+Пропускная способность создания товаров: по одному (как POST /products/) и пакетом (как POST /products/bulk).
+
+По одному - на каждый товар проверка категории, INSERT ... RETURNING и коммит.
+Пакетом - одна проверка всех категорий запросом с IN, многострочные INSERT ... RETURNING
+по settings.bulk_chunk_size строк и один коммит.
+
+Работает с базой из настроек (DATABASE_URL): нужны хотя бы один продавец и одна активная категория.
+Созданные товары удаляются в конце.
+
+    python -m benchmarks.bulk_products --items 5000
+"""
+import argparse
+import asyncio
+import sys
+import time
+from decimal import Decimal
+
+from sqlalchemy import delete, select
+
+from app.database import async_engine, async_session_maker
+from app.models import CategoryModel, ProductModel, User
+from app.repositories.products import ProductRepository
+from app.schemas import ProductCreate
+from app.services.enum import UserRoles
+
+
+def make_products(count: int, category_id: int, label: str) -> list[ProductCreate]:
+    return [ProductCreate(name=f"bench {label} {i}", description="benchmark product", price=Decimal(100 + i % 900),
+                          stock=i % 50, category_id=category_id)
+            for i in range(count)]
+
+
+async def create_one_by_one(repo: ProductRepository, seller: User, products: list[ProductCreate]) -> list[int]:
+    product_ids = []
+    for product in products:
+        async with async_session_maker() as db:
+            db_product = await repo.create_product(db, product, seller)
+            await db.commit()
+            product_ids.append(db_product.id)
+    return product_ids
+
+
+async def create_bulk(repo: ProductRepository, seller: User, products: list[ProductCreate]) -> list[int]:
+    async with async_session_maker() as db:
+        active = await repo.get_active_category_ids(db, {product.category_id for product in products})
+        product_ids = await repo.bulk_create_products(db, [product for product in products
+                                                           if product.category_id in active], seller)
+        await db.commit()
+    return product_ids
+
+
+async def run(items: int) -> None:
+    repo = ProductRepository()
+    async with async_session_maker() as db:
+        seller = (await db.scalars(select(User).where(User.role == UserRoles.SELLER).limit(1))).first()
+        category_id = (await db.scalars(select(CategoryModel.id)
+                                        .where(CategoryModel.is_active.is_(True)).limit(1))).first()
+    if seller is None or category_id is None:
+        sys.exit("The database must contain at least one seller and one active category")
+
+    created = []
+    try:
+        for label, create in (("one by one", create_one_by_one), ("bulk", create_bulk)):
+            products = make_products(items, category_id, label)
+            started = time.perf_counter()
+            product_ids = await create(repo, seller, products)
+            elapsed = time.perf_counter() - started
+            created.extend(product_ids)
+            print(f"{label:10} {len(product_ids):6d} products in {elapsed:7.2f}s  "
+                  f"{len(product_ids) / elapsed:9.0f} products/s")
+    finally:
+        async with async_session_maker() as db:
+            await db.execute(delete(ProductModel).where(ProductModel.id.in_(created)))
+            await db.commit()
+
+
+async def main(items: int) -> None:
+    try:
+        await run(items)
+    finally:
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main(args.items))
@@ -0,0 +1,94 @@
+"""
+Задержка несвязанных GET-запросов во время шторма логинов.
+
+Запускает приложение в том же процессе (httpx.ASGITransport) и сравнивает два варианта
+проверки пароля: синхронный verify_password прямо в обработчике (как было раньше)
+и verify_password_async через пул потоков password_executor.
+
+    python -m benchmarks.login_storm --logins 200 --concurrency 50
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from app.auth import hash_password, verify_password, verify_password_async
+
+PASSWORD = "benchmark-password"
+PROBE_INTERVAL = 0.01
+HASHED = hash_password(PASSWORD)
+
+bench_app = FastAPI()
+
+
+@bench_app.get("/ping")
+async def ping():
+    return {"ok": True}
+
+
+@bench_app.post("/login-sync")
+async def login_sync():
+    return {"ok": verify_password(PASSWORD, HASHED)}
+
+
+@bench_app.post("/login-async")
+async def login_async():
+    return {"ok": await verify_password_async(PASSWORD, HASHED)}
+
+
+def percentile(values: list[float], q: float) -> float:
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+async def run_storm(client: httpx.AsyncClient, login_path: str, logins: int, concurrency: int) -> list[float]:
+    done = asyncio.Event()
+    finished = [float("inf")]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def login():
+        async with semaphore:
+            await client.post(login_path)
+
+    async def probe():
+        # Открытая модель нагрузки: запрос "должен" уходить каждые PROBE_INTERVAL секунд, а задержка
+        # считается от запланированного момента. Иначе время, пока event loop был заблокирован,
+        # пряталось бы в asyncio.sleep и не попадало в замеры (coordinated omission)
+        scheduled = time.perf_counter()
+        while not done.is_set() or scheduled <= finished[0]:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await client.get("/ping")
+            latencies.append((time.perf_counter() - scheduled) * 1000)
+            scheduled += PROBE_INTERVAL
+
+    probe_task = asyncio.create_task(probe())
+    await asyncio.gather(*(login() for _ in range(logins)))
+    finished[0] = time.perf_counter()
+    done.set()
+    await probe_task
+    return latencies
+
+
+async def main(logins: int, concurrency: int) -> None:
+    transport = httpx.ASGITransport(app=bench_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for label, path in (("before (sync bcrypt)", "/login-sync"), ("after (thread pool)", "/login-async")):
+            started = time.perf_counter()
+            latencies = await run_storm(client, path, logins, concurrency)
+            elapsed = time.perf_counter() - started
+            print(f"{label:22} logins/s={logins / elapsed:7.1f}  GET /ping: n={len(latencies):4d} "
+                  f"p50={percentile(latencies, 50):7.2f}ms p99={percentile(latencies, 99):7.2f}ms "
+                  f"max={max(latencies):7.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.concurrency))
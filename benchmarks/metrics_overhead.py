@@ -0,0 +1,92 @@
+"""
+Накладные расходы метрик на горячем пути: сколько добавляет MetricsMiddleware к запросу
+и сколько стоят отдельные операции (наблюдение гистограммы, поиск шаблона маршрута для ответа
+из кеша, выгрузка /metrics).
+
+База не нужна: запросы идут прямо в ASGI-приложение с одним простым маршрутом, без HTTP-клиента.
+
+    python -m benchmarks.metrics_overhead --requests 20000 --rounds 5
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI
+
+from app.utils.metrics import MetricsMiddleware, Registry, route_template
+
+
+def make_app(with_metrics: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        return {"id": item_id}
+
+    if with_metrics:
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+
+def http_scope(app: FastAPI, path: str) -> dict:
+    return {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': b'', 'headers': [],
+            'server': ('test', 80), 'client': ('test', 1234), 'app': app}
+
+
+async def measure_requests(app: FastAPI, requests: int) -> float:
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        pass
+
+    started = time.perf_counter()
+    for i in range(requests):
+        await app(http_scope(app, f'/items/{i % 1000}'), receive, send)
+    return (time.perf_counter() - started) / requests
+
+
+def measure(function, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat
+
+
+async def run(requests: int, rounds: int) -> None:
+    without_metrics, with_metrics = make_app(False), make_app(True)
+    # Прогрев: сборка middleware, кеши валидации FastAPI
+    await measure_requests(without_metrics, 1000)
+    await measure_requests(with_metrics, 1000)
+    # Прогоны чередуются, чтобы шум (частота процессора, сборщик мусора) одинаково задевал оба варианта
+    base, metered = float('inf'), float('inf')
+    for _ in range(rounds):
+        base = min(base, await measure_requests(without_metrics, requests))
+        metered = min(metered, await measure_requests(with_metrics, requests))
+    print(f"request without metrics  {base * 1e6:8.1f} us")
+    print(f"request with metrics     {metered * 1e6:8.1f} us  (+{(metered - base) * 1e6:.1f} us, "
+          f"{(metered - base) / base:+.1%})")
+
+    registry = Registry()
+    histogram = registry.histogram('bench_seconds', 'Benchmark', ('method', 'route', 'status'))
+    labels = ('GET', '/items/{item_id}', '200')
+    print(f"histogram observe        {measure(lambda: histogram.observe(0.0123, labels), 200000) * 1e6:8.2f} us")
+
+    # Шаблон маршрута для запроса, не прошедшего через роутер (ответ из кеша ответов)
+    scope = http_scope(with_metrics, '/items/42')
+    print(f"route lookup (cache hit) {measure(lambda: route_template(scope), 50000) * 1e6:8.2f} us")
+
+    # Выгрузка: 40 маршрутов x 4 статуса
+    for route in range(40):
+        for status in ('200', '304', '404', '500'):
+            histogram.observe(0.01, ('GET', f'/route/{route}', status))
+    print(f"render 160 series        {measure(registry.render, 200) * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000, help="Запросов в одном прогоне")
+    parser.add_argument("--rounds", type=int, default=5, help="Прогонов каждого варианта, берётся лучший")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.rounds))
@@ -0,0 +1,75 @@
+"""
+Микробенчмарк сериализации страницы списка товаров: прежний путь (ORM-объекты -> ProductOut ->
+ProductList -> повторная проверка по response_model -> JSONResponse) против нового (строки выборки ->
+словари -> orjson, app.services.products.product_list_response).
+
+База не нужна: ORM-объекты и строки создаются в памяти.
+
+    python -m benchmarks.serialization --items 100
+"""
+import argparse
+import random
+import time
+from collections import namedtuple
+from decimal import Decimal
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+from app.models import ProductModel
+from app.schemas import ProductList, ProductOut, TotalCountEnum
+from app.services.products import PRODUCT_OUT_FIELDS, product_list_response
+
+ProductRow = namedtuple('ProductRow', PRODUCT_OUT_FIELDS)
+
+
+def page_data(items: list) -> dict:
+    return {'items': items, 'total': 100000, 'total_kind': TotalCountEnum.exact, 'has_more': True,
+            'page': 1, 'page_size': len(items), 'next_cursor': 'eyJzIjoiaWQ6YXNjIiwidiI6WzEwMF0sImIiOmZhbHNlfQ'}
+
+
+def old_path(products: list) -> bytes:
+    data = page_data([ProductOut.model_validate(product) for product in products])
+    product_list = ProductList(**data)
+    # Так FastAPI обрабатывает возвращённую модель: выгрузка, проверка по response_model, JSON
+    content = ProductList.model_validate(product_list.model_dump()).model_dump(mode='json')
+    return JSONResponse(content).body
+
+
+def new_path(rows: list) -> bytes:
+    return product_list_response(page_data(list(rows)), Response()).body
+
+
+def measure(function, argument, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function(argument)
+    return (time.perf_counter() - started) / repeat
+
+
+def run(items: int, repeat: int, seed: int) -> None:
+    rng = random.Random(seed)
+    values = [dict(id=i, name=f'Товар {i}', description='Описание товара ' * rng.randint(0, 5) or None,
+                   price=Decimal(rng.randint(100, 100000)) / 100, image_url=None, stock=rng.randint(0, 50),
+                   is_active=True, rating=rng.random() * 5)
+              for i in range(1, items + 1)]
+    products = [ProductModel(**value) for value in values]
+    rows = [ProductRow(**value) for value in values]
+
+    # Оба пути должны давать один и тот же JSON
+    assert old_path(products).replace(b' ', b'') == new_path(rows).replace(b' ', b''), 'responses differ'
+
+    old = measure(old_path, products, repeat)
+    new = measure(new_path, rows, repeat)
+    print(f"{items} items, average of {repeat} runs")
+    print(f"model_validate + response_model + json: {old * 1e3:8.3f} ms")
+    print(f"rows + orjson:                          {new * 1e3:8.3f} ms  ({old / new:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    run(args.items, args.repeat, args.seed)